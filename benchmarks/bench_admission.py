@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Burst of concurrent ACS requests, with and without admission control.
+
+Threads post signed responses to the ACS at once, with the test client. The
+ACS handler holds a connection of a simulated database pool for a while, like
+a registration, and fails with a 500 when none is free within a timeout.
+Without ``SSO_SAML_ACS_CONCURRENCY`` the burst exhausts the pool; with it, the
+requests over the limit wait in the queue, and the ones the queue cannot take
+are answered right away with a 503.
+
+Also measures the overhead of the rate limiting on ``/sso``.
+
+Run with ``python benchmarks/bench_admission.py``.
+"""
+
+import base64
+import logging
+import threading
+import time
+
+from bench_endpoints import ATTRIBUTES, BASE_URL, create_app, read
+from helpers import measure_latencies, report_latencies
+
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_response
+
+THREADS = 32
+
+REQUESTS = 8
+
+POOL_SIZE = 8
+
+POOL_TIMEOUT = 0.05
+
+HANDLER_TIME = 0.02
+
+
+def bench_burst(concurrency):
+    """Post a burst of responses to the ACS."""
+    app = create_app(False)
+    # The failed requests are counted, not logged
+    app.logger.setLevel(logging.CRITICAL)
+    app.config.update(
+        SSO_SAML_ACS_CONCURRENCY=concurrency,
+        SSO_SAML_ACS_QUEUE_SIZE=THREADS,
+        SSO_SAML_ACS_QUEUE_TIMEOUT=2,
+    )
+    pool = threading.BoundedSemaphore(POOL_SIZE)
+
+    def acs_handler(auth, next_url):
+        if not pool.acquire(timeout=POOL_TIMEOUT):
+            raise RuntimeError("database pool exhausted")
+        try:
+            time.sleep(HANDLER_TIME)
+        finally:
+            pool.release()
+        return next_url
+
+    app.config["SSO_SAML_IDPS"]["bench"]["acs_handler"] = acs_handler
+    with app.test_request_context(base_url=BASE_URL):
+        settings = current_sso_saml.get_runtime("bench").settings
+    idp_key, idp_cert = read("idp.key"), read("idp.crt")
+    responses = [
+        [
+            base64.b64encode(
+                build_response(
+                    settings, idp_key, idp_cert, "federico@example.com", ATTRIBUTES
+                )
+            )
+            for _ in range(REQUESTS)
+        ]
+        for _ in range(THREADS)
+    ]
+
+    latencies, statuses = [], []
+    barrier = threading.Barrier(THREADS)
+
+    def post(messages):
+        client = app.test_client()
+        barrier.wait()
+        for message in messages:
+            start = time.perf_counter()
+            status = client.post(
+                "/saml/acs/bench", base_url=BASE_URL, data={"SAMLResponse": message}
+            ).status_code
+            latencies.append((time.perf_counter() - start) * 1e6)
+            statuses.append(status)
+
+    threads = [threading.Thread(target=post, args=(m,)) for m in responses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, {s: statuses.count(s) for s in set(statuses)}
+
+
+def bench_rate_limits():
+    """Measure the overhead of the rate limiting on ``/sso``."""
+    rows = []
+    for limits in ({}, {"sso": (1e9, 1e9)}):
+        app = create_app(False)
+        app.config["SSO_SAML_RATE_LIMITS"] = limits
+        client = app.test_client()
+
+        def sso():
+            assert client.get("/saml/sso/bench", base_url=BASE_URL).status_code == 302
+
+        name = "sso, rate limited" if limits else "sso"
+        rows.append((name, measure_latencies(sso)))
+    return rows
+
+
+def main():
+    """Run the benchmark."""
+    rows = []
+    for concurrency in (None, POOL_SIZE):
+        latencies, statuses = bench_burst(concurrency)
+        name = "acs, at most {}".format(concurrency) if concurrency else "acs"
+        rows.append((name, latencies))
+        print("{}: {}".format(name, statuses))
+    print()
+    report_latencies(
+        "Burst of {} threads, pool of {} connections".format(THREADS, POOL_SIZE),
+        rows,
+    )
+    print()
+    report_latencies("Rate limiting", bench_rate_limits())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Latency of the SAML endpoints through the full Flask view stack.
+
+Requests ``/metadata``, ``/sso``, ``/acs`` and ``/sls`` of an IdP with the
+test client, offline. The responses posted to the ACS are signed, and
+optionally encrypted, with the key pairs in ``tests/data`` by
+:func:`invenio_saml.testing.build_response`; a new one is built for each
+request so that the replay cache does not reject them.
+
+Reports the throughput and latency percentiles of each endpoint and of its
+phases: building the auth object, the SAML processing (parsing, signature
+validation and decryption) and the rest of the view.
+
+Run with ``python benchmarks/bench_endpoints.py``.
+"""
+
+import base64
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Flask
+from helpers import measure_latencies, report_latencies
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+from invenio_saml import InvenioSSOSAML
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_logout_response, build_response
+from invenio_saml.utils import SAMLAuth
+
+NUMBER = 300
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "data")
+
+BASE_URL = "https://sp.example.org"
+
+ATTRIBUTES = {
+    "urn:oid:0.9.2342.19200300.100.1.3": ["federico@example.com"],
+    "urn:oid:2.5.4.42": ["Federico"],
+    "urn:oid:2.5.4.4": ["Fernandez"],
+    "urn:oid:1.3.6.1.4.1.5923.1.1.1.6": ["federico@example.com"],
+    "urn:oid:1.3.6.1.4.1.5923.1.1.1.9": ["member@example.com", "staff@example.com"],
+}
+
+
+def read(name):
+    """Read a file of ``tests/data``."""
+    with open(os.path.join(DATA, name)) as f:
+        return f.read()
+
+
+def create_app(encrypted):
+    """Create an application with a single ``bench`` IdP."""
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY="bench",
+        SERVER_NAME="sp.example.org",
+        PREFERRED_URL_SCHEME="https",
+        SSO_SAML_IDPS={
+            "bench": {
+                "settings": {
+                    "sp": {
+                        "x509cert": read("sp.crt"),
+                        "privateKey": read("sp.key"),
+                    },
+                    "idp": {
+                        "entityId": "https://idp.example.org",
+                        "singleSignOnService": {"url": "https://idp.example.org/sso"},
+                        "singleLogoutService": {"url": "https://idp.example.org/slo"},
+                        "x509cert": read("idp.crt"),
+                    },
+                    "security": {
+                        "wantAssertionsSigned": True,
+                        "wantAssertionsEncrypted": encrypted,
+                    },
+                    "debug": False,
+                },
+                "acs_handler": lambda auth, next_url: next_url,
+                "sls_handler": lambda auth, next_url: next_url,
+            }
+        },
+    )
+    InvenioSSOSAML(app)
+    return app
+
+
+class Phases(object):
+    """Collect the time spent in the phases of the views."""
+
+    def __init__(self):
+        """Initialize the collected latencies."""
+        self.latencies = defaultdict(list)
+
+    @contextmanager
+    def record(self, state):
+        """Time the phases of the requests made in the block."""
+        originals = {
+            "get_auth": (state, state.get_auth),
+            "process_response": (SAMLAuth, SAMLAuth.process_response),
+            "process_slo": (SAMLAuth, SAMLAuth.process_slo),
+            "login": (SAMLAuth, SAMLAuth.login),
+        }
+        for name, (owner, func) in originals.items():
+            setattr(owner, name, self._timed(name, func))
+        try:
+            yield
+        finally:
+            for name, (owner, func) in originals.items():
+                if owner is state:
+                    delattr(owner, name)
+                else:
+                    setattr(owner, name, func)
+
+    def _timed(self, name, func):
+        latencies = self.latencies[name]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                latencies.append((time.perf_counter() - start) * 1e6)
+
+        return timed
+
+    def pop(self, total):
+        """Latencies of the phases and the rest of the requests."""
+        phases = [(name, self.latencies.pop(name)) for name in list(self.latencies)]
+        phases = [(name, latencies) for name, latencies in phases if latencies]
+        rest = [
+            latency - sum(latencies[i] for _, latencies in phases)
+            for i, latency in enumerate(total)
+        ]
+        self.latencies.clear()
+        return [("  " + name, latencies) for name, latencies in phases] + [
+            ("  rest of the view", rest)
+        ]
+
+
+def bench_app(encrypted):
+    """Benchmark the endpoints of an application."""
+    app = create_app(encrypted)
+    client = app.test_client()
+    state = app.extensions["invenio-sso-saml"]
+    with app.test_request_context(base_url=BASE_URL):
+        settings = current_sso_saml.get_runtime("bench").settings
+    idp_key, idp_cert = read("idp.key"), read("idp.crt")
+
+    def check(response, status):
+        assert response.status_code == status, response.get_data(as_text=True)
+
+    # Build the responses beforehand, their signature is not measured
+    responses = [
+        base64.b64encode(
+            build_response(
+                settings,
+                idp_key,
+                idp_cert,
+                "federico@example.com",
+                ATTRIBUTES,
+                encrypt=encrypted,
+            )
+        )
+        for _ in range(NUMBER)
+    ]
+    responses = iter(responses)
+    logout_response = OneLogin_Saml2_Utils.deflate_and_base64_encode(
+        build_logout_response(settings)
+    )
+
+    check(client.get("/saml/metadata/bench", base_url=BASE_URL), 200)
+    etag = client.get("/saml/metadata/bench", base_url=BASE_URL).headers["ETag"]
+
+    endpoints = [
+        (
+            "metadata",
+            lambda: check(client.get("/saml/metadata/bench", base_url=BASE_URL), 200),
+        ),
+        (
+            "metadata (304)",
+            lambda: check(
+                client.get(
+                    "/saml/metadata/bench",
+                    base_url=BASE_URL,
+                    headers={"If-None-Match": etag},
+                ),
+                304,
+            ),
+        ),
+        (
+            "sso",
+            lambda: check(client.get("/saml/sso/bench", base_url=BASE_URL), 302),
+        ),
+        (
+            "acs",
+            lambda: check(
+                client.post(
+                    "/saml/acs/bench",
+                    base_url=BASE_URL,
+                    data={"SAMLResponse": next(responses), "RelayState": "/"},
+                ),
+                302,
+            ),
+        ),
+        (
+            "sls",
+            lambda: check(
+                client.get(
+                    "/saml/sls/bench",
+                    base_url=BASE_URL,
+                    query_string={"SAMLResponse": logout_response},
+                ),
+                302,
+            ),
+        ),
+    ]
+
+    phases = Phases()
+    results = []
+    for name, request in endpoints:
+        with phases.record(state):
+            latencies = measure_latencies(request, number=NUMBER, warmup=0)
+        results.append((name, latencies))
+        if name in ("sso", "acs", "sls"):
+            results.extend(phases.pop(latencies))
+        phases.latencies.clear()
+    return results
+
+
+def main():
+    """Run the benchmark."""
+    report_latencies("SAML endpoints (signed assertions)", bench_app(False))
+    print()
+    report_latencies(
+        "SAML endpoints (signed and encrypted assertions)", bench_app(True)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Memory and time needed to index federation aggregates.
+
+Generates aggregates of growing size and reports how long compiling them
+into the index of :class:`invenio_saml.federation.FederationMetadata` takes,
+the peak Python memory traced while compiling and the size of the index file,
+next to the size of the aggregate itself, and how long opening the index
+again takes, as another process does.
+
+Run with ``python benchmarks/bench_federation.py``.
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+from helpers import generate_key_pair
+
+from invenio_saml.federation import FederationMetadata
+
+ENTITY = """  <md:EntityDescriptor entityID="https://idp{0}.example.org">
+    <md:IDPSSODescriptor protocolSupportEnumeration="urn:oasis:names:tc:SAML:2.0:protocol">
+      <md:KeyDescriptor use="signing"><ds:KeyInfo><ds:X509Data>
+        <ds:X509Certificate>{1}</ds:X509Certificate>
+      </ds:X509Data></ds:KeyInfo></md:KeyDescriptor>
+      <md:SingleSignOnService Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect" Location="https://idp{0}.example.org/sso"/>
+    </md:IDPSSODescriptor>
+  </md:EntityDescriptor>
+"""
+
+
+def write_aggregate(path, size, cert):
+    """Write an aggregate with ``size`` IdPs."""
+    with open(path, "w") as f:
+        f.write(
+            '<md:EntitiesDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata"'
+            ' xmlns:ds="http://www.w3.org/2000/09/xmldsig#">\n'
+        )
+        for i in range(size):
+            f.write(ENTITY.format(i, cert))
+        f.write("</md:EntitiesDescriptor>\n")
+
+
+def peak(func):
+    """Return the peak traced memory (MiB) and duration (s) of ``func``."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak_size / 2**20, elapsed
+
+
+def main():
+    """Run the benchmark."""
+    _, cert = generate_key_pair("idp")
+    cert = "".join(cert.splitlines()[1:-1])
+    print(
+        "{:>8} {:>10} {:>12} {:>12} {:>8} {:>8}".format(
+            "IdPs", "file MiB", "peak MiB", "index MiB", "time s", "open s"
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (1000, 5000, 20000):
+            path = os.path.join(tmp, "aggregate-{}.xml".format(size))
+            write_aggregate(path, size, cert)
+            index, peak_mem, elapsed = peak(
+                lambda: FederationMetadata("bench", path, cache_dir=tmp).load()
+            )
+            assert len(index) == size
+            start = time.perf_counter()
+            FederationMetadata("bench", path, cache_dir=tmp).load()
+            reopened = time.perf_counter() - start
+            print(
+                "{:>8} {:>10.1f} {:>12.1f} {:>12.1f} {:>8.2f} {:>8.4f}".format(
+                    size,
+                    os.path.getsize(path) / 2**20,
+                    peak_mem,
+                    os.path.getsize(index._index.path) / 2**20,
+                    elapsed,
+                    reopened,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
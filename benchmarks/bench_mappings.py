@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cost of extracting the account fields from the attributes of a response.
+
+Compares reading the raw ``mappings`` on every login (what
+``default_account_info`` used to do) with the compiled
+:class:`invenio_saml.mappings.AttributeExtractor`, for responses carrying a
+growing number of attributes, some of them large and multi-valued.
+
+Run with ``python benchmarks/bench_mappings.py``.
+"""
+
+from helpers import measure, report
+
+from invenio_saml.mappings import ACCOUNT_FIELDS, AttributeExtractor
+
+MAPPINGS = {
+    "email": "urn:oid:0.9.2342.19200300.100.1.3",
+    "name": "urn:oid:2.5.4.42",
+    "surname": "urn:oid:2.5.4.4",
+    "external_id": "urn:oid:1.3.6.1.4.1.5923.1.1.1.6",
+    "affiliations": "urn:oid:1.3.6.1.4.1.5923.1.1.1.9",
+}
+
+
+def make_attributes(size):
+    """Attributes of a response with ``size`` attributes besides the mapped."""
+    attributes = {
+        "urn:example:attribute:{}".format(i): [
+            "urn:example:entitlement:{}:{}".format(i, j) for j in range(i % 50)
+        ]
+        for i in range(size)
+    }
+    attributes.update(
+        {
+            MAPPINGS["email"]: ["federico@example.com"],
+            MAPPINGS["name"]: ["Federico"],
+            MAPPINGS["surname"]: ["Fernandez"],
+            MAPPINGS["external_id"]: ["federico@example.com"],
+            MAPPINGS["affiliations"]: ["member@example.com", "staff@example.com"],
+        }
+    )
+    return attributes
+
+
+def legacy(config, idp, attributes):
+    """Extraction as done by the former ``default_account_info``."""
+    mappings = config[idp]["mappings"]
+    affiliations_mapping = mappings.get("affiliations", None)
+    if affiliations_mapping:
+        affiliations = attributes[affiliations_mapping]
+    else:
+        affiliations = ""
+    return dict(
+        name=attributes[mappings["name"]][0],
+        surname=attributes[mappings["surname"]][0],
+        email=attributes[mappings["email"]][0],
+        external_id=attributes[mappings["external_id"]][0],
+        affiliations=affiliations,
+    )
+
+
+def main():
+    """Run the benchmark."""
+    config = {"idp": {"mappings": MAPPINGS}}
+    extractor = AttributeExtractor(MAPPINGS, ACCOUNT_FIELDS)
+    for size in (10, 200, 1000):
+        attributes = make_attributes(size)
+        assert legacy(config, "idp", attributes) == extractor.extract(attributes)
+        report(
+            "Account fields out of {} attributes".format(size + len(MAPPINGS)),
+            [
+                ("legacy mappings", measure(lambda: legacy(config, "idp", attributes))),
+                ("compiled extractor", measure(lambda: extractor.extract(attributes))),
+                (
+                    "compile (once per IdP)",
+                    measure(lambda: AttributeExtractor(MAPPINGS, ACCOUNT_FIELDS)),
+                ),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    main()
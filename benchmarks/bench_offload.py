@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Throughput of the ACS with the responses processed inline or offloaded.
+
+Posts signed and encrypted responses, built beforehand with the key pairs in
+``tests/data``, to the ACS of an IdP from several threads, as a threaded
+worker would serve them, with the responses processed by the request threads
+and by a pool of ``SSO_SAML_OFFLOAD_WORKERS`` worker processes.
+
+Reports the throughput and latency percentiles of each mode per number of
+threads.
+
+Run with ``python benchmarks/bench_offload.py``.
+"""
+
+import base64
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_endpoints import ATTRIBUTES, BASE_URL, create_app, read
+
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_response, percentile
+
+NUMBER = 200
+
+THREADS = (1, 4, 8)
+
+WORKERS = min(4, os.cpu_count() or 1)
+
+
+def bench_app(workers, threads):
+    """Post the responses to the ACS from ``threads`` threads.
+
+    :returns: Wall time in seconds and latencies in microseconds.
+    """
+    app = create_app(encrypted=True)
+    app.config["SSO_SAML_OFFLOAD_WORKERS"] = workers
+    state = app.extensions["invenio-sso-saml"]
+    with app.test_request_context(base_url=BASE_URL):
+        settings = current_sso_saml.get_runtime("bench").settings
+        # Start the workers beforehand
+        if state.response_pool is not None:
+            state.response_pool.start([settings])
+    idp_key, idp_cert = read("idp.key"), read("idp.crt")
+
+    responses = [
+        base64.b64encode(
+            build_response(
+                settings,
+                idp_key,
+                idp_cert,
+                "federico@example.com",
+                ATTRIBUTES,
+                encrypt=True,
+            )
+        )
+        for _ in range(NUMBER)
+    ]
+    local = threading.local()
+
+    def post(response):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        res = client.post(
+            "/saml/acs/bench",
+            base_url=BASE_URL,
+            data={"SAMLResponse": response, "RelayState": "/"},
+        )
+        latency = (time.perf_counter() - start) * 1e6
+        assert res.status_code == 302, res.get_data(as_text=True)
+        return latency
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            latencies = list(executor.map(post, responses))
+        return time.perf_counter() - start, latencies
+    finally:
+        if state.response_pool is not None:
+            state.response_pool.shutdown()
+
+
+def main():
+    """Run the benchmark."""
+    print(
+        "ACS with signed and encrypted assertions ({} worker processes)".format(WORKERS)
+    )
+    print(
+        "  {0:<20}  {1:>10}  {2:>10}  {3:>10}  {4:>10}".format(
+            "", "ops/s", "p50 us", "p90 us", "p99 us"
+        )
+    )
+    for threads in THREADS:
+        for name, workers in (("inline", 0), ("offloaded", WORKERS)):
+            elapsed, latencies = bench_app(workers, threads)
+            print(
+                "  {0:<20}  {1:10.0f}  {2:10.2f}  {3:10.2f}  {4:10.2f}".format(
+                    "{}, {} threads".format(name, threads),
+                    len(latencies) / elapsed,
+                    percentile(latencies, 50),
+                    percentile(latencies, 90),
+                    percentile(latencies, 99),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Latency of the rejection of malformed SAML messages by the ACS and SLS.
+
+Posts garbage, a large message with another root element and a message with
+an invalid base64 alphabet to the ACS, and sends a deflated bomb to the SLS,
+with the test client, with and without ``SSO_SAML_PREVALIDATION``. Also
+measures the cost of the checks with a valid signed response.
+
+The requests include the parsing of the forms and query strings by Werkzeug,
+which is limited by ``MAX_CONTENT_LENGTH``, so the processing of the messages
+by ``SAMLAuth`` and by :func:`invenio_saml.prevalidation.check_message` is
+also measured alone.
+
+Run with ``python benchmarks/bench_prevalidation.py``.
+"""
+
+import base64
+import zlib
+from urllib.parse import urlencode
+
+from bench_endpoints import ATTRIBUTES, BASE_URL, create_app, read
+from helpers import measure_latencies, report_latencies
+
+from invenio_saml.errors import MessageRejected
+from invenio_saml.prevalidation import MessageLimits, check_message
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_response
+
+NUMBER = 300
+
+
+def deflate(data):
+    """Deflate and base64 encode data like the HTTP-Redirect binding."""
+    compressor = zlib.compressobj(wbits=-15)
+    return base64.b64encode(compressor.compress(data) + compressor.flush())
+
+
+GARBAGE = base64.b64encode(b"\x00" * 64 * 1024)
+
+OTHER_ROOT = base64.b64encode(
+    b"<Envelope>" + b"<a>" * 40 * 1024 + b"</a>" * 40 * 1024 + b"</Envelope>"
+)
+
+ALPHABET = b"!" + base64.b64encode(b"<Response/>" * 20 * 1024)
+
+BOMB = deflate(b"<LogoutResponse>" + b" " * 50 * 1024 * 1024)
+
+
+def bench_app(prevalidation):
+    """Measure the rejections of an application."""
+    app = create_app(False)
+    app.config["SSO_SAML_PREVALIDATION"] = prevalidation
+    client = app.test_client()
+    with app.test_request_context(base_url=BASE_URL):
+        settings = current_sso_saml.get_runtime("bench").settings
+    idp_key, idp_cert = read("idp.key"), read("idp.crt")
+
+    def post(message, status):
+        # Encoded once, the test client encodes the forms slowly
+        body = urlencode({"SAMLResponse": message})
+
+        def request():
+            res = client.post(
+                "/saml/acs/bench",
+                base_url=BASE_URL,
+                data=body,
+                content_type="application/x-www-form-urlencoded",
+            )
+            assert res.status_code == status, res.status_code
+
+        return request
+
+    responses = iter(
+        [
+            post(
+                base64.b64encode(
+                    build_response(
+                        settings, idp_key, idp_cert, "federico@example.com", ATTRIBUTES
+                    )
+                ),
+                302,
+            )
+            for _ in range(NUMBER)
+        ]
+    )
+
+    def sls():
+        res = client.get(
+            "/saml/sls/bench", base_url=BASE_URL, query_string={"SAMLResponse": BOMB}
+        )
+        assert res.status_code in (302, 400, 401), res.status_code
+
+    rows = [
+        ("acs, garbage", post(GARBAGE, 400)),
+        ("acs, other root element", post(OTHER_ROOT, 400)),
+        ("acs, invalid base64", post(ALPHABET, 400)),
+        ("sls, deflated bomb", sls),
+        ("acs, valid response", lambda: next(responses)()),
+    ]
+    return [
+        (name, measure_latencies(request, number=NUMBER, warmup=0))
+        for name, request in rows
+    ]
+
+
+def bench_processing():
+    """Measure the processing of the messages alone."""
+    app = create_app(False)
+    limits = MessageLimits(
+        app.config["SSO_SAML_MAX_MESSAGE_SIZE"],
+        app.config["SSO_SAML_MAX_XML_SIZE"],
+        app.config["SSO_SAML_MAX_INFLATE_RATIO"],
+    )
+    rows = []
+    for name, message in (
+        ("garbage", GARBAGE),
+        ("other root element", OTHER_ROOT),
+        ("invalid base64", ALPHABET),
+    ):
+        with app.test_request_context(
+            "/saml/acs/bench",
+            base_url=BASE_URL,
+            method="POST",
+            data={"SAMLResponse": message},
+        ):
+            auth = current_sso_saml.get_auth("bench")
+            message = message.decode()
+
+            def process_response():
+                try:
+                    auth.process_response()
+                except Exception:
+                    pass
+
+            def check():
+                try:
+                    check_message(message, "Response", False, limits)
+                except MessageRejected:
+                    pass
+
+            rows.append(
+                ("{}, SAMLAuth".format(name), measure_latencies(process_response))
+            )
+            rows.append(("{}, check_message".format(name), measure_latencies(check)))
+
+    with app.test_request_context(
+        "/saml/sls/bench", base_url=BASE_URL, query_string={"SAMLResponse": BOMB}
+    ):
+        auth = current_sso_saml.get_auth("bench")
+        bomb = BOMB.decode()
+
+        def process_slo():
+            try:
+                auth.process_slo(delete_session_cb=lambda: None)
+            except Exception:
+                pass
+
+        def check_bomb():
+            try:
+                check_message(bomb, "LogoutResponse", True, limits)
+            except MessageRejected:
+                pass
+
+        rows.append(("deflated bomb, SAMLAuth", measure_latencies(process_slo, 20)))
+        rows.append(("deflated bomb, check_message", measure_latencies(check_bomb)))
+    return rows
+
+
+def main():
+    """Run the benchmark."""
+    for prevalidation in (False, True):
+        title = "Rejections {} pre-validation".format(
+            "with" if prevalidation else "without"
+        )
+        report_latencies(title, bench_app(prevalidation))
+        print()
+    report_latencies("Processing of the messages", bench_processing())
+
+
+if __name__ == "__main__":
+    main()
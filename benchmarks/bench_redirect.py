@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cost of validating the redirect targets of the ACS and SLS.
+
+Compares the former ``get_safe_redirect_target``, which split each candidate
+and looked its host up in the ``TRUSTED_HOSTS`` list, with the compiled
+:class:`invenio_saml.invenio_app.TrustedHosts` and the cache of the split
+targets, for a growing number of trusted hosts and for a trusted, an
+untrusted and a relative target.
+
+Run with ``python benchmarks/bench_redirect.py``.
+"""
+
+from flask import Flask, current_app, request
+from helpers import measure, report
+from uritools import uricompose, urisplit
+
+from invenio_saml.invenio_app import get_safe_redirect_target
+
+TARGETS = {
+    "trusted": "https://www.example.org/records/12345?tab=files#preview",
+    "untrusted": "https://evil.example.com/records/12345?tab=files#preview",
+    "relative": "/records/12345?tab=files#preview",
+}
+
+
+def legacy(arg="next", _target=None):
+    """Validation as done by the former ``get_safe_redirect_target``."""
+    for target in _target, request.args.get(arg), request.referrer:
+        if target:
+            redirect_uri = urisplit(target)
+            allowed_hosts = current_app.config.get("TRUSTED_HOSTS", [])
+            if redirect_uri.host in allowed_hosts:
+                return target
+            elif redirect_uri.path:
+                return uricompose(
+                    path=redirect_uri.path,
+                    query=redirect_uri.query,
+                    fragment=redirect_uri.fragment,
+                )
+    return None
+
+
+def main():
+    """Run the benchmark."""
+    app = Flask(__name__)
+    for size in (3, 30, 300):
+        hosts = ["host{}.example.net".format(i) for i in range(size - 1)]
+        app.config["TRUSTED_HOSTS"] = hosts + ["www.example.org"]
+        results = []
+        for name, target in TARGETS.items():
+            with app.test_request_context(headers={"Referer": target}):
+                assert legacy(_target=target) == get_safe_redirect_target(
+                    _target=target
+                )
+                results.append(
+                    (
+                        "{}, list".format(name),
+                        measure(lambda: legacy(_target=target), number=20000),
+                    )
+                )
+                results.append(
+                    (
+                        "{}, compiled".format(name),
+                        measure(
+                            lambda: get_safe_redirect_target(_target=target),
+                            number=20000,
+                        ),
+                    )
+                )
+        report("{} trusted hosts".format(size), results)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Per-request construction cost of the OneLogin auth object.
+
+Compares building ``OneLogin_Saml2_Auth`` from the settings dictionary (what
+``SAMLAuth`` used to do on every request) with reusing the settings object
+compiled once in the IdP runtime.
+
+Run with ``python benchmarks/bench_runtime.py``.
+"""
+
+from copy import deepcopy
+
+from helpers import generate_key_pair, make_request_data, make_settings, measure, report
+from onelogin.saml2.auth import OneLogin_Saml2_Auth
+from onelogin.saml2.settings import OneLogin_Saml2_Settings
+
+
+def main():
+    """Run the benchmark."""
+    sp_key, sp_cert = generate_key_pair("sp")
+    _, idp_cert = generate_key_pair("idp")
+    settings = make_settings(sp_key, sp_cert, idp_cert)
+    compiled = OneLogin_Saml2_Settings(deepcopy(settings))
+    request_data = make_request_data()
+
+    report(
+        "SAMLAuth construction per request",
+        [
+            (
+                "before (settings dict)",
+                measure(lambda: OneLogin_Saml2_Auth(request_data, settings)),
+            ),
+            (
+                "after (compiled runtime)",
+                measure(lambda: OneLogin_Saml2_Auth(request_data, compiled)),
+            ),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Throughput of ``process_response`` and ``process_slo`` with the XML cache.
+
+Processes a signed, and a signed and encrypted, response built with the key
+pairs in ``tests/data`` and a logout response with ``SAMLAuth``, with the
+parsing and schema validation of OneLogin, which compiles the schema of the
+SAML protocol on each validation, and with the cached schemas and parsers of
+:mod:`invenio_saml.xml_utils`.
+
+Run with ``python benchmarks/bench_xml.py``.
+"""
+
+import base64
+
+from bench_endpoints import ATTRIBUTES, BASE_URL, create_app, read
+from helpers import measure_latencies, report_latencies
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_logout_response, build_response
+from invenio_saml.xml_utils import install_xml_cache, uninstall_xml_cache
+
+NUMBER = 300
+
+
+def bench_app(encrypted, cached):
+    """Measure the processing of the messages of an application."""
+    app = create_app(encrypted)
+    # Same as SSO_SAML_XML_CACHE, which applies to the whole process
+    if cached:
+        install_xml_cache()
+    else:
+        uninstall_xml_cache()
+    with app.test_request_context(base_url=BASE_URL):
+        settings = current_sso_saml.get_runtime("bench").settings
+    response = base64.b64encode(
+        build_response(
+            settings,
+            read("idp.key"),
+            read("idp.crt"),
+            "federico@example.com",
+            ATTRIBUTES,
+            encrypt=encrypted,
+        )
+    )
+    logout_response = OneLogin_Saml2_Utils.deflate_and_base64_encode(
+        build_logout_response(settings)
+    )
+
+    with app.test_request_context(
+        "/saml/acs/bench",
+        base_url=BASE_URL,
+        method="POST",
+        data={"SAMLResponse": response},
+    ):
+        auth = current_sso_saml.get_auth("bench")
+
+        def process_response():
+            auth.process_response()
+            assert auth.is_authenticated(), auth.get_last_error_reason()
+
+        acs = measure_latencies(process_response, number=NUMBER)
+
+    with app.test_request_context(
+        "/saml/sls/bench",
+        base_url=BASE_URL,
+        query_string={"SAMLResponse": logout_response},
+    ):
+        auth = current_sso_saml.get_auth("bench")
+
+        def process_slo():
+            auth.process_slo(delete_session_cb=lambda: None)
+            assert not auth.get_errors(), auth.get_last_error_reason()
+
+        sls = measure_latencies(process_slo, number=NUMBER)
+    return acs, sls
+
+
+def main():
+    """Run the benchmark."""
+    results = {}
+    for cached in (False, True):
+        results[cached] = (bench_app(False, cached), bench_app(True, cached))
+
+    rows = []
+    for name, index in (("signed", 0), ("signed and encrypted", 1)):
+        for cached in (False, True):
+            acs, sls = results[cached][index]
+            suffix = "cached" if cached else "OneLogin"
+            rows.append(("process_response, {}, {}".format(name, suffix), acs))
+    for cached in (False, True):
+        sls = results[cached][0][1]
+        suffix = "cached" if cached else "OneLogin"
+        rows.append(("process_slo, {}".format(suffix), sls))
+    report_latencies("SAML message processing", rows)
+
+
+if __name__ == "__main__":
+    main()
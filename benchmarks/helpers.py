@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Shared helpers for the benchmarks."""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from invenio_saml.testing import percentile
+
+
+def generate_key_pair(common_name="invenio-saml-benchmark"):
+    """Generate a throw-away RSA key and self-signed certificate (PEM)."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=365))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ).decode()
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+    return key_pem, cert_pem
+
+
+def make_settings(sp_key, sp_cert, idp_cert, base_url="https://sp.example.org"):
+    """Build an OneLogin settings dictionary similar to the default one."""
+    return {
+        "strict": True,
+        "debug": False,
+        "sp": {
+            "entityId": base_url + "/saml/metadata/bench",
+            "assertionConsumerService": {
+                "url": base_url + "/saml/acs/bench",
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST",
+            },
+            "singleLogoutService": {
+                "url": base_url + "/saml/sls/bench",
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
+            },
+            "x509cert": sp_cert,
+            "privateKey": sp_key,
+        },
+        "idp": {
+            "entityId": "https://idp.example.org",
+            "singleSignOnService": {
+                "url": "https://idp.example.org/sso",
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
+            },
+            "singleLogoutService": {
+                "url": "https://idp.example.org/slo",
+                "binding": "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect",
+            },
+            "x509cert": idp_cert,
+        },
+        "security": {
+            "authnRequestsSigned": True,
+            "logoutRequestSigned": True,
+            "wantAssertionsSigned": True,
+        },
+    }
+
+
+def make_request_data(post_data=None, get_data=None, path="/saml/acs/bench"):
+    """Build the request data dictionary as ``prepare_flask_request`` does."""
+    return {
+        "get_data": get_data or {},
+        "http_host": "sp.example.org",
+        "https": "on",
+        "post_data": post_data or {},
+        "script_name": path,
+        "server_port": None,
+    }
+
+
+def measure(func, number=1000, repeat=5):
+    """Return the best per-call time in microseconds of ``func``."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_latencies(func, number=500, warmup=20):
+    """Return the latency in microseconds of each of ``number`` calls."""
+    for _ in range(warmup):
+        func()
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def report(title, results):
+    """Print a small table with the results of a benchmark."""
+    print(title)
+    width = max(len(name) for name, _ in results)
+    for name, value in results:
+        print("  {0:<{1}}  {2:10.2f} us/op".format(name, width, value))
+
+
+def report_latencies(title, results):
+    """Print throughput and latency percentiles of measured latencies."""
+    print(title)
+    width = max(len(name) for name, _ in results)
+    print(
+        "  {0:<{1}}  {2:>10}  {3:>10}  {4:>10}  {5:>10}".format(
+            "", width, "ops/s", "p50 us", "p90 us", "p99 us"
+        )
+    )
+    for name, latencies in results:
+        print(
+            "  {0:<{1}}  {2:10.0f}  {3:10.2f}  {4:10.2f}  {5:10.2f}".format(
+                name,
+                width,
+                len(latencies) / sum(latencies) * 1e6,
+                percentile(latencies, 50),
+                percentile(latencies, 90),
+                percentile(latencies, 99),
+            )
+        )
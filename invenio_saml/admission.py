@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Admission control of the SSO and ACS requests.
+
+The requests of each IdP and endpoint are rate limited by a token bucket,
+see ``SSO_SAML_RATE_LIMITS``: those exceeding it are answered with a 429
+right away. The ACS requests executed at once by a process are also limited,
+see ``SSO_SAML_ACS_CONCURRENCY``, so that logins and registrations do not
+exhaust its database connections: the requests over the limit wait in a short
+queue, and are answered with a 503 when it is full or they waited too long.
+Both responses tell the clients when to retry with ``Retry-After``.
+"""
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Interface of the rate limiter backends."""
+
+    def acquire(self, key, rate, burst):
+        """Take a token from a bucket.
+
+        :param key: Key of the bucket, e.g. the IdP and endpoint.
+        :param rate: Tokens added to the bucket per second.
+        :param burst: Maximum number of tokens of the bucket, which starts
+            full.
+        :returns: ``0`` if a token was taken, otherwise the seconds until the
+            next token.
+        """
+        raise NotImplementedError()
+
+
+class MemoryRateLimiter(RateLimiter):
+    """In-process token buckets.
+
+    Each worker process has its own buckets, use a shared backend to limit
+    the requests of all of them.
+    """
+
+    def __init__(self):
+        """Initialize the buckets."""
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, rate, burst):
+        """Take a token from a bucket."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+
+
+_TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "time")
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("HMSET", KEYS[1], "tokens", tokens, "time", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Token buckets shared between processes through Redis.
+
+    Any client implementing ``eval(script, numkeys, *keys_and_args)`` with
+    the Redis semantics can be used. The buckets are updated atomically by a
+    Lua script, with the clock of the processes, which should be in sync.
+    """
+
+    def __init__(self, client, prefix="saml:rate:"):
+        """Initialize the limiter.
+
+        :param client: Redis client.
+        :param prefix: Prefix of the Redis keys.
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def acquire(self, key, rate, burst):
+        """Take a token from a bucket."""
+        wait = self.client.eval(
+            _TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst, time.time()
+        )
+        return float(wait)
+
+
+class ConcurrencyLimiter(object):
+    """Limit of the requests executed at once, with a queue.
+
+    The requests over the limit wait for a slot, at most ``queue_size`` of
+    them and for at most ``timeout`` seconds.
+    """
+
+    def __init__(self, limit, queue_size=0, timeout=1.0):
+        """Initialize the limiter.
+
+        :param limit: Maximum number of requests executed at once.
+        :param queue_size: Maximum number of requests waiting for a slot.
+        :param timeout: Maximum number of seconds a request waits.
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._active = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    @property
+    def active(self):
+        """Number of requests executed."""
+        return self._active
+
+    @property
+    def waiting(self):
+        """Number of requests waiting for a slot."""
+        return self._waiting
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if needed.
+
+        :returns: Whether a slot was taken, it must then be released.
+        """
+        with self._condition:
+            if self._active < self.limit:
+                self._active += 1
+                return True
+            if self._waiting >= self.queue_size:
+                return False
+
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + self.timeout
+                while self._active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                self._active += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        """Release a slot taken with :meth:`acquire`."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+
+def memory_rate_limiter_factory(app):
+    """Create in-process token buckets."""
+    return MemoryRateLimiter()
+
+
+def redis_rate_limiter_factory(app):
+    """Create token buckets stored in the ``CACHE_REDIS_URL`` Redis."""
+    from redis import StrictRedis
+
+    return RedisRateLimiter(StrictRedis.from_url(app.config["CACHE_REDIS_URL"]))
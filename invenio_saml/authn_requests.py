@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Store of the outstanding authentication requests.
+
+The ID of every ``AuthnRequest`` sent to an IdP is remembered, so that the
+``InResponseTo`` of the responses can be checked and solicited responses told
+apart from unsolicited ones.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class OutstandingRequest(object):
+    """An ``AuthnRequest`` waiting for its response."""
+
+    __slots__ = ("id", "idp", "issued", "relay_state")
+
+    def __init__(self, id, idp, issued=None, relay_state=None):
+        """Initialize the request.
+
+        :param id: ID of the ``AuthnRequest``.
+        :param idp: Identity provider key the request was sent to.
+        :param issued: Unix timestamp of the request, defaults to now.
+        :param relay_state: RelayState sent with the request.
+        """
+        self.id = id
+        self.idp = idp
+        self.issued = time.time() if issued is None else issued
+        self.relay_state = relay_state
+
+
+class SessionRequests(tuple):
+    """IDs of the outstanding requests of a session, oldest first.
+
+    Given as the ``request_id`` of ``SAMLAuth.process_response``, the
+    response is then only valid if it answers one of them, or none at all.
+    """
+
+    def match(self, in_response_to):
+        """Get the ID of the request a response must answer.
+
+        It is passed to OneLogin as the ``request_id`` of the response, which
+        rejects the response unless its ``InResponseTo`` is that ID.
+
+        :param in_response_to: ``InResponseTo`` of the response or ``None``.
+        :returns: ``in_response_to`` if it is one of the requests, otherwise
+            the latest request, or ``None`` if there is none.
+        """
+        if not self:
+            return None
+        return in_response_to if in_response_to in self else self[-1]
+
+
+class RequestStore(object):
+    """Interface of the outstanding request stores."""
+
+    def add(self, request, ttl):
+        """Remember a request for ``ttl`` seconds."""
+        raise NotImplementedError()
+
+    def pop(self, request_id):
+        """Get and forget a request, ``None`` if unknown or expired."""
+        raise NotImplementedError()
+
+    def discard(self, request_id):
+        """Forget a request."""
+        self.pop(request_id)
+
+
+class MemoryRequestStore(RequestStore):
+    """In-process store of the outstanding requests.
+
+    Requests are kept in insertion order and evicted once expired or, when the
+    store is full, from the oldest one, so abandoned logins do not make it
+    grow. Lookups and insertions are O(1). Each worker process has its own
+    store, use a shared one when running several of them.
+    """
+
+    def __init__(self, max_size=100000):
+        """Initialize the store.
+
+        :param max_size: Maximum number of requests kept.
+        """
+        self.max_size = max_size
+        self._requests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of requests in the store."""
+        return len(self._requests)
+
+    def add(self, request, ttl):
+        """Remember a request for ``ttl`` seconds."""
+        now = time.time()
+        with self._lock:
+            self._requests[request.id] = (request, now + ttl)
+            self._requests.move_to_end(request.id)
+            while self._requests:
+                _, expires = next(iter(self._requests.values()))
+                if expires > now and len(self._requests) <= self.max_size:
+                    break
+                self._requests.popitem(last=False)
+
+    def pop(self, request_id):
+        """Get and forget a request, ``None`` if unknown or expired."""
+        with self._lock:
+            request, expires = self._requests.pop(request_id, (None, 0))
+        if request is None or expires <= time.time():
+            return None
+        return request
+
+
+class RedisRequestStore(RequestStore):
+    """Store of the outstanding requests shared between processes."""
+
+    def __init__(self, client, prefix="saml:request:"):
+        """Initialize the store.
+
+        :param client: Redis client.
+        :param prefix: Prefix of the Redis keys.
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def add(self, request, ttl):
+        """Remember a request for ``ttl`` seconds."""
+        value = json.dumps([request.idp, request.issued, request.relay_state])
+        self.client.set(self.prefix + request.id, value, ex=max(1, int(ttl)))
+
+    def pop(self, request_id):
+        """Get and forget a request, ``None`` if unknown or expired."""
+        pipe = self.client.pipeline()
+        pipe.get(self.prefix + request_id)
+        pipe.delete(self.prefix + request_id)
+        value, _ = pipe.execute()
+        if value is None:
+            return None
+        idp, issued, relay_state = json.loads(value)
+        return OutstandingRequest(request_id, idp, issued, relay_state)
+
+
+def memory_request_store_factory(app):
+    """Create an in-process outstanding request store."""
+    return MemoryRequestStore(max_size=app.config["SSO_SAML_REQUEST_STORE_SIZE"])
+
+
+def redis_request_store_factory(app):
+    """Create an outstanding request store in the ``CACHE_REDIS_URL`` Redis."""
+    from redis import StrictRedis
+
+    return RedisRequestStore(StrictRedis.from_url(app.config["CACHE_REDIS_URL"]))
@@ -0,0 +1,187 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Command line interface for SSO-SAML."""
+
+import ssl
+from functools import partial
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+from .federation import iter_idp_settings
+from .index import compile_index
+from .proxies import current_sso_saml
+
+
+@click.group()
+def saml():
+    """SSO SAML commands."""
+
+
+@saml.command("compile-metadata")
+@click.argument("federation")
+@click.option(
+    "--source",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Aggregate metadata file, defaults to the federation metadata_file.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Index file to write, defaults to the federation index_file.",
+)
+@with_appcontext
+def compile_metadata(federation, source, output):
+    """Compile the metadata of a federation into a memory-mapped index.
+
+    Without options, the metadata_file of a federation without an index_file
+    is compiled into SSO_SAML_FEDERATION_CACHE_DIR, unless already done.
+    """
+    config = current_app.config["SSO_SAML_FEDERATIONS"].get(federation, {})
+    if not (source or output or config.get("index_file")) and config.get(
+        "metadata_file"
+    ):
+        index = current_sso_saml.get_federation(federation, wait=True)
+        click.secho(
+            "Compiled {} IdPs into {}".format(len(index), index.index_path),
+            fg="green",
+        )
+        return
+    source = source or config.get("metadata_file")
+    output = output or config.get("index_file")
+    if not source or not output:
+        raise click.UsageError(
+            "Provide --source and --output or configure metadata_file and "
+            "index_file for the federation."
+        )
+
+    def skip(entity_id, exc):
+        click.secho("Skipping {}: {}".format(entity_id, exc), fg="yellow")
+
+    count = compile_index(output, iter_idp_settings(federation, source, skip))
+    click.secho("Compiled {} IdPs into {}".format(count, output), fg="green")
+
+
+@saml.command("warmup")
+@click.argument("idps", nargs=-1)
+@click.option("--workers", type=int, help="Number of IdPs built in parallel.")
+@with_appcontext
+def warmup(idps, workers):
+    """Build the runtime of the IdPs and report the time it took."""
+    results = current_sso_saml.warmup(idps=list(idps) or None, max_workers=workers)
+    for result in results:
+        if result.ok:
+            click.echo("{} {:.3f}s".format(result.idp, result.duration))
+        else:
+            click.secho(
+                "{} FAILED {:.3f}s: {!r}".format(
+                    result.idp, result.duration, result.error
+                ),
+                fg="red",
+            )
+    if not all(result.ok for result in results):
+        raise click.exceptions.Exit(1)
+
+
+def _mock_idp(idp, key, cert, url):
+    """Build a mock IdP trusted by the SP for ``idp`` at ``url``.
+
+    :returns: The mock IdP, the registered SP and the URLs of the SSO and SLO
+        views of the SP.
+    """
+    # Only needed by the testing commands, not loaded with the CLI
+    from .testing import MockIdP
+
+    with current_app.test_request_context(base_url=url):
+        settings = current_sso_saml.get_runtime(idp).settings
+        sso_url = url_for("sso_saml.sso", idp=idp, _external=True)
+        slo_url = url_for("sso_saml.slo", idp=idp, _external=True)
+    mock = MockIdP(key.read(), cert.read(), settings.get_idp_data()["entityId"])
+    return mock, mock.add_service_provider(settings), sso_url, slo_url
+
+
+_MOCK_IDP_OPTIONS = [
+    click.argument("idp"),
+    click.option(
+        "--key",
+        type=click.File(),
+        required=True,
+        help="Private key (PEM) of the mock IdP.",
+    ),
+    click.option(
+        "--cert",
+        type=click.File(),
+        required=True,
+        help="Certificate (PEM) of the mock IdP, trusted by the IdP config.",
+    ),
+    click.option(
+        "--url",
+        default="https://127.0.0.1:5000",
+        show_default=True,
+        help="Base URL of the SP.",
+    ),
+]
+
+
+def _mock_idp_options(f):
+    """Add the options selecting the IdP config and the mock IdP keys."""
+    for option in reversed(_MOCK_IDP_OPTIONS):
+        f = option(f)
+    return f
+
+
+@saml.command("mock-idp")
+@_mock_idp_options
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=5001, show_default=True)
+@with_appcontext
+def mock_idp(idp, key, cert, url, host, port):
+    """Run a mock IdP answering the SP for IDP.
+
+    The IdP config must trust --cert and send its users to the ``/sso`` and
+    ``/slo`` of the mock IdP.
+    """
+    mock, _, _, _ = _mock_idp(idp, key, cert, url)
+    mock.create_app().run(host=host, port=port)
+
+
+@saml.command("load-test")
+@_mock_idp_options
+@click.option("--cycles", type=int, default=100, show_default=True)
+@click.option("--concurrency", type=int, default=10, show_default=True)
+@click.option(
+    "--in-process",
+    is_flag=True,
+    help="Run the views in this process instead of requesting --url.",
+)
+@click.option("--insecure", is_flag=True, help="Do not verify the HTTPS certificate.")
+@click.option(
+    "--idp-logout", is_flag=True, help="Log out with a LogoutRequest of the IdP."
+)
+@with_appcontext
+def load_test(
+    idp, key, cert, url, cycles, concurrency, in_process, insecure, idp_logout
+):
+    """Run login and logout cycles for IDP against a mock IdP.
+
+    The IdP config must trust --cert. Reports the latencies and errors of
+    each step and exits with 1 if any cycle failed.
+    """
+    from .testing import HTTPClient, LoadDriver, WSGIClient
+
+    mock, sp, sso_url, slo_url = _mock_idp(idp, key, cert, url)
+    if in_process:
+        client_factory = partial(WSGIClient, current_app._get_current_object())
+    else:
+        context = ssl._create_unverified_context() if insecure else None
+        client_factory = partial(HTTPClient, context=context)
+
+    driver = LoadDriver(
+        mock, sso_url, slo_url, sp.entity_id, client_factory, idp_logout=idp_logout
+    )
+    report = driver.run(cycles, concurrency=concurrency)
+    click.echo(report.format())
+    if report.failed_cycles:
+        raise click.exceptions.Exit(1)
@@ -10,6 +10,9 @@ SSO_SAML_SESSION_KEY_NAME_ID = "SSO::SAML::NameId"
 SSO_SAML_SESSION_KEY_SESSION_INDEX = "SSO::SAML::SessionIndex"
 """Key name to store the SSO Session Index in the session."""
 
+SSO_SAML_SESSION_KEY_REQUESTS = "SSO::SAML::Requests"
+"""Key name to store the IDs of the outstanding requests in the session."""
+
 SSO_SAML_PREPARE_FLASK_REQUEST_FUNCTION = "invenio_saml.utils.prepare_flask_request"
 """Default function to prepare the flask request to be sent to the IdP.
 
@@ -101,6 +104,8 @@ The structure of the dictionary is as follows:
             
             'settings_file_path': '/full/path/to/directory',
             'settings_url': 'https://...',
+            'federation': 'edugain',
+            'entity_id': 'https://...',
 
             "mappings": {
                 "email": "TODO",
@@ -116,6 +121,8 @@ The structure of the dictionary is as follows:
             'sls_handler': '...',
 
             'auto_confirm': True,
+            'attribute_projection': False,
+            'rate_limits': None,
         }
     }
 
@@ -139,7 +146,11 @@ The structure of the dictionary is as follows:
     URL parameter and update the settings found inside the configuration
     variable if any.
 :param settings_url: The URL to the IdPs metadata. This parameter will update
-    the values found inside the configuration variable if any.
+    the values found inside the configuration variable if any. The metadata
+    is refreshed in the background, see ``SSO_SAML_IDP_METADATA_TTL``.
+:param federation: Key of a federation in ``SSO_SAML_FEDERATIONS`` whose
+    aggregate metadata publishes the IdP.
+:param entity_id: The ``entityID`` of the IdP inside the ``federation``.
 :param settings_handler: Import path to settings handler. Python
     callable which receives two parameters, an instance of ``SAMLAuth`` and the
     current settings returned by``OneLogin_Saml2_Auth.get_settings``.
@@ -167,8 +178,74 @@ The structure of the dictionary is as follows:
 :param mappings: Key value pairs linking content coming from the IdP (attribute 
     response) and Invenio User properties. This key is mandatory when using the default
     acs handler in conjuction with the default account info extraction.
+    Values are attribute names or dictionaries with the ``attribute``, its
+    ``transforms``, whether it is ``required`` and a ``default``, see
+    :mod:`invenio_saml.mappings`. Responses missing required attributes are
+    rejected with the list of errors.
 :param auto_confirm: Automatically set `confirmed_at` for users upon registration, 
     when using the default ``acs_handler``.
+:param attribute_projection: Only read the attributes used in ``mappings``
+    from the responses, the other ones are skipped and not returned by
+    ``SAMLAuth.get_attributes``. Useful for IdPs releasing many attributes,
+    as long as the handlers do not need unmapped ones.
+:param rate_limits: Rate limits of the requests of the IdP, replacing
+    ``SSO_SAML_RATE_LIMITS``.
+"""
+
+
+SSO_SAML_FEDERATIONS = {}
+"""Federations whose aggregate metadata provides IdPs.
+
+Every IdP published in the aggregate is available under the name returned by
+:func:`invenio_saml.federation.federation_idp_name`, i.e.
+``<federation>-<digest of the entityID>``, and configured with the
+``defaults`` (same keys as an ``SSO_SAML_IDPS`` entry):
+
+.. code-block:: python
+
+    SSO_SAML_FEDERATIONS = {
+        'edugain': {
+            'metadata_file': '/path/to/edugain-v2.xml',
+            'defaults': {
+                'mappings': {...},
+                'acs_handler': acs_handler_factory(),
+            },
+        },
+    }
+
+An IdP of a federation can also be given a readable name by adding it to
+``SSO_SAML_IDPS`` with the ``federation`` and ``entity_id`` keys.
+
+The aggregate is stream-parsed into an index in
+``SSO_SAML_FEDERATION_CACHE_DIR`` by the warmup (see ``SSO_SAML_WARMUP``) or
+``invenio saml compile-metadata <federation>``. Otherwise it is compiled in a
+background thread when one of its IdPs is first requested, and its IdPs are
+unavailable (503) until then. When the file changes, it is compiled again in a
+background thread and the index of the former version is used meanwhile. Its
+signature is not verified, validate it when downloading it.
+
+For large aggregates, compile it offline with
+``invenio saml compile-metadata <federation>`` into the ``index_file`` of the
+federation. When ``index_file`` is set, it is memory-mapped read-only and
+shared by all the worker processes, and no XML is parsed at runtime:
+
+.. code-block:: python
+
+    SSO_SAML_FEDERATIONS = {
+        'edugain': {
+            'metadata_file': '/path/to/edugain-v2.xml',
+            'index_file': '/path/to/edugain-v2.idx',
+            'defaults': {...},
+        },
+    }
+"""
+
+SSO_SAML_FEDERATION_CACHE_DIR = None
+"""Directory of the indexes compiled from the ``metadata_file`` of the
+federations without an ``index_file``.
+
+The indexes are memory-mapped and shared by the worker processes. The
+instance folder of the application is used by default.
 """
 
 
@@ -189,6 +266,333 @@ SSO_SAML_DEFAULT_LOGOUT_HANDLER = None
 SSO_SAML_DEFAULT_SLS_HANDLER = default_sls_handler
 """Default SLS request handler."""
 
+SSO_SAML_METADATA_CACHE_TIMEOUT = 3600
+"""Seconds the rendered SP metadata is cached and may be cached by clients.
+
+The value is also sent as ``Cache-Control: max-age``. Keep it well below the
+metadata ``validUntil`` (two days by default). Set to ``0`` to render the
+metadata on every request.
+"""
+
+SSO_SAML_IDP_METADATA_TTL = 86400
+"""Maximum seconds the IdP metadata fetched from ``settings_url`` is used.
+
+The metadata is refreshed earlier if its ``validUntil`` or ``cacheDuration``
+says so. Refreshes happen in the background, the last good copy is served
+meanwhile.
+"""
+
+SSO_SAML_IDP_METADATA_RETRY = 300
+"""Seconds to wait before retrying a failed IdP metadata refresh.
+
+It is also the minimum time between two refreshes of the same metadata.
+"""
+
+SSO_SAML_IDP_METADATA_FETCH_TIMEOUT = 10
+"""Timeout in seconds of the IdP metadata download."""
+
+SSO_SAML_IDP_METADATA_PREFETCH = False
+"""Download the metadata of the ``settings_url`` of all ``SSO_SAML_IDPS`` in
+the background when the application starts.
+
+Otherwise it is downloaded by the first request of each IdP, unless the IdPs
+are built by the warm-up. Enable it in the web application only, not in the
+command line or the task workers, which create the application too.
+"""
+
+SSO_SAML_BUILD_FAILURE_TTL = 30
+"""Seconds a failure to build an IdP is remembered.
+
+Meanwhile requests for the IdP fail right away with the same error instead of
+building it again (e.g. downloading its metadata).
+"""
+
+SSO_SAML_RUNTIME_CHECK_INTERVAL = 5
+"""Seconds between the checks of the settings, certificate and key files of
+a built IdP.
+
+Its runtime is rebuilt on the next request once one of them changed. ``0``
+checks them on every request, ``None`` never.
+"""
+
+SSO_SAML_REPLAY_CACHE_FACTORY = "invenio_saml.replay.memory_replay_cache_factory"
+"""Factory of the cache used to reject replayed assertions.
+
+Callable, or import path to it, receiving the application and returning a
+:class:`invenio_saml.replay.ReplayCache`. The default cache lives in the
+process, use ``invenio_saml.replay.redis_replay_cache_factory`` to share it
+between workers. Set to ``None`` to disable replay detection.
+"""
+
+SSO_SAML_REPLAY_CACHE_SIZE = 100000
+"""Maximum number of assertion IDs kept by the in-process replay cache."""
+
+SSO_SAML_REPLAY_CACHE_TTL = 3600
+"""Seconds an assertion ID without expiration is remembered."""
+
+SSO_SAML_REQUEST_STORE_FACTORY = (
+    "invenio_saml.authn_requests.memory_request_store_factory"
+)
+"""Factory of the store of the outstanding authentication requests.
+
+Callable, or import path to it, receiving the application and returning a
+:class:`invenio_saml.authn_requests.RequestStore`. The default store lives in
+the process, use ``invenio_saml.authn_requests.redis_request_store_factory``
+to share it between workers. Set to ``None`` to disable it.
+"""
+
+SSO_SAML_REQUEST_STORE_SIZE = 100000
+"""Maximum number of outstanding requests kept by the in-process store."""
+
+SSO_SAML_REQUEST_STORE_SESSION_SIZE = 5
+"""Maximum number of outstanding requests per session.
+
+When a session starts more logins, its oldest requests are forgotten.
+"""
+
+SSO_SAML_REQUEST_TTL = 600
+"""Seconds a login may take before its request is forgotten."""
+
+SSO_SAML_SOLICITED_ONLY = False
+"""Only accept responses to an outstanding request sent to the same IdP.
+
+Unsolicited (IdP-initiated) responses and responses to unknown or expired
+requests are then rejected. Otherwise they are accepted, and only responses
+to a known request are checked against it.
+
+Responses to the requests of another session are rejected too. Responses
+posted without the session cookie, e.g. with ``SameSite=Lax``, answer no
+request of the session, so they are only accepted as unsolicited ones.
+"""
+
+SSO_SAML_USER_CACHE_FACTORY = None
+"""Factory of the cache of the user IDs of the external identities.
+
+Callable, or import path to it, receiving the application and returning a
+:class:`invenio_saml.user_cache.UserCache`. When set, returning users are
+fetched by primary key instead of through their identity. Use
+``invenio_saml.user_cache.memory_user_cache_factory`` for a cache in the
+process, which only sees the unlinked identities and deactivated users of its
+own process before ``SSO_SAML_USER_CACHE_TTL``, or
+``invenio_saml.user_cache.redis_user_cache_factory`` to share it between
+workers. Disabled by default.
+"""
+
+SSO_SAML_USER_CACHE_SIZE = 100000
+"""Maximum number of identities kept by the in-process user ID cache."""
+
+SSO_SAML_USER_CACHE_TTL = 300
+"""Seconds the user ID of an identity is cached."""
+
+SSO_SAML_SERVER_TIMING = False
+"""Add the duration of the phases of the SAML requests to their responses.
+
+The phases, e.g. decoding, decrypting and verifying the response, looking up,
+registering and logging in the user, are sent in a ``Server-Timing`` header.
+It reveals how the requests are processed, enable it for debugging only.
+"""
+
+SSO_SAML_METRICS_SINK_FACTORY = None
+"""Factory of the sink receiving the duration of the phases of the requests.
+
+Callable, or import path to it, receiving the application and returning a
+:class:`invenio_saml.metrics.MetricsSink`, e.g.
+``invenio_saml.metrics.prometheus_metrics_sink_factory`` which records them
+in a Prometheus histogram per IdP, endpoint and phase. Disabled by default.
+
+The sink also counts the requests and records their duration per IdP,
+endpoint and outcome. Use ``invenio_saml.metrics.in_process_metrics_factory``
+to keep them in the process and expose them on ``SSO_SAML_METRICS_ROUTE``.
+"""
+
+SSO_SAML_METRICS_ROUTE = None
+"""URL route, under the blueprint prefix, exposing the metrics of the sink in
+the Prometheus text format, e.g. ``"/metrics"``.
+
+The route is not protected, restrict its access e.g. in the reverse proxy.
+Not exposed by default.
+"""
+
+SSO_SAML_METRICS_DIR = None
+"""Directory where the worker processes write their in-process metrics.
+
+Set it when running several workers, e.g. with gunicorn, so that the metrics
+route adds up the metrics of all of them. It should be emptied when the
+application is deployed.
+"""
+
+SSO_SAML_METRICS_FLUSH_INTERVAL = 5
+"""Seconds between two writes of the metrics of a worker to
+``SSO_SAML_METRICS_DIR``."""
+
+SSO_SAML_TRACE_SAMPLE_RATE = 1
+"""Trace the SAML messages of one in this many requests.
+
+The messages, metadata and attributes are traced at the debug level by the
+``saml`` child of the application logger, see :mod:`invenio_saml.tracing`.
+Nothing is built unless that logger is enabled for debug.
+"""
+
+SSO_SAML_TRACE_IDPS = None
+"""Keys of the IdPs whose SAML messages are traced, all of them if ``None``."""
+
+SSO_SAML_TRACE_MAX_SIZE = 4096
+"""Maximum number of characters of a traced message, ``None`` for no limit."""
+
+SSO_SAML_TRACE_REDACT = True
+"""Redact the attribute values, signatures, certificates and encrypted data
+of the traced messages, and the values of the traced attributes."""
+
+SSO_SAML_TRACE_QUEUE_SIZE = 0
+"""Number of traces buffered for a background thread, which formats them and
+passes them to the handlers of the application logger.
+
+The traces are dropped when the buffer is full instead of blocking the
+requests. Disabled by default, the traces are then logged by the request.
+"""
+
+SSO_SAML_KEY_CACHE_SIZE = 0
+"""Number of parsed keys and certificates kept by the process, see
+:mod:`invenio_saml.keys`, ``0`` to disable it (the default).
+
+OneLogin then parses each certificate and key of the settings once instead of
+on each signature, verification and decryption. They are cached by content,
+and the keys of an IdP are dropped when its files change (see
+``SSO_SAML_RUNTIME_CHECK_INTERVAL``). The cache replaces functions of
+OneLogin for the whole process, so it is shared by all its applications.
+"""
+
+SSO_SAML_XML_CACHE = False
+"""Keep the compiled XSD schemas and parse the XML with hardened parsers, see
+:mod:`invenio_saml.xml_utils`.
+
+OneLogin otherwise compiles the schema of the SAML protocol on each
+validation of a message. It replaces private functions of OneLogin for the
+whole process, so it applies to all its applications.
+"""
+
+SSO_SAML_MAX_XML_SIZE = 512 * 1024
+"""Maximum size in bytes of the XML of the SAML messages processed by the
+ACS and SLS, ``None`` for no limit.
+
+Larger messages are rejected before being parsed, with
+``SSO_SAML_XML_CACHE``, and before being decoded, with
+``SSO_SAML_PREVALIDATION``.
+"""
+
+SSO_SAML_PREVALIDATION = True
+"""Reject the oversized or malformed SAML messages of the ACS and SLS before
+processing them, see :mod:`invenio_saml.prevalidation`.
+
+They are answered with a 400 and the reason of the rejection, which is also
+the outcome of the request in the metrics.
+"""
+
+SSO_SAML_MAX_MESSAGE_SIZE = 1024 * 1024
+"""Maximum size of the base64 encoded SAML messages, ``None`` for no limit.
+
+The decoded messages are limited by ``SSO_SAML_MAX_XML_SIZE``. Only enforced
+with ``SSO_SAML_PREVALIDATION``. The request bodies are parsed before, limit
+them with ``MAX_CONTENT_LENGTH``.
+"""
+
+SSO_SAML_MAX_INFLATE_RATIO = 100
+"""Maximum ratio of the inflated to the deflated size of the SAML messages of
+the HTTP-Redirect binding, ``None`` for no limit.
+
+Only enforced with ``SSO_SAML_PREVALIDATION``.
+"""
+
+SSO_SAML_RATE_LIMITS = {}
+"""Rate limits of the requests of each IdP, by endpoint, see
+:mod:`invenio_saml.admission`.
+
+Maps ``"sso"`` and ``"acs"`` to the number of requests per second and the
+burst of a token bucket, e.g. ``{"sso": (20, 200), "acs": (20, 200)}``. The
+requests over the limit are answered with a 429. IdPs can have their own
+limits with the ``rate_limits`` key of their configuration. The IdPs not in
+``SSO_SAML_IDPS`` share one token bucket until they are built, e.g. those of
+the federations.
+"""
+
+SSO_SAML_RATE_LIMITER_FACTORY = "invenio_saml.admission.memory_rate_limiter_factory"
+"""Factory of the token buckets of ``SSO_SAML_RATE_LIMITS``.
+
+Callable, or import path to it, receiving the application and returning a
+:class:`invenio_saml.admission.RateLimiter`. The default buckets live in the
+process, use ``invenio_saml.admission.redis_rate_limiter_factory`` to share
+them between workers.
+"""
+
+SSO_SAML_ACS_CONCURRENCY = None
+"""Maximum number of ACS requests executed at once by a process, ``None`` for
+no limit.
+
+Keep it below the size of the database connection pool. The requests over the
+limit wait in a queue.
+"""
+
+SSO_SAML_ACS_QUEUE_SIZE = 32
+"""Maximum number of ACS requests waiting to be executed by a process.
+
+The requests over it are answered with a 503.
+"""
+
+SSO_SAML_ACS_QUEUE_TIMEOUT = 2
+"""Maximum number of seconds an ACS request waits to be executed.
+
+It is then answered with a 503.
+"""
+
+SSO_SAML_OFFLOAD_WORKERS = 0
+"""Number of worker processes decoding, decrypting and validating the SAML
+responses, see :mod:`invenio_saml.offload`.
+
+Decrypting the assertions and verifying their signatures then no longer
+holds the GIL of the request threads. Each application process, e.g. each
+gunicorn worker, starts its own pool in the background on its first
+response, and processes the responses itself until the pool is started.
+Disabled by default, the responses are then processed by the request
+threads.
+"""
+
+SSO_SAML_OFFLOAD_QUEUE_SIZE = 16
+"""Number of SAML responses waiting for a worker process.
+
+Further responses are answered with a 503 instead of being queued.
+"""
+
+SSO_SAML_OFFLOAD_TIMEOUT = 5
+"""Seconds to wait for a worker process to process a SAML response before
+answering with a 503."""
+
+SSO_SAML_OFFLOAD_START_METHOD = "spawn"
+"""``multiprocessing`` start method of the worker processes.
+
+Forking a threaded application is unsafe, the default starts the workers
+from a fresh interpreter.
+"""
+
+SSO_SAML_WARMUP = False
+"""Build the runtime of all ``SSO_SAML_IDPS`` when the application starts.
+
+Otherwise each IdP is built on its first request. The IdPs can also be built
+with ``invenio saml warmup``. Failures are logged and do not prevent the
+application from starting.
+"""
+
+SSO_SAML_WARMUP_WORKERS = 4
+"""Number of IdPs built in parallel during the warm-up."""
+
+SSO_SAML_WARMUP_BASE_URL = None
+"""Base URL (e.g. ``https://example.org``) used to generate the SP URLs during
+the warm-up.
+
+Needed when ``SERVER_NAME`` is not set, because there is no request to take
+the host from. It must be the URL the users reach the application at, and
+its host one of the ``TRUSTED_HOSTS``.
+"""
+
 # Blueprint and routes default configuration
 
 SSO_SAML_DEFAULT_BLUEPRINT_PREFIX = "/saml"
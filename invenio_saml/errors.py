@@ -6,3 +6,66 @@
 
 class IdentityProviderNotFound(Exception):
     """Raised when the identity provider is not found in the configuration."""
+
+
+class FederationUnavailable(Exception):
+    """Raised when the metadata of a federation is not compiled yet."""
+
+
+class AttributeMappingError(Exception):
+    """Raised when the attributes of a response do not match the mappings."""
+
+    def __init__(self, errors):
+        """Initialize the error.
+
+        :param errors: List of dictionaries with the ``field``, ``attribute``
+            and ``error`` (``missing``, ``invalid`` or ``not_mapped``) of each
+            failing field.
+        """
+        super().__init__(errors)
+        self.errors = errors
+
+
+class OffloadUnavailable(Exception):
+    """Raised when a SAML response cannot be processed by a worker process."""
+
+
+class MessageRejected(ValueError):
+    """Raised when a SAML message is rejected before being processed."""
+
+    def __init__(self, reason, detail=None):
+        """Initialize the error.
+
+        :param reason: Reason of the rejection, see
+            :data:`invenio_saml.prevalidation.REASONS`.
+        :param detail: Optional description of the rejected message.
+        """
+        super().__init__(reason, detail)
+        self.reason = reason
+        self.detail = detail
+
+    def __str__(self):
+        """Describe the error."""
+        if self.detail is None:
+            return self.reason
+        return "{}: {}".format(self.reason, self.detail)
+
+
+class XMLTooLarge(ValueError):
+    """Raised when a SAML message exceeds the maximum XML size."""
+
+    def __init__(self, size, max_size):
+        """Initialize the error.
+
+        :param size: Size of the XML document in bytes.
+        :param max_size: Maximum size in bytes.
+        """
+        super().__init__(size, max_size)
+        self.size = size
+        self.max_size = max_size
+
+    def __str__(self):
+        """Describe the error."""
+        return "XML document of {} bytes exceeds {} bytes".format(
+            self.size, self.max_size
+        )
@@ -4,17 +4,34 @@
 """Invenio module that provides SAML integration."""
 
 import json
+import threading
+import time
 from collections.abc import Mapping
-from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 
-from flask import url_for
+from flask import session, url_for
+from onelogin.saml2.errors import OneLogin_Saml2_Error
 from onelogin.saml2.idp_metadata_parser import OneLogin_Saml2_IdPMetadataParser
 from werkzeug.utils import cached_property, import_string
 
 from . import config
-from .errors import IdentityProviderNotFound
+from .admission import ConcurrencyLimiter
+from .authn_requests import OutstandingRequest, SessionRequests
+from .errors import FederationUnavailable, IdentityProviderNotFound
+from .federation import FederationMetadata
+from .idp_metadata import RemoteMetadataCache
+from .index import MetadataIndex
+from .keys import discard_key_material, get_key_cache, install_key_cache
+from .mappings import ACCOUNT_FIELDS, AttributeExtractor
+from .metadata import SPMetadataCache
+from .offload import ResponsePool
+from .runtime import IdentityProviderRuntime
+from .tracing import create_trace_logger
+from .user_cache import register_invalidation
 from .utils import SAMLAuth, prepare_flask_request
 from .views import create_blueprint
+from .xml_utils import install_xml_cache
 
 
 def _default_config(idp):
@@ -71,6 +88,8 @@ def _default_config(idp):
         },
         settings_file_path=None,
         settings_url=None,
+        federation=None,
+        entity_id=None,
         sp_cert_file=None,
         sp_key_file=None,
         settings_handler=None,
@@ -78,22 +97,31 @@ def _default_config(idp):
         acs_handler=None,
         logout_handler=None,
         sls_handler=None,
+        attribute_projection=False,
+        rate_limits=None,
     )
 
 
-def _cached_configuration(f):
-    """Cache the IdP configuration for future use."""
+class WarmupResult(object):
+    """Outcome of building the runtime of an IdP ahead of time."""
 
-    @wraps(f)
-    def inner(self, idp, *args, **kwargs):
-        if idp not in self._saml_config:
-            try:
-                self._saml_config[idp] = self._build_configuration(idp)
-            except KeyError as exc:
-                raise IdentityProviderNotFound() from exc
-        return f(self, idp, *args, **kwargs)
+    __slots__ = ("idp", "duration", "error")
 
-    return inner
+    def __init__(self, idp, duration, error=None):
+        """Initialize the result.
+
+        :param idp: Identity provider key.
+        :param duration: Seconds it took to build the runtime.
+        :param error: Exception raised while building it, if any.
+        """
+        self.idp = idp
+        self.duration = duration
+        self.error = error
+
+    @property
+    def ok(self):
+        """Whether the runtime was built."""
+        return self.error is None
 
 
 class _InvenioSSOSAMLState(object):
@@ -103,6 +131,16 @@ class _InvenioSSOSAMLState(object):
         """Initialize state."""
         self.app = app
         self._saml_config = {}
+        self._build_failures = {}
+        self._stale_checks = {}
+        # Lock striping keeps the number of locks bounded whatever IdP names
+        # are requested.
+        self._build_locks = tuple(threading.Lock() for _ in range(64))
+        self.metadata_cache = SPMetadataCache()
+        self.federations = {}
+        self.idp_metadata = RemoteMetadataCache(
+            app, on_refresh=self._on_idp_metadata_refresh
+        )
 
     @property
     def url_prefix(self):
@@ -134,6 +172,11 @@ class _InvenioSSOSAMLState(object):
         """SSO SLS URL from config."""
         return self.app.config["SSO_SAML_DEFAULT_SLS_ROUTE"]
 
+    @property
+    def metrics_url(self):
+        """Metrics URL from config, ``None`` if not exposed."""
+        return self.app.config["SSO_SAML_METRICS_ROUTE"]
+
     @cached_property
     def prepare_flask_request(self):
         """Function to prepare flask request for OneLogin."""
@@ -142,19 +185,471 @@ class _InvenioSSOSAMLState(object):
             prep_func = import_string(prep_func)
         return prep_func
 
-    @_cached_configuration
+    @cached_property
+    def replay_cache(self):
+        """Replay cache of assertion IDs or ``None`` if disabled."""
+        factory = self.app.config["SSO_SAML_REPLAY_CACHE_FACTORY"]
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        return factory(self.app) if factory else None
+
+    def is_replayed(self, auth):
+        """Check whether the processed response of ``auth`` is a replay.
+
+        The assertion ID (or the response ID if there is none) is remembered
+        until the assertion expires, or for ``SSO_SAML_REPLAY_CACHE_TTL``
+        seconds if it has no expiration.
+        """
+        cache = self.replay_cache
+        if cache is None:
+            return False
+        message_id = auth.get_last_assertion_id() or auth.get_last_message_id()
+        if not message_id:
+            return False
+        expires = auth.get_last_assertion_not_on_or_after() or (
+            time.time() + self.app.config["SSO_SAML_REPLAY_CACHE_TTL"]
+        )
+        return not cache.add("{}:{}".format(auth.idp, message_id), expires)
+
+    @cached_property
+    def user_cache(self):
+        """Cache of the user IDs of the external identities or ``None``."""
+        factory = self.app.config["SSO_SAML_USER_CACHE_FACTORY"]
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        return factory(self.app) if factory else None
+
+    @cached_property
+    def metrics_sink(self):
+        """Sink of the durations of the request phases or ``None``."""
+        factory = self.app.config["SSO_SAML_METRICS_SINK_FACTORY"]
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        return factory(self.app) if factory else None
+
+    @cached_property
+    def response_pool(self):
+        """Pool of processes processing the SAML responses or ``None``.
+
+        Its processes are started in the background on the first response,
+        with the settings of the IdPs built so far, see
+        :class:`invenio_saml.offload.ResponsePool`.
+        """
+        config = self.app.config
+        if not config["SSO_SAML_OFFLOAD_WORKERS"]:
+            return None
+        pool = ResponsePool(
+            config["SSO_SAML_OFFLOAD_WORKERS"],
+            queue_size=config["SSO_SAML_OFFLOAD_QUEUE_SIZE"],
+            timeout=config["SSO_SAML_OFFLOAD_TIMEOUT"],
+            start_method=config["SSO_SAML_OFFLOAD_START_METHOD"],
+        )
+        pool.start(
+            [runtime.settings for runtime in self._saml_config.values()], wait=False
+        )
+        return pool
+
+    @cached_property
+    def rate_limiter(self):
+        """Token buckets of the requests or ``None``.
+
+        See :mod:`invenio_saml.admission`.
+        """
+        factory = self.app.config["SSO_SAML_RATE_LIMITER_FACTORY"]
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        return factory(self.app) if factory else None
+
+    @cached_property
+    def acs_limiter(self):
+        """Limit of the ACS requests executed at once or ``None``."""
+        config = self.app.config
+        if not config["SSO_SAML_ACS_CONCURRENCY"]:
+            return None
+        return ConcurrencyLimiter(
+            config["SSO_SAML_ACS_CONCURRENCY"],
+            queue_size=config["SSO_SAML_ACS_QUEUE_SIZE"],
+            timeout=config["SSO_SAML_ACS_QUEUE_TIMEOUT"],
+        )
+
+    def get_rate_limit(self, idp, endpoint):
+        """Get the rate limit of the requests of an IdP to an endpoint.
+
+        The limits are read from the configuration, so that they also apply
+        to the IdPs which are not built yet. The IdPs which are neither in
+        ``SSO_SAML_IDPS`` nor built, e.g. those of a federation or unknown
+        ones, share a token bucket, so that any IdP name requested does not
+        create one.
+
+        :returns: The key of the token bucket, the requests per second and
+            the burst, or ``None``.
+        """
+        idp_config = self.app.config["SSO_SAML_IDPS"].get(idp)
+        if idp_config is None:
+            runtime = self._saml_config.get(idp)
+            idp_config = runtime.config if runtime is not None else None
+        limits = idp_config.get("rate_limits") if idp_config is not None else None
+        if limits is None:
+            limits = self.app.config["SSO_SAML_RATE_LIMITS"]
+        limit = limits.get(endpoint)
+        if limit is None:
+            return None
+        key = "{}:{}".format(idp if idp_config is not None else "*", endpoint)
+        return (key,) + tuple(limit)
+
+    @cached_property
+    def trace_logger(self):
+        """Logger of the SAML messages, see :mod:`invenio_saml.tracing`."""
+        return create_trace_logger(self.app)
+
+    def is_known_idp(self, idp):
+        """Whether ``idp`` was requested and built successfully."""
+        return idp in self._saml_config
+
+    @cached_property
+    def request_store(self):
+        """Store of the outstanding authentication requests or ``None``."""
+        factory = self.app.config["SSO_SAML_REQUEST_STORE_FACTORY"]
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        return factory(self.app) if factory else None
+
+    def remember_request(self, auth, relay_state=None):
+        """Remember the ``AuthnRequest`` just created by ``auth``.
+
+        Its ID is also kept in the session, which forgets its oldest requests
+        past ``SSO_SAML_REQUEST_STORE_SESSION_SIZE``.
+        """
+        store = self.request_store
+        request_id = auth.get_last_request_id()
+        if store is None or not request_id:
+            return
+        config = self.app.config
+        store.add(
+            OutstandingRequest(request_id, auth.idp, relay_state=relay_state),
+            config["SSO_SAML_REQUEST_TTL"],
+        )
+        key = config["SSO_SAML_SESSION_KEY_REQUESTS"]
+        size = max(1, config["SSO_SAML_REQUEST_STORE_SESSION_SIZE"])
+        request_ids = session.get(key, []) + [request_id]
+        for forgotten in request_ids[:-size]:
+            store.discard(forgotten)
+        session[key] = request_ids[-size:]
+
+    def get_session_requests(self):
+        """Get the outstanding requests of the session.
+
+        :returns: The :class:`invenio_saml.authn_requests.SessionRequests`,
+            to validate the responses with.
+        """
+        key = self.app.config["SSO_SAML_SESSION_KEY_REQUESTS"]
+        return SessionRequests(session.get(key, ()))
+
+    def pop_request(self, auth):
+        """Get and forget the request answered by the response of ``auth``.
+
+        Only the requests of the session are answered, see
+        :meth:`get_session_requests`.
+
+        :returns: The :class:`invenio_saml.authn_requests.OutstandingRequest`
+            or ``None`` if the response is unsolicited, or answers a request
+            of another session, an unknown or expired request or one sent to
+            another IdP.
+        """
+        store = self.request_store
+        request_id = auth.get_last_response_in_response_to()
+        if store is None or not request_id:
+            return None
+        key = self.app.config["SSO_SAML_SESSION_KEY_REQUESTS"]
+        request_ids = session.get(key, [])
+        if request_id not in request_ids:
+            return None
+        session[key] = [i for i in request_ids if i != request_id]
+        request = store.pop(request_id)
+        if request is None or request.idp != auth.idp:
+            return None
+        return request
+
+    def get_runtime(self, idp):
+        """Get the compiled runtime of a particular Identity Provider.
+
+        It is built on the first request for the IdP, and again once any of
+        the files it was built from changed, which is checked at most every
+        ``SSO_SAML_RUNTIME_CHECK_INTERVAL`` seconds. The returned object must
+        be used as is instead of being looked up again, the runtime of the IdP
+        can be invalidated meanwhile.
+        """
+        runtime = self._saml_config.get(idp)
+        if runtime is not None and self._check_stale(runtime):
+            self._invalidate_stale(runtime)
+            runtime = None
+        if runtime is None:
+            return self._build_runtime(idp)
+        if runtime.config["settings_url"]:
+            # Schedules a background refresh if the IdP metadata expired
+            self.idp_metadata.get(runtime.config["settings_url"])
+        return runtime
+
     def get_settings(self, idp):
         """Find settings for a particular Identity Provider."""
-        return self._saml_config[idp]["settings"]
+        return self.get_runtime(idp).config["settings"]
 
-    @_cached_configuration
     def get_handler(self, idp, handler):
         """Get handler for idp."""
-        return self._saml_config[idp][handler]
+        return self.get_runtime(idp).handlers[handler]
+
+    def get_federation(self, name, wait=False):
+        """Get the (lazily loaded) metadata index of a federation.
+
+        The compiled ``index_file`` is used when configured, otherwise the
+        ``metadata_file`` aggregate is compiled into an index in
+        ``SSO_SAML_FEDERATION_CACHE_DIR``. Unless ``wait`` is set, it is
+        compiled in a background thread and the index of the former version of
+        the aggregate is used meanwhile, see
+        :meth:`invenio_saml.federation.FederationMetadata.load`. The
+        ``compile-metadata`` command and :meth:`warmup` compile it beforehand.
+
+        :param wait: Compile the index of the aggregate in the calling thread.
+        :raises KeyError: If the federation is not configured.
+        :raises invenio_saml.errors.FederationUnavailable: If the aggregate
+            was never compiled and ``wait`` is not set.
+        """
+        config = self.app.config["SSO_SAML_FEDERATIONS"][name]
+        federation = self.federations.get(name)
+        if config.get("index_file"):
+            if federation is None or federation.is_stale():
+                federation = MetadataIndex(config["index_file"])
+                self.federations[name] = federation
+            return federation
+        if federation is None:
+            federation = self.federations.setdefault(
+                name,
+                FederationMetadata(
+                    name,
+                    config["metadata_file"],
+                    cache_dir=self.app.config["SSO_SAML_FEDERATION_CACHE_DIR"]
+                    or self.app.instance_path,
+                ),
+            )
+        return federation.load(wait=wait)
+
+    def get_idp_config(self, idp):
+        """Get the configuration of an IdP as provided by the user.
+
+        IdPs are looked up in ``SSO_SAML_IDPS`` first and then among the IdPs
+        published by the ``SSO_SAML_FEDERATIONS``.
+
+        :raises KeyError: If the IdP is not configured.
+        """
+        idps = self.app.config["SSO_SAML_IDPS"]
+        if idp in idps:
+            return idps[idp]
+        for name, federation_config in self.app.config["SSO_SAML_FEDERATIONS"].items():
+            if not idp.startswith(name + "-"):
+                continue
+            entity_id = self.get_federation(name).resolve(idp)
+            if entity_id:
+                return dict(
+                    federation_config.get("defaults", {}),
+                    federation=name,
+                    entity_id=entity_id,
+                )
+        raise KeyError(idp)
+
+    def get_attribute_extractor(self, idp):
+        """Get the compiled ``mappings`` of an IdP.
+
+        They are compiled with its runtime, see :meth:`get_runtime`. The
+        mappings of an IdP whose settings are incomplete, so that no runtime
+        can be built, are compiled on each call.
+
+        :raises invenio_saml.errors.IdentityProviderNotFound: If the IdP is
+            unknown.
+        """
+        try:
+            return self.get_runtime(idp).extractor
+        except OneLogin_Saml2_Error:
+            mappings = self.get_idp_config(idp).get("mappings") or {}
+            return AttributeExtractor(mappings, ACCOUNT_FIELDS)
+
+    def warmup(self, idps=None, max_workers=None):
+        """Build the runtime of IdPs before they are requested.
+
+        Runtimes are built in parallel by a bounded thread pool. No request is
+        needed: each build runs in an application context, or in a request
+        context for ``SSO_SAML_WARMUP_BASE_URL`` if set, so that the SP URLs
+        can be generated. It can thus run before the workers are forked. The
+        metadata of the federations is compiled first.
+
+        :param idps: IdP keys to build, defaults to all ``SSO_SAML_IDPS``.
+        :param max_workers: Size of the thread pool, defaults to
+            ``SSO_SAML_WARMUP_WORKERS``.
+        :returns: List of :class:`WarmupResult`, in the order of ``idps``.
+        """
+        # Compile the federations first, their IdPs are not built until then
+        for name in self.app.config["SSO_SAML_FEDERATIONS"]:
+            try:
+                self.get_federation(name, wait=True)
+            except Exception as exc:
+                self.app.logger.error(
+                    "Compiling SAML federation {} failed: {!r}".format(name, exc)
+                )
+        if idps is None:
+            idps = list(self.app.config["SSO_SAML_IDPS"])
+        max_workers = max_workers or self.app.config["SSO_SAML_WARMUP_WORKERS"]
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="saml-warmup"
+        ) as executor:
+            results = list(executor.map(self._warmup_idp, idps))
+
+        for result in results:
+            if result.ok:
+                self.app.logger.info(
+                    "Built SAML IdP {} in {:.3f}s".format(result.idp, result.duration)
+                )
+            else:
+                self.app.logger.error(
+                    "Building SAML IdP {} failed after {:.3f}s: {!r}".format(
+                        result.idp, result.duration, result.error
+                    )
+                )
+        return results
+
+    def _warmup_idp(self, idp):
+        """Build the runtime of one IdP outside of a request."""
+        base_url = self.app.config["SSO_SAML_WARMUP_BASE_URL"]
+        if base_url:
+            ctx = self.app.test_request_context(base_url=base_url)
+        else:
+            ctx = self.app.app_context()
+        start = time.perf_counter()
+        try:
+            with ctx:
+                self.get_runtime(idp)
+        except Exception as exc:
+            return WarmupResult(idp, time.perf_counter() - start, exc)
+        return WarmupResult(idp, time.perf_counter() - start)
+
+    def get_cached_sp_metadata(self, idp):
+        """Get the cached SP metadata for an Identity Provider or ``None``.
+
+        The runtime of the IdP is rebuilt first if any of its certificate,
+        key or settings files has changed since it was built.
+        """
+        runtime = self.get_runtime(idp)
+        if runtime.is_stale():
+            self._invalidate_stale(runtime)
+            return None
+        return self.metadata_cache.get(runtime)
+
+    def cache_sp_metadata(self, idp, xml):
+        """Cache the rendered SP metadata of an Identity Provider."""
+        return self.metadata_cache.set(
+            self.get_runtime(idp),
+            xml,
+            self.app.config["SSO_SAML_METADATA_CACHE_TIMEOUT"],
+        )
+
+    def invalidate(self, idp=None):
+        """Drop the built runtime and cached metadata of one or all IdPs.
+
+        They will be built again, from the current configuration, on the next
+        request.
+        """
+        if idp is None:
+            self._saml_config.clear()
+            self._build_failures.clear()
+            self._stale_checks.clear()
+            self.federations.clear()
+        else:
+            self._saml_config.pop(idp, None)
+            self._build_failures.pop(idp, None)
+            self._stale_checks.pop(idp, None)
+        self.metadata_cache.invalidate(idp)
+
+    def _check_stale(self, runtime):
+        """Whether a runtime is stale, checked at most once per interval."""
+        interval = self.app.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"]
+        if interval is None:
+            return False
+        now = time.monotonic()
+        checked = self._stale_checks.get(runtime.idp)
+        if checked is not None and now - checked < interval:
+            return False
+        self._stale_checks[runtime.idp] = now
+        return runtime.is_stale()
+
+    def _invalidate_stale(self, runtime):
+        """Invalidate a stale runtime unless it was already rebuilt.
+
+        Its keys are dropped from the key cache too, the files they were read
+        from may have been replaced.
+        """
+        if self._saml_config.get(runtime.idp) is runtime:
+            self.invalidate(runtime.idp)
+            cache = get_key_cache()
+            if cache is not None:
+                discard_key_material(runtime.settings, cache)
+
+    def _on_idp_metadata_refresh(self, url):
+        """Rebuild the IdPs using the refreshed remote metadata."""
+        for idp, runtime in list(self._saml_config.items()):
+            if runtime.config["settings_url"] == url:
+                self.invalidate(idp)
 
     def get_auth(self, idp):
-        """Instantiate the IdP."""
-        return SAMLAuth(idp, self.get_settings(idp))
+        """Instantiate the IdP.
+
+        The validated ``OneLogin_Saml2_Settings`` object of the IdP runtime is
+        shared by all the requests instead of being rebuilt on each of them,
+        each request uses a shallow copy of it.
+        With ``attribute_projection``, only the mapped attributes are read
+        from the responses.
+        """
+        runtime = self.get_runtime(idp)
+        projection = None
+        if runtime.config.get("attribute_projection"):
+            projection = runtime.extractor.attributes
+        return SAMLAuth(idp, runtime.settings, projection=projection)
+
+    def _build_runtime(self, idp):
+        """Build and cache the runtime of an IdP, once.
+
+        Concurrent requests for an IdP which is not built yet wait for a single
+        build instead of all building it. A failed build is remembered for
+        ``SSO_SAML_BUILD_FAILURE_TTL`` seconds and its error raised again
+        meanwhile, so that a broken IdP is not rebuilt on every request.
+
+        :returns: The :class:`invenio_saml.runtime.IdentityProviderRuntime`.
+        """
+        with self._build_locks[hash(idp) % len(self._build_locks)]:
+            runtime = self._saml_config.get(idp)
+            if runtime is not None:
+                return runtime
+
+            failure = self._build_failures.get(idp)
+            if failure is not None:
+                retry_at, error = failure
+                if time.monotonic() < retry_at:
+                    raise error.with_traceback(None)
+                del self._build_failures[idp]
+
+            try:
+                runtime = IdentityProviderRuntime(idp, self._build_configuration(idp))
+            except KeyError as exc:
+                raise IdentityProviderNotFound() from exc
+            except FederationUnavailable:
+                # Not a failure of the IdP, it is built once compiled
+                raise
+            except Exception as exc:
+                self._build_failures[idp] = (
+                    time.monotonic() + self.app.config["SSO_SAML_BUILD_FAILURE_TTL"],
+                    exc,
+                )
+                raise
+            self._saml_config[idp] = runtime
+            self._stale_checks[idp] = time.monotonic()
+            return runtime
 
     def _build_configuration(self, idp):
         """Update default config with the ones read from configuration."""
@@ -176,14 +671,21 @@ class _InvenioSSOSAMLState(object):
             )
 
         config = _default_config(idp)
-        update(config, self.app.config["SSO_SAML_IDPS"][idp])
+        update(config, self.get_idp_config(idp))
 
-        # Read IdP config from file or URL if any
-        if config["settings_url"]:
-            external_conf = OneLogin_Saml2_IdPMetadataParser.parse_remote(
-                config["settings_url"]
-            )
+        # Read IdP config from a federation, file or URL if any
+        if config["federation"]:
+            federation = self.get_federation(config["federation"])
+            external_conf = federation.get_settings(config["entity_id"])
             config["settings"]["idp"].update(external_conf.get("idp"))
+            # The runtime is rebuilt when the federation file changes, or when
+            # the index served is replaced by the one of its new version
+            config["federation_file"] = federation.path
+            config["federation_index"] = federation.index_path
+
+        if config["settings_url"]:
+            external_conf = self.idp_metadata.get(config["settings_url"])
+            config["settings"]["idp"].update(deepcopy(external_conf.get("idp")))
 
         if config["settings_file_path"]:
             with open(config["settings_file_path"], "r") as idp:
@@ -250,6 +752,25 @@ class InvenioSSOSAML(object):
         app.register_blueprint(create_blueprint(state, __name__))
 
         app.extensions["invenio-sso-saml"] = state
+
+        if app.config["SSO_SAML_USER_CACHE_FACTORY"]:
+            register_invalidation()
+
+        if app.config["SSO_SAML_KEY_CACHE_SIZE"]:
+            install_key_cache(app.config["SSO_SAML_KEY_CACHE_SIZE"])
+
+        if app.config["SSO_SAML_XML_CACHE"]:
+            install_xml_cache()
+
+        if app.config["SSO_SAML_IDP_METADATA_PREFETCH"]:
+            state.idp_metadata.prefetch(
+                idp["settings_url"]
+                for idp in app.config["SSO_SAML_IDPS"].values()
+                if idp.get("settings_url")
+            )
+
+        if app.config["SSO_SAML_WARMUP"]:
+            state.warmup()
         return state
 
     def init_config(self, app):
@@ -0,0 +1,262 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Federation (aggregate) metadata support.
+
+Aggregates such as eduGAIN publish thousands of entities in a single
+document. Instead of parsing it into memory at once, the document is
+stream-parsed: the settings of every IdP ``EntityDescriptor`` are extracted
+and written to a compiled :class:`invenio_saml.index.MetadataIndex`, and the
+element is dropped from the tree. The index is memory-mapped, so the IdPs are
+looked up on demand and not kept in memory, and it is reused by the other
+processes and after a restart as long as the aggregate does not change.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from lxml import etree
+from onelogin.saml2.constants import OneLogin_Saml2_Constants
+from onelogin.saml2.idp_metadata_parser import OneLogin_Saml2_IdPMetadataParser
+
+from .errors import FederationUnavailable
+from .index import InvalidIndexError, MetadataIndex, compile_index
+
+logger = logging.getLogger(__name__)
+
+ENTITY_DESCRIPTOR = "{%s}EntityDescriptor" % OneLogin_Saml2_Constants.NS_MD
+IDP_SSO_DESCRIPTOR = "{%s}IDPSSODescriptor" % OneLogin_Saml2_Constants.NS_MD
+
+
+def federation_idp_name(federation, entity_id):
+    """Name under which an IdP of a federation is exposed.
+
+    The name is stable across processes and restarts and safe to use in URLs.
+
+    :param federation: Federation key in ``SSO_SAML_FEDERATIONS``.
+    :param entity_id: ``entityID`` of the IdP.
+    """
+    digest = hashlib.sha1(entity_id.encode("utf-8")).hexdigest()[:16]
+    return "{0}-{1}".format(federation, digest)
+
+
+def iter_idp_entities(source):
+    """Stream the IdP entity descriptors of an aggregate.
+
+    Elements are cleared as soon as they have been yielded, so the memory used
+    does not depend on the size of the document.
+
+    :param source: File name or file object of the aggregate.
+    :returns: Iterator of ``(entity_id, serialized_entity_descriptor)``.
+    """
+    context = etree.iterparse(
+        source,
+        events=("end",),
+        tag=ENTITY_DESCRIPTOR,
+        huge_tree=True,
+        resolve_entities=False,
+        no_network=True,
+    )
+    for _, elem in context:
+        entity_id = elem.get("entityID")
+        if entity_id and elem.find(IDP_SSO_DESCRIPTOR) is not None:
+            yield entity_id, etree.tostring(elem)
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+def iter_idp_settings(federation, source, on_error=None):
+    """Stream the settings of the IdPs of an aggregate.
+
+    :param federation: Federation key in ``SSO_SAML_FEDERATIONS``.
+    :param source: File name or file object of the aggregate.
+    :param on_error: Callable receiving the ``entityID`` and the exception of
+        the IdPs whose settings cannot be extracted, which are skipped.
+    :returns: Iterator of ``(entity_id, name, settings)``, as expected by
+        :func:`invenio_saml.index.compile_index`.
+    """
+    for entity_id, xml in iter_idp_entities(source):
+        try:
+            settings = OneLogin_Saml2_IdPMetadataParser.parse(xml, entity_id=entity_id)
+        except Exception as exc:
+            if on_error is not None:
+                on_error(entity_id, exc)
+            continue
+        yield entity_id, federation_idp_name(federation, entity_id), settings
+
+
+class FederationMetadata(object):
+    """Index of the IdPs published in a federation aggregate file.
+
+    The aggregate is compiled into an index file in ``cache_dir``, named
+    after the federation and the path, modification time and size of the
+    aggregate, unless it already exists. When the aggregate changes, the index
+    of its new version can be compiled in a background thread while the index
+    of the former version is served, see :meth:`load`.
+    """
+
+    def __init__(self, name, path, cache_dir=None):
+        """Initialize the index.
+
+        :param name: Federation key in ``SSO_SAML_FEDERATIONS``.
+        :param path: Path to the aggregate metadata file.
+        :param cache_dir: Directory of the compiled index, the temporary
+            directory by default.
+        """
+        self.name = name
+        self.path = path
+        self.cache_dir = cache_dir or tempfile.gettempdir()
+        self._index = None
+        self._mtime = None
+        self._compiling = None
+        self._failed = None
+        self._lock = threading.Lock()
+
+    def _index_prefix(self):
+        """Prefix of the paths of the indexes of the aggregate."""
+        key = "\0".join((self.name, os.path.abspath(self.path)))
+        return os.path.join(
+            self.cache_dir,
+            "saml-federation-{}-".format(
+                hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            ),
+        )
+
+    def _compile(self, path):
+        """Compile the aggregate and remove the indexes of its former versions.
+
+        The processes which still have them open keep reading them.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        compile_index(path, iter_idp_settings(self.name, self.path))
+        for former in glob.glob(glob.escape(self._index_prefix()) + "*.idx"):
+            if former != path:
+                try:
+                    os.remove(former)
+                except OSError:
+                    pass
+
+    def _compile_background(self, path):
+        """Compile the aggregate, logging the failure instead of raising it."""
+        try:
+            self._compile(path)
+        except Exception:
+            logger.exception("Compiling the federation %s failed", self.name)
+            self._failed = path
+
+    def _start_compiling(self, path):
+        """Compile the aggregate in a background thread, unless in flight.
+
+        An aggregate which failed to compile is not compiled again until it
+        changes.
+        """
+        if self._failed == path:
+            return
+        if self._compiling is not None and self._compiling.is_alive():
+            return
+        self._compiling = threading.Thread(
+            target=self._compile_background,
+            args=(path,),
+            name="saml-federation-compile",
+        )
+        self._compiling.daemon = True
+        self._compiling.start()
+
+    def _open_former(self):
+        """Open the most recent index of a former version or return ``None``."""
+
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return 0
+
+        formers = glob.glob(glob.escape(self._index_prefix()) + "*.idx")
+        for path in sorted(formers, key=mtime, reverse=True):
+            try:
+                return MetadataIndex(path)
+            except (OSError, InvalidIndexError):
+                continue
+        return None
+
+    def load(self, wait=True):
+        """Open the index of the current version of the aggregate.
+
+        :param wait: Compile the index in the calling thread if it does not
+            exist. Otherwise it is compiled in a background thread and the
+            index of a former version of the aggregate is served meanwhile.
+        :raises invenio_saml.errors.FederationUnavailable: If the index must
+            be compiled without waiting and no former index exists.
+        """
+        stat = os.stat(self.path)
+        if self._index is not None and self._mtime == stat.st_mtime_ns:
+            return self
+        path = "{}{}-{}.idx".format(
+            self._index_prefix(), stat.st_mtime_ns, stat.st_size
+        )
+        with self._lock:
+            if self._index is not None and self._mtime == stat.st_mtime_ns:
+                return self
+            try:
+                index = MetadataIndex(path)
+            except (OSError, InvalidIndexError):
+                if not wait:
+                    self._start_compiling(path)
+                    if self._index is None:
+                        self._index = self._open_former()
+                    if self._index is None:
+                        raise FederationUnavailable(self.name)
+                    return self
+                self._compile(path)
+                index = MetadataIndex(path)
+            self._mtime = stat.st_mtime_ns
+            self._index = index
+        return self
+
+    def _loaded(self):
+        """Get the served index, opening it first if needed."""
+        if self._index is None:
+            self.load()
+        return self._index
+
+    @property
+    def index_path(self):
+        """Path of the index file served, opening it first if needed."""
+        return self._loaded().path
+
+    def is_stale(self):
+        """Whether the aggregate file changed since the index was compiled."""
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except OSError:
+            return True
+
+    def __len__(self):
+        """Number of IdPs in the federation."""
+        return len(self._loaded())
+
+    def __contains__(self, entity_id):
+        """Whether an IdP is published in the federation."""
+        return entity_id in self._loaded()
+
+    def entity_ids(self):
+        """Iterate over the ``entityID`` of the IdPs of the federation."""
+        return self._loaded().entity_ids()
+
+    def resolve(self, idp):
+        """Get the ``entityID`` of an IdP from its name or ``None``."""
+        return self._loaded().resolve(idp)
+
+    def get_settings(self, entity_id):
+        """Get the OneLogin settings of an IdP.
+
+        :raises KeyError: If the IdP is not part of the federation.
+        """
+        return self._loaded().get_settings(entity_id)
@@ -8,17 +8,22 @@ from datetime import datetime, timezone
 from flask import abort, current_app
 from flask_login import current_user
 from flask_security import logout_user
-from invenio_db import db
+from invenio_db.uow import UnitOfWork
 from invenio_oauthclient.errors import AlreadyLinkedError
 from invenio_oauthclient.utils import create_csrf_disabled_registrationform, fill_form
 
 from .invenio_accounts.utils import (
+    DatastoreCommitOp,
     account_authenticate,
     account_get_user,
     account_link_external_id,
     account_register,
 )
 from .invenio_app import get_safe_redirect_target
+from .metrics import set_outcome
+from .proxies import current_sso_saml
+from .timing import phase
+from .tracing import trace
 
 
 def default_account_info(attributes, remote_app):
@@ -31,26 +36,18 @@ def default_account_info(attributes, remote_app):
     :param remote_app: (str) Identity provider key.
 
     :returns: (dict) A dictionary representing user to create or update.
+    :raises invenio_saml.errors.AttributeMappingError: If required attributes
+        are missing.
     """
-    remote_app_config = current_app.config["SSO_SAML_IDPS"][remote_app]
-
-    mappings = remote_app_config["mappings"]
-
-    affiliations_mapping = mappings.get("affiliations", None)
-    if affiliations_mapping:
-        affiliations = attributes[affiliations_mapping]
-    else:
-        affiliations = ""
-
-    name = attributes[mappings["name"]][0]
-    surname = attributes[mappings["surname"]][0]
-    email = attributes[mappings["email"]][0]
-    external_id = attributes[mappings["external_id"]][0]
-    username = (
-        remote_app + "-" + external_id.split("@")[0]
-        if "@" in external_id
-        else remote_app + "-" + external_id
-    )
+    remote_app_config = current_sso_saml.get_idp_config(remote_app)
+    values = current_sso_saml.get_attribute_extractor(remote_app).extract(attributes)
+
+    affiliations = values["affiliations"]
+    name = values["name"]
+    surname = values["surname"]
+    email = values["email"]
+    external_id = values["external_id"]
+    username = remote_app + "-" + external_id.partition("@")[0]
 
     return dict(
         user=dict(
@@ -80,6 +77,7 @@ def default_account_setup(user, account_info):
             dict(
                 id=account_info["external_id"], method=account_info["external_method"]
             ),
+            linked=account_info.get("external_linked"),
         )
     except AlreadyLinkedError:
         pass
@@ -96,7 +94,7 @@ def default_sls_handler(auth, next_url):
 
 
 def acs_handler_factory(
-    remote_app,
+    remote_app=None,
     account_info=default_account_info,
     account_setup=default_account_setup,
     user_lookup=account_get_user,
@@ -110,6 +108,8 @@ def acs_handler_factory(
         different.
 
     :param remote_app: string representing the name of the identity provider.
+        If ``None`` the name of the IdP handling the request is used, which
+        allows sharing the handler, e.g. between the IdPs of a federation.
 
     :param account_info: callable to extract the account information from a
         dict like object. ``mappings`` key is required whe using it.
@@ -151,30 +151,51 @@ def acs_handler_factory(
 
         :return: Next URL
         """
-        if not current_user.is_authenticated:
-            current_app.logger.debug(
-                "Metadata received from IdP %s", auth.get_attributes()
-            )
-            _account_info = account_info(auth.get_attributes(), remote_app)
-            current_app.logger.debug("Metadata extracted from IdP %s", _account_info)
-            # TODO: signals?
-
-            user = user_lookup(_account_info)
-
-            if user is None:
-                form = create_csrf_disabled_registrationform(remote_app)
-                form = fill_form(form, _account_info["user"])
-                user = account_register(
-                    form, confirmed_at=_account_info["confirmed_at"]
-                )
-
-            # if registration fails ... TODO: signup?
-            if user is None or not account_authenticate(user):
-                abort(401)
-
-            account_setup(user, _account_info)
-
-        db.session.commit()
+        idp = remote_app or auth.idp
+        authenticated = logged_in = current_user.is_authenticated
+        # The registration is committed by Flask-Security, everything else at
+        # once at the end, and rolled back on errors
+        try:
+            with UnitOfWork() as uow:
+                uow.register(DatastoreCommitOp())
+                if not authenticated:
+                    attributes = auth.get_attributes()
+                    trace("attributes", idp, attributes)
+                    with phase("account_info"):
+                        _account_info = account_info(attributes, idp)
+                    trace("account info", idp, _account_info)
+                    # TODO: signals?
+
+                    with phase("lookup"):
+                        user = user_lookup(_account_info)
+
+                    if user is None:
+                        form = create_csrf_disabled_registrationform(idp)
+                        form = fill_form(form, _account_info["user"])
+                        user = account_register(
+                            form, confirmed_at=_account_info["confirmed_at"], uow=uow
+                        )
+                        if user is not None:
+                            set_outcome("registration")
+
+                    # if registration fails ... TODO: signup?
+                    if user is None:
+                        abort(401)
+
+                    authenticated = account_authenticate(user)
+                    if authenticated:
+                        with phase("setup"):
+                            account_setup(user, _account_info)
+
+                with phase("commit"):
+                    uow.commit()
+        except Exception:
+            if authenticated and not logged_in:
+                logout_user()
+            raise
+
+        if not authenticated:
+            abort(401)
 
         next_url = (
             get_safe_redirect_target(_target=next_url)
@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cache and background refresh of remote Identity Provider metadata."""
+
+import hashlib
+import os
+import threading
+import time
+import weakref
+
+from onelogin.saml2.idp_metadata_parser import OneLogin_Saml2_IdPMetadataParser
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
+
+# Caches whose refreshes in flight are forgotten in forked processes
+_caches = weakref.WeakSet()
+
+
+def _after_fork():
+    """Reset the caches in a forked process."""
+    for cache in list(_caches):
+        cache._forked()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class RemoteMetadata(object):
+    """Last good copy of the metadata published at an URL."""
+
+    __slots__ = ("settings", "digest", "fetched", "expires", "retry_at")
+
+    def __init__(self, settings, expires, digest=None):
+        """Initialize the entry.
+
+        :param settings: Settings dictionary as parsed by
+            ``OneLogin_Saml2_IdPMetadataParser.parse``.
+        :param expires: Unix timestamp after which it should be refreshed.
+        :param digest: SHA-256 digest of the metadata XML.
+        """
+        self.settings = settings
+        self.digest = digest
+        self.fetched = time.time()
+        self.expires = expires
+        self.retry_at = None
+
+    @property
+    def expired(self):
+        """Whether a refresh should be scheduled."""
+        now = time.time()
+        if self.retry_at is not None and now < self.retry_at:
+            return False
+        return now >= self.expires
+
+
+class RemoteMetadataCache(object):
+    """Cache of the IdP metadata fetched from ``settings_url``.
+
+    The metadata can be downloaded ahead of the first access with
+    :meth:`prefetch`, which the first access then waits for. Otherwise the
+    first access to an URL downloads it synchronously. Once an entry expires,
+    according to the ``validUntil`` and ``cacheDuration`` of the metadata and
+    capped by ``SSO_SAML_IDP_METADATA_TTL``, it is refreshed by a background
+    thread while the last good copy keeps being served. ``on_refresh`` is
+    only called if the downloaded metadata changed. Failed refreshes are
+    retried after ``SSO_SAML_IDP_METADATA_RETRY`` seconds.
+    """
+
+    def __init__(self, app, on_refresh=None):
+        """Initialize the cache.
+
+        :param app: Flask application, used for configuration and logging.
+        :param on_refresh: Callable receiving the URL whose metadata changed.
+        """
+        self.app = app
+        self.on_refresh = on_refresh
+        self._entries = {}
+        # Events of the refreshes in flight, by URL
+        self._refreshing = {}
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def _forked(self):
+        """Forget the refreshes in flight, their threads are not forked."""
+        self._refreshing = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Get the parsed IdP settings for an URL.
+
+        Schedules a background refresh if the cached copy has expired.
+        """
+        entry = self._entries.get(url)
+        if entry is None:
+            event = self._refreshing.get(url)
+            if event is not None:
+                event.wait(self.app.config["SSO_SAML_IDP_METADATA_FETCH_TIMEOUT"])
+                entry = self._entries.get(url)
+            if entry is None:
+                entry = self._entries[url] = self._load(url)
+        elif entry.expired:
+            self.refresh(url)
+        return entry.settings
+
+    def prefetch(self, urls):
+        """Download the metadata of URLs in background threads.
+
+        :param urls: URLs whose metadata is not cached yet.
+        """
+        for url in urls:
+            if url not in self._entries:
+                self.refresh(url)
+
+    def refresh(self, url, wait=False):
+        """Refresh the metadata of an URL in a background thread.
+
+        Nothing happens if a refresh of the same URL is already in flight.
+
+        :param wait: Block until the refresh is finished.
+        """
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing[url] = threading.Event()
+        thread = threading.Thread(
+            target=self._refresh, args=(url,), name="saml-metadata-refresh"
+        )
+        thread.daemon = True
+        thread.start()
+        if wait:
+            thread.join()
+
+    def invalidate(self, url=None):
+        """Drop the cached metadata of one URL or of all of them."""
+        if url is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(url, None)
+
+    def fetch(self, url):
+        """Download the metadata XML published at an URL."""
+        return OneLogin_Saml2_IdPMetadataParser.get_metadata(
+            url, timeout=self.app.config["SSO_SAML_IDP_METADATA_FETCH_TIMEOUT"]
+        )
+
+    def _load(self, url, previous=None):
+        """Download and parse the metadata of an URL.
+
+        The settings of the ``previous`` entry are reused if the metadata did
+        not change.
+        """
+        xml = self.fetch(url)
+        data = xml.encode("utf-8") if isinstance(xml, str) else xml
+        digest = hashlib.sha256(data).hexdigest()
+        if previous is not None and previous.digest == digest:
+            settings = previous.settings
+        else:
+            settings = OneLogin_Saml2_IdPMetadataParser.parse(xml)
+        return RemoteMetadata(settings, self._expire_time(xml), digest)
+
+    def _refresh(self, url):
+        """Replace the cached metadata, keeping the old copy on failure."""
+        old = self._entries.get(url)
+        try:
+            try:
+                entry = self._load(url, old)
+            except Exception:
+                self.app.logger.exception(
+                    "Refreshing IdP metadata from {} failed".format(url)
+                )
+                if old is not None:
+                    old.retry_at = (
+                        time.time() + self.app.config["SSO_SAML_IDP_METADATA_RETRY"]
+                    )
+                return
+            self._entries[url] = entry
+        finally:
+            with self._lock:
+                event = self._refreshing.pop(url, None)
+            if event is not None:
+                event.set()
+        if self.on_refresh and old is not None and entry.settings is not old.settings:
+            self.on_refresh(url)
+
+    def _expire_time(self, xml):
+        """Compute when the metadata has to be refreshed."""
+        now = time.time()
+        expires = now + self.app.config["SSO_SAML_IDP_METADATA_TTL"]
+        try:
+            root = OneLogin_Saml2_XML.to_etree(xml)
+            expire_time = OneLogin_Saml2_Utils.get_expire_time(
+                root.get("cacheDuration"), root.get("validUntil")
+            )
+        except Exception:
+            expire_time = None
+        if expire_time is not None:
+            expires = min(expires, int(expire_time))
+        # Do not hammer IdPs publishing already expired metadata
+        return max(expires, now + self.app.config["SSO_SAML_IDP_METADATA_RETRY"])
@@ -0,0 +1,191 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Compiled, memory-mapped index of IdP metadata.
+
+The index is compiled from a federation aggregate, offline (see ``invenio saml
+compile-metadata``) or by :class:`invenio_saml.federation.FederationMetadata`,
+and opened read-only through ``mmap`` by every worker, so all processes share
+the same pages and no XML is parsed to look an IdP up.
+
+Layout (little endian)::
+
+    header       magic, version, count, entity table offset, name table offset
+    data         keys and zlib-compressed JSON records, in insertion order
+    entity table ``count`` entries sorted by entityID
+    name table   ``count`` entries sorted by IdP name
+
+Each table entry holds the offset and length of its key and of its value. The
+value of the entity table is the record with the OneLogin IdP settings, the
+value of the name table is the entityID. Lookups are binary searches over the
+tables.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+MAGIC = b"INVSAMLX"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sHHIQQ")
+_ENTRY = struct.Struct("<QHQI")
+
+
+class InvalidIndexError(Exception):
+    """Raised when a file is not a valid compiled metadata index."""
+
+
+def compile_index(path, entities):
+    """Compile an index file.
+
+    The file is written next to ``path`` and atomically moved into place, so
+    processes that have the previous index open keep reading a consistent
+    file.
+
+    :param path: Path of the index file.
+    :param entities: Iterable of ``(entity_id, name, settings)``, where
+        ``settings`` is the dictionary returned by
+        ``OneLogin_Saml2_IdPMetadataParser.parse``.
+    :returns: The number of IdPs in the index.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".saml-index-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            by_entity, by_name = [], []
+
+            def write(data):
+                offset = f.tell()
+                f.write(data)
+                return offset, len(data)
+
+            for entity_id, name, settings in entities:
+                entity_key = write(entity_id.encode("utf-8"))
+                name_key = write(name.encode("utf-8"))
+                record = write(
+                    zlib.compress(json.dumps(settings, sort_keys=True).encode("utf-8"))
+                )
+                by_entity.append((entity_id.encode("utf-8"), entity_key, record))
+                by_name.append((name.encode("utf-8"), name_key, entity_key))
+
+            tables = []
+            for table in (by_entity, by_name):
+                tables.append(f.tell())
+                for _, key, value in sorted(table):
+                    f.write(_ENTRY.pack(key[0], key[1], value[0], value[1]))
+
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, len(by_entity), *tables))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(by_entity)
+
+
+class MetadataIndex(object):
+    """Read-only, memory-mapped view of a compiled index file.
+
+    It offers the same lookups as
+    :class:`invenio_saml.federation.FederationMetadata`.
+    """
+
+    def __init__(self, path):
+        """Open and map the index file.
+
+        :raises InvalidIndexError: If the file is not a valid index.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < _HEADER.size:
+                raise InvalidIndexError(path)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._stat = (stat.st_ino, stat.st_mtime_ns)
+        magic, version, _, count, entities, names = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise InvalidIndexError(path)
+        self._count = count
+        self._entities = entities
+        self._names = names
+
+    def load(self):
+        """Return the index, which is ready to use once opened."""
+        return self
+
+    @property
+    def index_path(self):
+        """Path of the index file."""
+        return self.path
+
+    def close(self):
+        """Unmap the index file."""
+        self._mm.close()
+
+    def is_stale(self):
+        """Whether the index file was replaced since it was opened."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) != self._stat
+
+    def _entry(self, table, i):
+        """Read entry ``i`` of a table."""
+        return _ENTRY.unpack_from(self._mm, table + i * _ENTRY.size)
+
+    def _find(self, table, key):
+        """Binary search a table, return ``(value offset, length)`` or None."""
+        key = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_offset, key_len, value_offset, value_len = self._entry(table, mid)
+            current = self._mm[key_offset : key_offset + key_len]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return value_offset, value_len
+        return None
+
+    def __len__(self):
+        """Number of IdPs in the index."""
+        return self._count
+
+    def __contains__(self, entity_id):
+        """Whether an IdP is in the index."""
+        return self._find(self._entities, entity_id) is not None
+
+    def entity_ids(self):
+        """Iterate over the ``entityID`` of the IdPs, in sorted order."""
+        for i in range(self._count):
+            key_offset, key_len, _, _ = self._entry(self._entities, i)
+            yield self._mm[key_offset : key_offset + key_len].decode("utf-8")
+
+    def resolve(self, idp):
+        """Get the ``entityID`` of an IdP from its name or ``None``."""
+        found = self._find(self._names, idp)
+        if found is None:
+            return None
+        offset, length = found
+        return self._mm[offset : offset + length].decode("utf-8")
+
+    def get_settings(self, entity_id):
+        """Get the OneLogin settings of an IdP.
+
+        :raises KeyError: If the IdP is not in the index.
+        """
+        found = self._find(self._entities, entity_id)
+        if found is None:
+            raise KeyError(entity_id)
+        offset, length = found
+        return json.loads(zlib.decompress(self._mm[offset : offset + length]))
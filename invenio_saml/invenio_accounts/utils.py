@@ -7,7 +7,7 @@
 
 from __future__ import absolute_import, print_function
 
-from flask import after_this_request, current_app
+from flask import current_app
 from flask_security import login_user
 from flask_security.confirmable import requires_confirmation
 from flask_security.registerable import register_user
@@ -15,17 +15,30 @@ from flask_security.registerable import register_user
 # FIXME: modify import when integrated inside invenio_accounts
 # from .models import User
 from invenio_accounts.models import User
+from invenio_db import db
+from invenio_db.uow import Operation
 from invenio_oauthclient.models import UserIdentity
+from sqlalchemy import literal
 from werkzeug.local import LocalProxy
 
+from ..proxies import current_sso_saml
+from ..timing import timed
+
 _security = LocalProxy(lambda: current_app.extensions["security"])
 
 _datastore = LocalProxy(lambda: _security.datastore)
 
 
-def _commit(response=None):
-    _datastore.commit()
-    return response
+class DatastoreCommitOp(Operation):
+    """Commit the unit of work through the user datastore as well.
+
+    The datastore sends its pre and post commit signals around the commit,
+    like when the changes are committed with ``_datastore.commit()``.
+    """
+
+    def on_commit(self, uow):
+        """Commit the user datastore."""
+        _datastore.commit()
 
 
 def _get_external_id(account_info):
@@ -37,51 +50,101 @@ def _get_external_id(account_info):
     return None
 
 
+@timed("lookup")
 def account_get_user(account_info=None):
     """Retrieve user object for the given request.
 
     Uses either the access token or extracted account information to retrieve
-    the user object.
+    the user object. The user linked to the external id and the user with the
+    email are fetched in a single query, the former taking precedence.
+
+    Whether the external id is already linked is stored in
+    ``account_info["external_linked"]``, so that
+    :func:`account_link_external_id` does not need to look it up again.
+
+    If ``SSO_SAML_USER_CACHE_FACTORY`` is set, the ID of the linked user is
+    cached and a returning user is fetched by primary key.
 
     :param account_info: The dictionary with the account info.
         (Default: ``None``)
     :returns: A :class:`invenio_accounts.models.User` instance or ``None``.
     """
-    if account_info:
-        external_id = _get_external_id(account_info)
-        if external_id:
-            user = UserIdentity.get_user(external_id["method"], external_id["id"])
-            if user:
-                return user
-
-        email = account_info.get("user", {}).get("email")
-        if email:
-            return User.query.filter_by(email=email).one_or_none()
-    return None
-
-
+    if not account_info:
+        return None
+
+    external_id = _get_external_id(account_info)
+    email = account_info.get("user", {}).get("email")
+
+    cache = current_sso_saml.user_cache if external_id else None
+    if cache is not None:
+        user_id = cache.get(external_id["method"], external_id["id"])
+        user = db.session.get(User, user_id) if user_id is not None else None
+        if user is not None:
+            account_info["external_linked"] = True
+            return user
+        if user_id is not None:
+            cache.invalidate(external_id["method"], external_id["id"])
+
+    queries = []
+    if external_id:
+        queries.append(
+            db.session.query(User, literal(True))
+            .join(UserIdentity, UserIdentity.id_user == User.id)
+            .filter(
+                UserIdentity.method == external_id["method"],
+                UserIdentity.id == external_id["id"],
+            )
+        )
+    if email:
+        queries.append(db.session.query(User, literal(False)).filter_by(email=email))
+    if not queries:
+        return None
+
+    rows = queries[0].union_all(*queries[1:]).all()
+    user = next((user for user, linked in rows if linked), None)
+    if external_id:
+        account_info["external_linked"] = user is not None
+    if cache is not None and user is not None:
+        cache.set(external_id["method"], external_id["id"], user.id)
+    if user is None and rows:
+        user = rows[0][0]
+    return user
+
+
+@timed("login")
 def account_authenticate(user):
     """Authenticate an ACS callback.
 
+    The login tracking changes of the user are left to the caller to commit.
+
     :param user: A user instance.
     :returns: ``True`` if the user is successfully authenticated.
     """
     if not requires_confirmation(user):
-        after_this_request(_commit)
         return login_user(user, remember=False)
     return False
 
 
-def account_link_external_id(user, external_id=None):
+@timed("link")
+def account_link_external_id(user, external_id=None, linked=None):
     """Link a user to an external id.
 
     :param user: A :class:`invenio_accounts.models.User` instance.
     :param external_id: The external id associated with the user.
         (Default: ``None``)
+    :param linked: Whether the external id is known to be linked already, as
+        found by :func:`account_get_user`. It is looked up if ``None``.
     :raises invenio_oauthclient.errors.AlreadyLinkedError: Raised if already
         exists a link.
     """
-    if UserIdentity.get_user(external_id["method"], external_id["id"]):
+    if linked is None:
+        linked = (
+            UserIdentity.query.filter_by(
+                method=external_id["method"], id=external_id["id"]
+            ).count()
+            > 0
+        )
+    if linked:
         # already linked. should be fine to just return
         # method and id form the composite primary key, so no other with these values can be linked
         return
@@ -89,10 +152,17 @@ def account_link_external_id(user, external_id=None):
     UserIdentity.create(user, external_id["method"], external_id["id"])
 
 
-def account_register(form, confirmed_at=None):
+@timed("register")
+def account_register(form, confirmed_at=None, uow=None):
     """Register user if possible.
 
+    The user is registered and committed by Flask-Security's
+    ``register_user``, which also sends the ``user_registered`` signal and
+    the welcome email.
+
     :param form: A form instance.
+    :param uow: The unit of work committing the remaining changes to the
+        user. They are committed right away if ``None``.
     :returns: A :class:`invenio_accounts.models.User` instance.
     """
     if form.validate():
@@ -105,5 +175,6 @@ def account_register(form, confirmed_at=None):
         user = register_user(**data)
         if not data["password"]:
             user.password = None
-        _datastore.commit()
+        if uow is None:
+            _datastore.commit()
         return user
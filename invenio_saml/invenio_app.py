@@ -9,9 +9,122 @@
 All this code has been adapted and copied from Invenio-Oauthclient.
 """
 
+from functools import lru_cache
+from weakref import WeakKeyDictionary
+
 from flask import current_app, request
 from uritools import uricompose, urisplit
 
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+"""Ports of the redirect targets without one, by scheme."""
+
+# Key of the ports of the wildcard entries in the trie nodes
+_PORTS = object()
+
+_matchers = WeakKeyDictionary()
+
+
+class TrustedHosts(object):
+    """Matcher of the hosts of ``TRUSTED_HOSTS``.
+
+    The entries are host names, optionally followed by a port, which the
+    redirect targets then must use (the default port of their scheme if they
+    have none). An entry starting with ``*.`` trusts the subdomains of the
+    domain, and one starting with ``.``, as in Werkzeug, trusts the domain
+    and its subdomains.
+
+    The exact hosts are kept in a dictionary, and the wildcard domains in a
+    trie of their labels in reverse order, so that matching a host does not
+    depend on the number of entries.
+    """
+
+    def __init__(self, hosts):
+        """Compile the entries.
+
+        :param hosts: List of trusted hosts.
+        """
+        self.source = hosts
+        self._exact = {}
+        self._wildcards = {}
+        for entry in hosts:
+            parts = urisplit("//" + entry)
+            host, port = parts.host or "", parts.port or None
+            if parts.path or parts.userinfo is not None or "?" in entry or "#" in entry:
+                # Not a host, only matched as is
+                self._exact.setdefault(entry, set()).add(None)
+            elif host.startswith("*."):
+                self._add_wildcard(host[2:], port)
+            elif host.startswith("."):
+                self._exact.setdefault(host[1:], set()).add(port)
+                self._add_wildcard(host[1:], port)
+            else:
+                self._exact.setdefault(host, set()).add(port)
+
+    def _add_wildcard(self, domain, port):
+        node = self._wildcards
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node.setdefault(_PORTS, set()).add(port)
+
+    def match(self, host, port=None):
+        """Whether a host is trusted.
+
+        :param host: Host of the redirect target.
+        :param port: Port of the redirect target, or ``None`` if unknown.
+        """
+        ports = self._exact.get(host)
+        if ports is not None and (None in ports or port in ports):
+            return True
+
+        node = self._wildcards
+        labels = host.split(".")
+        # A wildcard matches one label at least
+        for label in reversed(labels[1:]):
+            node = node.get(label)
+            if node is None:
+                return False
+            ports = node.get(_PORTS)
+            if ports is not None and (None in ports or port in ports):
+                return True
+        return False
+
+
+def get_trusted_hosts(app=None):
+    """Get the :class:`TrustedHosts` of an application.
+
+    It is compiled once, and again when ``TRUSTED_HOSTS`` is replaced.
+
+    :param app: Application, the current one by default.
+    """
+    app = app or current_app._get_current_object()
+    hosts = app.config.get("TRUSTED_HOSTS") or ()
+    matcher = _matchers.get(app)
+    if matcher is None or matcher.source is not hosts:
+        matcher = _matchers[app] = TrustedHosts(hosts)
+    return matcher
+
+
+@lru_cache(maxsize=1024)
+def _split_target(target):
+    """Split a redirect target into its URI components, host and port."""
+    parts = urisplit(target)
+    port = parts.port or DEFAULT_PORTS.get((parts.scheme or "").lower())
+    return parts, parts.host, port
+
+
+@lru_cache(maxsize=1024)
+def _local_target(target):
+    """Get the path, query and fragment of a redirect target."""
+    parts = _split_target(target)[0]
+    return uricompose(path=parts.path, query=parts.query, fragment=parts.fragment)
+
+
+def _redirect_candidates(arg, target):
+    """Candidate redirect targets, read from the request only when needed."""
+    yield target
+    yield request.args.get(arg)
+    yield request.referrer
+
 
 def get_safe_redirect_target(arg="next", _target=None):
     """Get URL to redirect to and ensure that it is local.
@@ -19,16 +132,11 @@ def get_safe_redirect_target(arg="next", _target=None):
     :param arg: URL argument.
     :returns: The redirect target or ``None``.
     """
-    for target in _target, request.args.get(arg), request.referrer:
+    for target in _redirect_candidates(arg, _target):
         if target:
-            redirect_uri = urisplit(target)
-            allowed_hosts = current_app.config.get("TRUSTED_HOSTS", [])
-            if redirect_uri.host in allowed_hosts:
+            redirect_uri, host, port = _split_target(target)
+            if host is not None and get_trusted_hosts().match(host, port):
                 return target
             elif redirect_uri.path:
-                return uricompose(
-                    path=redirect_uri.path,
-                    query=redirect_uri.query,
-                    fragment=redirect_uri.fragment,
-                )
+                return _local_target(target)
     return None
@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cache of the keys and certificates loaded by OneLogin.
+
+OneLogin parses the PEM certificates and keys of the settings into
+``xmlsec`` keys on each signature, verification and decryption. Once
+:func:`install_key_cache` is called, it gets them from a :class:`KeyCache`
+instead, keyed by their content, so that they are parsed once per process and
+a changed certificate or key file is simply a new entry. The certificate
+fingerprints are cached the same way.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from copy import copy
+from functools import lru_cache
+
+import onelogin.saml2.utils
+import xmlsec
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+_calculate_x509_fingerprint = OneLogin_Saml2_Utils.calculate_x509_fingerprint
+
+# Keys which OneLogin only reads, the others are copied, e.g. ``add_sign``
+# loads the certificate in the private key
+_SHARED_FORMATS = frozenset((xmlsec.KeyFormat.CERT_PEM, xmlsec.KeyFormat.CERT_DER))
+
+
+class KeyCache(object):
+    """Cache of the ``xmlsec`` keys loaded from memory, by content.
+
+    The oldest loaded keys are evicted first.
+    """
+
+    def __init__(self, size=256):
+        """Initialize the cache.
+
+        :param size: Maximum number of keys and of fingerprints.
+        """
+        self.size = size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.fingerprint = lru_cache(maxsize=size)(_calculate_x509_fingerprint)
+
+    def load(self, data, format, password=None):
+        """Load a key, parsing it only if it is not cached.
+
+        Same as ``xmlsec.Key.from_memory``. The keys which OneLogin could
+        modify are copied, which is much cheaper than parsing them.
+        """
+        cache_key = (data, format, password)
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = xmlsec.Key.from_memory(data, format, password)
+            with self._lock:
+                self._keys[cache_key] = key
+                if len(self._keys) > self.size:
+                    self._keys.popitem(last=False)
+        return key if format in _SHARED_FORMATS else copy(key)
+
+    def discard(self, *data):
+        """Remove the keys loaded from any of the given contents."""
+        data = frozenset(d for d in data if d)
+        with self._lock:
+            for cache_key in [k for k in self._keys if k[0] in data]:
+                del self._keys[cache_key]
+
+    def clear(self):
+        """Remove all the keys and fingerprints."""
+        with self._lock:
+            self._keys.clear()
+        self.fingerprint.cache_clear()
+
+    def __len__(self):
+        """Number of cached keys."""
+        return len(self._keys)
+
+
+class _CachedKey(object):
+    """``xmlsec.Key`` loading the keys from memory from a cache."""
+
+    def __init__(self, cache):
+        self.from_memory = cache.load
+
+    def __getattr__(self, name):
+        return getattr(xmlsec.Key, name)
+
+
+class _CachedXmlsec(object):
+    """``xmlsec`` module of OneLogin, with the keys loaded from a cache."""
+
+    def __init__(self, cache):
+        self.Key = _CachedKey(cache)
+
+    def __getattr__(self, name):
+        return getattr(xmlsec, name)
+
+
+_cache = None
+
+
+def install_key_cache(size=256):
+    """Make OneLogin load its keys and fingerprints from a :class:`KeyCache`.
+
+    It replaces the ``xmlsec`` module and the fingerprint function used by
+    OneLogin for the whole process, which is why ``SSO_SAML_KEY_CACHE_SIZE``
+    is opt-in. The cache is created once.
+
+    :param size: Maximum number of keys and of fingerprints.
+    :returns: The :class:`KeyCache`.
+    """
+    global _cache
+    if _cache is None:
+        cache = KeyCache(size)
+        onelogin.saml2.utils.xmlsec = _CachedXmlsec(cache)
+        OneLogin_Saml2_Utils.calculate_x509_fingerprint = staticmethod(
+            cache.fingerprint
+        )
+        _cache = cache
+    return _cache
+
+
+def get_key_cache():
+    """Get the installed :class:`KeyCache` or ``None``."""
+    return _cache
+
+
+KeyMaterial = namedtuple(
+    "KeyMaterial", ("sp_key", "sp_cert", "idp_signing", "idp_encryption")
+)
+"""Loaded keys of an IdP and the SP: the SP ``xmlsec`` key and certificate or
+``None``, and the tuples of the IdP signing and encryption certificates,
+including the ``x509certMulti`` rollover ones."""
+
+
+def _key_sources(settings):
+    """Get the SP key and certificate and IdP certificates of settings."""
+    idp = settings.get_idp_data()
+    multi = idp.get("x509certMulti") or {}
+    main = [idp["x509cert"]] if idp.get("x509cert") else []
+    return (
+        settings.get_sp_key(),
+        settings.get_sp_cert(),
+        main + list(multi.get("signing") or []),
+        main + list(multi.get("encryption") or []),
+    )
+
+
+def load_key_material(settings, cache):
+    """Load the keys and certificates of settings in a cache.
+
+    The keys and certificates which cannot be loaded are left out, the
+    requests report them.
+
+    :param settings: ``OneLogin_Saml2_Settings`` object.
+    :param cache: :class:`KeyCache` to load them in.
+    :returns: The :class:`KeyMaterial`.
+    """
+
+    def load(data, format):
+        try:
+            return cache.load(data, format) if data else None
+        except xmlsec.Error:
+            return None
+
+    def load_certs(certs):
+        keys = (load(cert, xmlsec.KeyFormat.CERT_PEM) for cert in certs)
+        return tuple(key for key in keys if key is not None)
+
+    sp_key, sp_cert, signing, encryption = _key_sources(settings)
+    return KeyMaterial(
+        load(sp_key, xmlsec.KeyFormat.PEM),
+        load(sp_cert, xmlsec.KeyFormat.CERT_PEM),
+        load_certs(signing),
+        load_certs(encryption),
+    )
+
+
+def discard_key_material(settings, cache):
+    """Remove the keys and certificates of settings from a cache.
+
+    Used when the files of an IdP changed, so that the replaced keys do not
+    stay in the cache until they are evicted.
+
+    :param settings: ``OneLogin_Saml2_Settings`` object.
+    :param cache: :class:`KeyCache` to remove them from.
+    """
+    sp_key, sp_cert, signing, encryption = _key_sources(settings)
+    cache.discard(sp_key, sp_cert, *signing, *encryption)
@@ -0,0 +1,256 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Compiled attribute mappings.
+
+The ``mappings`` of an IdP are compiled once into an
+:class:`AttributeExtractor`, which extracts the values of the fields from the
+attributes of a response. A field is mapped either to the name of an
+attribute or to a dictionary:
+
+.. code-block:: python
+
+    "mappings": {
+        "email": "urn:oid:0.9.2342.19200300.100.1.3",
+        "external_id": {
+            "attribute": "urn:oid:1.3.6.1.4.1.5923.1.1.1.6",
+            "transforms": ["first", "lowercase"],
+        },
+        "affiliations": {
+            "attribute": "urn:oid:1.3.6.1.4.1.5923.1.1.1.9",
+            "transforms": [["regex", "^[^@]+"], ["join", ","]],
+            "required": False,
+            "default": "",
+        },
+    }
+
+The transforms are applied in order to the list of values of the attribute:
+
+- ``first``: the first value.
+- ``all``: all the values, as a list.
+- ``join``: the values joined by a separator, ``" "`` by default.
+- ``lowercase``: the value or values in lower case.
+- ``regex``: the first group, or the whole match if the pattern has no group,
+  of a search of the pattern in the value or values. Values that do not match
+  are dropped.
+
+Unless stated otherwise, fields take the ``first`` value and are optional.
+The fields of :data:`ACCOUNT_FIELDS` are required, except ``affiliations``.
+"""
+
+import re
+
+from .errors import AttributeMappingError
+
+_MISSING = object()
+
+ACCOUNT_FIELDS = {
+    "email": {"required": True},
+    "name": {"required": True},
+    "surname": {"required": True},
+    "external_id": {"required": True},
+    "affiliations": {"transforms": ["all"], "default": ""},
+}
+"""Fields used by :func:`invenio_saml.handlers.default_account_info` and the
+options they have when not given in the mappings."""
+
+
+def _first(values):
+    if isinstance(values, str):
+        return values
+    return values[0] if values else _MISSING
+
+
+def _all(values):
+    return [values] if isinstance(values, str) else list(values)
+
+
+def _join(separator=" "):
+    def join(values):
+        return values if isinstance(values, str) else separator.join(values)
+
+    return join
+
+
+def _lowercase(values):
+    if isinstance(values, str):
+        return values.lower()
+    return [value.lower() for value in values]
+
+
+def _regex(pattern):
+    compiled = re.compile(pattern)
+    search, group = compiled.search, 1 if compiled.groups else 0
+
+    def regex(values):
+        if isinstance(values, str):
+            match = search(values)
+            return match.group(group) if match else _MISSING
+        matches = [match.group(group) for match in map(search, values) if match]
+        return matches or _MISSING
+
+    return regex
+
+
+TRANSFORMS = {
+    "first": lambda: _first,
+    "all": lambda: _all,
+    "join": _join,
+    "lowercase": lambda: _lowercase,
+    "regex": _regex,
+}
+"""Factories of the transforms, receiving the arguments of the transform."""
+
+
+def _compile_transform(transform):
+    """Compile ``"name"`` or ``["name", *args]`` into a function."""
+    if isinstance(transform, str):
+        name, args = transform, ()
+    else:
+        name, args = transform[0], tuple(transform[1:])
+    try:
+        factory = TRANSFORMS[name]
+    except KeyError:
+        raise ValueError("Unknown attribute transform {!r}".format(name))
+    return factory(*args)
+
+
+class _Field(object):
+    """Compiled mapping of a field."""
+
+    __slots__ = ("name", "attribute", "transforms", "required", "default", "get")
+
+    def __init__(self, name, spec, options):
+        if isinstance(spec, str):
+            spec = {"attribute": spec}
+        spec = dict(options, **(spec or {}))
+        self.name = name
+        self.attribute = spec.get("attribute")
+        self.transforms = tuple(
+            _compile_transform(transform)
+            for transform in spec.get("transforms", ["first"])
+        )
+        self.required = spec.get("required", False)
+        self.default = spec.get("default")
+        self.get = self._compile_get()
+
+    def _compile_get(self):
+        """Compile the function getting the value out of the attributes."""
+        attribute, transforms = self.attribute, self.transforms
+        if attribute is None:
+            return lambda attributes: _MISSING
+
+        if transforms == (_first,):
+            # Most mappings take the first value of an attribute
+
+            def get(attributes):
+                values = attributes.get(attribute)
+                if not values:
+                    return _MISSING
+                return values if isinstance(values, str) else values[0]
+
+            return get
+
+        def get(attributes):
+            value = attributes.get(attribute) or _MISSING
+            for transform in transforms:
+                if value is _MISSING:
+                    break
+                value = transform(value)
+            return value
+
+        return get
+
+    def error(self, attributes):
+        """Describe why the field could not be extracted."""
+        if self.attribute is None:
+            error = "not_mapped"
+        elif not attributes.get(self.attribute):
+            error = "missing"
+        else:
+            error = "invalid"
+        return {"field": self.name, "attribute": self.attribute, "error": error}
+
+
+class AttributeExtractor(object):
+    """Extracts the mapped fields from the attributes of a response."""
+
+    def __init__(self, mappings, fields=None):
+        """Compile the mappings.
+
+        :param mappings: The ``mappings`` of the IdP.
+        :param fields: Options of the expected fields, used for the fields that
+            are not mapped or whose mapping does not give them, e.g.
+            :data:`ACCOUNT_FIELDS`.
+        :raises ValueError: If a mapping uses an unknown transform.
+        """
+        fields = fields or {}
+        self.fields = tuple(
+            _Field(name, mappings.get(name), fields.get(name, {}))
+            for name in dict.fromkeys(list(fields) + list(mappings))
+        )
+        # Most fields take the first or all the values of an attribute, they
+        # are extracted inline instead of calling a function per field
+        plans = {_first: [], _all: [], None: []}
+        for field in self.fields:
+            if field.attribute and field.transforms in ((_first,), (_all,)):
+                plans[field.transforms[0]].append(
+                    (field.name, field.attribute, field.required, field.default)
+                )
+            else:
+                plans[None].append(
+                    (field.name, field.get, field.required, field.default)
+                )
+        self._first = tuple(plans[_first])
+        self._all = tuple(plans[_all])
+        self._other = tuple(plans[None])
+        self.attributes = frozenset(
+            field.attribute for field in self.fields if field.attribute
+        )
+        """Names of the mapped attributes."""
+
+    def extract(self, attributes):
+        """Extract the fields from the attributes of a response.
+
+        :param attributes: Dictionary of attribute names to lists of values,
+            as returned by ``SAMLAuth.get_attributes``.
+        :returns: Dictionary of the field values.
+        :raises invenio_saml.errors.AttributeMappingError: If required fields
+            are missing, with all the errors found.
+        """
+        get = attributes.get
+        values = {}
+        for name, attribute, required, default in self._first:
+            value = get(attribute)
+            if value:
+                values[name] = value[0]
+            elif required:
+                self._raise(attributes)
+            else:
+                values[name] = default
+        for name, attribute, required, default in self._all:
+            value = get(attribute)
+            if value:
+                values[name] = list(value)
+            elif required:
+                self._raise(attributes)
+            else:
+                values[name] = default
+        for name, get_value, required, default in self._other:
+            value = get_value(attributes)
+            if value is _MISSING:
+                if required:
+                    self._raise(attributes)
+                value = default
+            values[name] = value
+        return values
+
+    def _raise(self, attributes):
+        """Raise the errors of all the required fields missing."""
+        raise AttributeMappingError(
+            [
+                field.error(attributes)
+                for field in self.fields
+                if field.required and field.get(attributes) is _MISSING
+            ]
+        )
@@ -0,0 +1,75 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cache of the rendered Service Provider metadata."""
+
+import hashlib
+import time
+from datetime import datetime, timezone
+
+
+class CachedMetadata(object):
+    """Rendered (and signed when configured) SP metadata of an IdP."""
+
+    __slots__ = ("runtime", "xml", "etag", "last_modified", "expires")
+
+    def __init__(self, runtime, xml, timeout):
+        """Initialize the entry.
+
+        :param runtime: The :class:`invenio_saml.runtime.IdentityProviderRuntime`
+            the metadata was rendered from.
+        :param xml: Metadata XML, a string or bytes as returned by OneLogin
+            when the SP has a certificate.
+        :param timeout: Number of seconds the entry is valid for.
+        """
+        self.runtime = runtime
+        self.xml = xml
+        data = xml if isinstance(xml, bytes) else xml.encode("utf-8")
+        self.etag = hashlib.sha256(data).hexdigest()
+        # HTTP dates have a one second resolution
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.expires = time.monotonic() + timeout
+
+    @property
+    def expired(self):
+        """Whether the entry should be rendered again."""
+        return time.monotonic() >= self.expires
+
+
+class SPMetadataCache(object):
+    """Per IdP cache of the rendered SP metadata.
+
+    Entries are bound to the runtime they were rendered from, so rebuilding the
+    runtime of an IdP (e.g. because its configuration or certificates changed)
+    invalidates its metadata too.
+    """
+
+    def __init__(self):
+        """Initialize the cache."""
+        self._entries = {}
+
+    def get(self, runtime):
+        """Get the cached metadata for a runtime or ``None``."""
+        entry = self._entries.get(runtime.idp)
+        if entry is None or entry.runtime is not runtime or entry.expired:
+            return None
+        return entry
+
+    def set(self, runtime, xml, timeout):
+        """Cache the metadata rendered from a runtime.
+
+        :param timeout: Number of seconds to keep the entry, ``0`` to only
+            build the entry without caching it.
+        :returns: The :class:`CachedMetadata` entry.
+        """
+        entry = CachedMetadata(runtime, xml, timeout)
+        if timeout:
+            self._entries[runtime.idp] = entry
+        return entry
+
+    def invalidate(self, idp=None):
+        """Drop the metadata of one IdP or of all of them."""
+        if idp is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(idp, None)
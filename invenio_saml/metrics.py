@@ -0,0 +1,443 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Metrics of the SAML requests.
+
+The sinks receive the duration of the phases of the requests, see
+:mod:`invenio_saml.timing`, and the outcome and duration of each request.
+:class:`InProcessMetrics` keeps them in the process and renders them in the
+Prometheus text format, on the ``SSO_SAML_METRICS_ROUTE`` of the blueprint.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from bisect import bisect_left
+from collections import deque
+
+from flask import g, has_app_context
+
+_OUTCOME = "_sso_saml_outcome"
+
+OUTCOMES = {
+    400: "bad_request",
+    401: "unauthorized",
+    403: "forbidden",
+    404: "unknown_idp",
+    429: "rate_limited",
+    503: "unavailable",
+}
+"""Outcome of the requests by status code, besides ``success`` and ``error``.
+"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Upper bounds in seconds of the buckets of the latency histograms."""
+
+REQUESTS = "invenio_saml_requests_total"
+REQUEST_DURATION = "invenio_saml_request_duration_seconds"
+PHASE_DURATION = "invenio_saml_phase_duration_seconds"
+
+_METRICS = {
+    REQUESTS: ("counter", "SAML requests.", ("idp", "endpoint", "outcome")),
+    REQUEST_DURATION: (
+        "histogram",
+        "Duration of the SAML requests.",
+        ("idp", "endpoint", "outcome"),
+    ),
+    PHASE_DURATION: (
+        "histogram",
+        "Duration of the phases of the SAML requests.",
+        ("idp", "endpoint", "phase"),
+    ),
+}
+
+
+def set_outcome(outcome):
+    """Set the outcome of the current request.
+
+    Otherwise it is deduced from the status code of the response, see
+    :func:`request_outcome`.
+    """
+    if has_app_context():
+        setattr(g, _OUTCOME, outcome)
+
+
+def request_outcome(response):
+    """Get and reset the outcome of the current request.
+
+    :returns: ``unavailable`` or ``error`` for server errors, otherwise the
+        outcome set with :func:`set_outcome`, e.g. ``signature_error`` or
+        ``registration``, ``success`` for successful and redirect responses
+        or one of :data:`OUTCOMES`.
+    """
+    # The application context may be shared by several requests, e.g. in tests
+    outcome = g.pop(_OUTCOME, None)
+    status = response.status_code
+    if status >= 500:
+        return OUTCOMES.get(status, "error")
+    if outcome is not None:
+        return outcome
+    if status < 400:
+        return "success"
+    return OUTCOMES.get(status, str(status))
+
+
+class MetricsSink(object):
+    """Interface of the metrics sinks."""
+
+    def observe(self, idp, endpoint, phase, seconds):
+        """Record the duration of a phase of a request.
+
+        :param idp: Identity provider key, ``"unknown"`` for unknown ones.
+        :param endpoint: Name of the view, e.g. ``"acs"``.
+        :param phase: Name of the phase, ``"total"`` for the whole view.
+        :param seconds: Duration of the phase.
+        """
+        raise NotImplementedError()
+
+    def request(self, idp, endpoint, outcome, seconds):
+        """Record a request.
+
+        :param idp: Identity provider key, ``"unknown"`` for unknown ones.
+        :param endpoint: Name of the view, e.g. ``"acs"``.
+        :param outcome: Outcome of the request, see :func:`request_outcome`.
+        :param seconds: Duration of the view.
+        """
+
+    def render(self):
+        """Render the metrics in the Prometheus text format.
+
+        :raises NotImplementedError: If the sink cannot render them, the
+            metrics route is then not found.
+        """
+        raise NotImplementedError()
+
+
+# Metrics of the Prometheus sinks by registry, which refuses to register
+# metrics with the same names twice, e.g. for a second application
+_prometheus_metrics = weakref.WeakKeyDictionary()
+_prometheus_lock = threading.Lock()
+
+
+def _create_prometheus_metrics(registry, buckets):
+    """Create and register the Prometheus metrics in a registry."""
+    from prometheus_client import Counter, Histogram
+
+    kwargs = {"buckets": buckets} if buckets else {}
+    metrics = {}
+    for name, (kind, documentation, labels) in _METRICS.items():
+        if kind == "counter":
+            metric = Counter(
+                name[: -len("_total")], documentation, labels, registry=registry
+            )
+        else:
+            metric = Histogram(name, documentation, labels, registry=registry, **kwargs)
+        metrics[name] = metric
+    return metrics
+
+
+class PrometheusMetricsSink(MetricsSink):
+    """Sink recording the metrics with ``prometheus_client``.
+
+    The histograms of the phases and requests and the counter of the requests
+    are named as the ones of :class:`InProcessMetrics`. The sinks of a
+    registry, e.g. of several applications, share its metrics.
+    """
+
+    def __init__(self, registry=None, buckets=None):
+        """Create the metrics, unless the registry already has them.
+
+        :param registry: ``prometheus_client`` registry, the default one if
+            ``None``.
+        :param buckets: Upper bounds of the buckets in seconds, ignored if the
+            registry already has the metrics.
+        """
+        from prometheus_client import REGISTRY
+
+        self.registry = registry if registry is not None else REGISTRY
+        with _prometheus_lock:
+            metrics = _prometheus_metrics.get(self.registry)
+            if metrics is None:
+                metrics = _create_prometheus_metrics(self.registry, buckets)
+                _prometheus_metrics[self.registry] = metrics
+        self.requests = metrics[REQUESTS]
+        self.request_duration = metrics[REQUEST_DURATION]
+        self.histogram = metrics[PHASE_DURATION]
+
+    def observe(self, idp, endpoint, phase, seconds):
+        """Record the duration of a phase of a request."""
+        self.histogram.labels(idp, endpoint, phase).observe(seconds)
+
+    def request(self, idp, endpoint, outcome, seconds):
+        """Record a request."""
+        self.requests.labels(idp, endpoint, outcome).inc()
+        self.request_duration.labels(idp, endpoint, outcome).observe(seconds)
+
+    def render(self):
+        """Render the metrics of the registry."""
+        from prometheus_client import generate_latest
+
+        return generate_latest(self.registry).decode("utf-8")
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    labels = ",".join(
+        '{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)
+    )
+    if extra:
+        labels = labels + "," + extra if labels else extra
+    return "{" + labels + "}"
+
+
+class _Shard(object):
+    """Metrics recorded by one thread."""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def add(self, other):
+        """Add the metrics of another shard."""
+        counters, histograms = self.counters, self.histograms
+        for key, value in list(other.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, value in list(other.histograms.items()):
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = list(value)
+            else:
+                histograms[key] = [a + b for a, b in zip(total, value)]
+
+
+class _Owner(object):
+    """Object of a thread-local, released when its thread exits."""
+
+    __slots__ = ("__weakref__",)
+
+
+class InProcessMetrics(MetricsSink):
+    """Sink keeping the metrics in the process.
+
+    Each thread records in its own shard, without locking, and the shards are
+    only added up when the metrics are read. The shard of a thread which has
+    exited is folded into the one of all the exited threads, so that there
+    are at most as many shards as live threads.
+
+    Each worker process has its own metrics. With a ``directory`` shared by
+    the workers, e.g. of gunicorn, each of them writes its metrics to a file
+    in it at most every ``flush_interval`` seconds and when it exits, and the
+    metrics of all the files are added up when rendered. The directory should
+    be emptied when the application is deployed, like for the multiprocess
+    mode of ``prometheus_client``.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, directory=None, flush_interval=5.0):
+        """Initialize the metrics.
+
+        :param buckets: Upper bounds in seconds of the buckets of the latency
+            histograms.
+        :param directory: Directory shared by the worker processes, if any.
+        :param flush_interval: Seconds between two writes of the metrics of
+            the process to the directory.
+        """
+        self.buckets = tuple(buckets)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._token = uuid.uuid4().hex
+        self._local = threading.local()
+        self._shards = set()
+        # Shards of the exited threads and their sum
+        self._exited = deque()
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_interval
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def _shard(self):
+        """Get the shard of the current thread."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            # The thread-local is cleared when the thread exits
+            self._local.owner = owner = _Owner()
+            weakref.finalize(owner, self._exited.append, shard).atexit = False
+            with self._shards_lock:
+                self._retire()
+                self._shards.add(shard)
+        return shard
+
+    def _retire(self):
+        """Fold the shards of the exited threads, with the lock held."""
+        while self._exited:
+            shard = self._exited.popleft()
+            self._shards.discard(shard)
+            self._retired.add(shard)
+
+    def _observe(self, histograms, key, seconds):
+        histogram = histograms.get(key)
+        if histogram is None:
+            # Bucket counts, then +Inf, sum and count
+            histogram = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def observe(self, idp, endpoint, phase, seconds):
+        """Record the duration of a phase of a request."""
+        if phase == "total":
+            # Recorded with the outcome by ``request``
+            return
+        self._observe(
+            self._shard().histograms, (PHASE_DURATION, idp, endpoint, phase), seconds
+        )
+
+    def request(self, idp, endpoint, outcome, seconds):
+        """Record a request."""
+        shard = self._shard()
+        key = (REQUESTS, idp, endpoint, outcome)
+        shard.counters[key] = shard.counters.get(key, 0) + 1
+        self._observe(
+            shard.histograms, (REQUEST_DURATION, idp, endpoint, outcome), seconds
+        )
+        if self.directory is not None and time.monotonic() >= self._next_flush:
+            self.flush(blocking=False)
+
+    def snapshot(self):
+        """Add up the metrics of the threads of the process.
+
+        :returns: Dictionary with the ``counters`` and ``histograms``, from
+            their key, the metric name followed by the label values, to their
+            value.
+        """
+        total = _Shard()
+        with self._shards_lock:
+            self._retire()
+            total.add(self._retired)
+            for shard in self._shards:
+                total.add(shard)
+        return {"counters": total.counters, "histograms": total.histograms}
+
+    def _path(self):
+        return os.path.join(
+            self.directory, "saml-metrics-{}-{}.json".format(os.getpid(), self._token)
+        )
+
+    def flush(self, blocking=True):
+        """Write the metrics of the process to the shared directory."""
+        if self.directory is None or not self._flush_lock.acquire(blocking):
+            return
+        try:
+            self._next_flush = time.monotonic() + self.flush_interval
+            snapshot = self.snapshot()
+            data = {
+                "buckets": self.buckets,
+                "counters": [list(k) + [v] for k, v in snapshot["counters"].items()],
+                "histograms": [
+                    list(k) + [v] for k, v in snapshot["histograms"].items()
+                ],
+            }
+            path = self._path()
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Add up the metrics of all the processes, or of this one only.
+
+        :returns: Same as :meth:`snapshot`.
+        """
+        if self.directory is None:
+            return self.snapshot()
+
+        self.flush()
+        counters, histograms = {}, {}
+        for path in glob.glob(os.path.join(self.directory, "saml-metrics-*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if tuple(data["buckets"]) != self.buckets:
+                continue
+            for *key, value in data["counters"]:
+                key = tuple(key)
+                counters[key] = counters.get(key, 0) + value
+            for *key, value in data["histograms"]:
+                key = tuple(key)
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = value
+                else:
+                    histograms[key] = [a + b for a, b in zip(total, value)]
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self):
+        """Render the metrics in the Prometheus text format."""
+        metrics = self.collect()
+        values = {name: [] for name in _METRICS}
+        for kind in ("counters", "histograms"):
+            for key, value in metrics[kind].items():
+                values[key[0]].append((key[1:], value))
+
+        bounds = ["{:g}".format(bound) for bound in self.buckets] + ["+Inf"]
+        lines = []
+        for name, (kind, documentation, label_names) in _METRICS.items():
+            lines.append("# HELP {} {}".format(name, documentation))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in sorted(values[name]):
+                if kind == "counter":
+                    lines.append(
+                        "{}{} {}".format(
+                            name, _format_labels(label_names, labels), value
+                        )
+                    )
+                    continue
+                cumulative = 0
+                for bound, count in zip(bounds, value):
+                    cumulative += count
+                    lines.append(
+                        "{}_bucket{} {}".format(
+                            name,
+                            _format_labels(
+                                label_names, labels, 'le="{}"'.format(bound)
+                            ),
+                            cumulative,
+                        )
+                    )
+                formatted = _format_labels(label_names, labels)
+                lines.append("{}_sum{} {}".format(name, formatted, value[-2]))
+                lines.append("{}_count{} {}".format(name, formatted, value[-1]))
+        return "\n".join(lines) + "\n"
+
+
+def in_process_metrics_factory(app):
+    """Create a sink keeping the metrics in the process.
+
+    The metrics are shared by the worker processes through the
+    ``SSO_SAML_METRICS_DIR`` directory if it is set.
+    """
+    return InProcessMetrics(
+        directory=app.config["SSO_SAML_METRICS_DIR"],
+        flush_interval=app.config["SSO_SAML_METRICS_FLUSH_INTERVAL"],
+    )
+
+
+def prometheus_metrics_sink_factory(app):
+    """Create a sink recording in the default ``prometheus_client`` registry."""
+    return PrometheusMetricsSink()
@@ -0,0 +1,357 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Processing of the SAML responses in a pool of worker processes.
+
+Decrypting the assertions and verifying their signatures is CPU bound and
+holds the GIL of the request threads. With ``SSO_SAML_OFFLOAD_WORKERS``, the
+responses are decoded, decrypted and validated by worker processes instead,
+and the request thread waits for the data of the validated assertion.
+
+The settings of the IdPs, with their keys and certificates, are sent to the
+workers when they are started, or along with the first responses of an IdP,
+and cached by the workers, so that the responses then refer to them by their
+fingerprint. The responses are processed by the request threads while the
+workers are started.
+"""
+
+import hashlib
+import multiprocessing
+import pickle
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from onelogin.saml2.response import OneLogin_Saml2_Response
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
+
+from .authn_requests import SessionRequests
+from .errors import OffloadUnavailable
+from .keys import get_key_cache, install_key_cache
+from .utils import project_response
+from .xml_utils import install_xml_cache, is_xml_cache_installed, max_xml_size
+
+GETTERS = (
+    "get_attributes",
+    "get_friendlyname_attributes",
+    "get_nameid",
+    "get_nameid_format",
+    "get_nameid_nq",
+    "get_nameid_spnq",
+    "get_session_index",
+    "get_session_not_on_or_after",
+    "get_id",
+    "get_assertion_id",
+    "get_assertion_issue_instant",
+    "get_authn_contexts",
+    "get_in_response_to",
+    "get_assertion_not_on_or_after",
+)
+"""Methods of the responses read by ``OneLogin_Saml2_Auth.store_valid_response``,
+called by the workers."""
+
+# Settings of the IdPs in the worker processes, by fingerprint
+_settings = {}
+
+
+def _initialize(preloaded, key_cache_size, xml_cache):
+    """Set up a worker like its parent and load the settings of the IdPs."""
+    if key_cache_size:
+        install_key_cache(key_cache_size)
+    if xml_cache:
+        install_xml_cache()
+    for token, blob in preloaded.items():
+        _settings[token] = pickle.loads(blob)
+
+
+def _ping():
+    return True
+
+
+class _WorkerResponse(OneLogin_Saml2_Response):
+    """Response timing its decryption."""
+
+    decrypt_time = 0.0
+
+    def _decrypt_assertion(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super(_WorkerResponse, self)._decrypt_assertion(*args, **kwargs)
+        finally:
+            self.decrypt_time += time.perf_counter() - start
+
+
+def _process_response(token, blob, request_data, request_id, projection, max_size):
+    """Decode, decrypt and validate a response in a worker.
+
+    :param blob: The pickled settings, if the worker may not have them yet.
+    :returns: ``None`` if the worker does not have the settings and they were
+        not sent.
+    """
+    settings = _settings.get(token)
+    if settings is None:
+        if blob is None:
+            return None
+        settings = _settings[token] = pickle.loads(blob)
+    with max_xml_size(max_size):
+        return _process(settings, request_data, request_id, projection)
+
+
+def _process(settings, request_data, request_id, projection):
+    start = time.perf_counter()
+    try:
+        response = _WorkerResponse(settings, request_data["post_data"]["SAMLResponse"])
+    except Exception as e:
+        # The exceptions of lxml and xmlsec cannot always be pickled
+        return ProcessedResponse(None, exception=str(e) or repr(e))
+    decode = time.perf_counter() - start - response.decrypt_time
+
+    start = time.perf_counter()
+    values = error = code = None
+    try:
+        if isinstance(request_id, SessionRequests):
+            request_id = request_id.match(response.get_in_response_to())
+        response.is_valid(request_data, request_id, raise_exceptions=True)
+        if projection is not None:
+            project_response(response, settings, projection)
+        values = {name: getattr(response, name)() for name in GETTERS}
+    except Exception as e:
+        error, code = str(e), getattr(e, "code", None)
+    phases = {
+        "decode": decode,
+        "decrypt": response.decrypt_time,
+        "verify": time.perf_counter() - start,
+    }
+
+    xml = OneLogin_Saml2_XML.to_string(response.get_xml_document()).decode("utf-8")
+    return ProcessedResponse(xml, values, error, code, phases)
+
+
+class ProcessedResponse(object):
+    """Data of a response processed by a worker.
+
+    Its ``get_*`` methods, see :data:`GETTERS`, return the values read by the
+    worker from the validated response.
+    """
+
+    def __init__(
+        self, xml, values=None, error=None, code=None, phases=None, exception=None
+    ):
+        """Initialize the data.
+
+        :param xml: XML of the response, decrypted if it was encrypted.
+        :param values: Values of the :data:`GETTERS` if the response is valid.
+        :param error: Validation error of the response.
+        :param code: Code of the ``OneLogin_Saml2_ValidationError``, if any.
+        :param phases: Duration of the phases in the worker.
+        :param exception: Error raised when decoding the response.
+        """
+        self.xml = xml
+        self.values = values
+        self.error = error
+        self.code = code
+        self.phases = phases or {}
+        self.exception = exception
+
+    @property
+    def is_valid(self):
+        """Whether the response is valid."""
+        return self.values is not None
+
+    def __getattr__(self, name):
+        """Get the value read by a getter of the response."""
+        values = self.__dict__.get("values")
+        if not values or name not in values:
+            raise AttributeError(name)
+        value = values[name]
+        return lambda: value
+
+
+class ResponsePool(object):
+    """Pool of worker processes processing the SAML responses.
+
+    The settings of the IdPs the workers were not started with are sent along
+    with the first ``workers`` responses of each IdP, and again to a worker
+    which did not get them yet.
+
+    At most ``workers + queue_size`` responses are processed or waiting for a
+    worker, further ones are rejected instead of queued.
+    """
+
+    def __init__(self, workers, queue_size=0, timeout=5.0, start_method="spawn"):
+        """Initialize the pool, the processes are started on demand.
+
+        :param workers: Number of worker processes.
+        :param queue_size: Number of responses waiting for a worker.
+        :param timeout: Seconds to wait for a response to be processed.
+        :param start_method: ``multiprocessing`` start method of the workers.
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._tokens = weakref.WeakKeyDictionary()
+        self._tokens_lock = threading.Lock()
+        self._executor = None
+        # Number of times the settings were sent to the workers, by fingerprint
+        self._sent = {}
+        self._pings = ()
+        self._executor_lock = threading.Lock()
+
+    def _token(self, settings):
+        """Get the fingerprint and pickled form of settings, computed once."""
+        try:
+            return self._tokens[settings]
+        except KeyError:
+            with self._tokens_lock:
+                token = self._tokens.get(settings)
+                if token is None:
+                    blob = pickle.dumps(settings)
+                    token = self._tokens[settings] = (
+                        hashlib.sha256(blob).hexdigest(),
+                        blob,
+                    )
+                return token
+
+    def _start(self):
+        """Start an executor loading all the known settings.
+
+        The executor lock must be held.
+        """
+        with self._tokens_lock:
+            preloaded = dict(self._tokens.values())
+        key_cache = get_key_cache()
+        executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_initialize,
+            initargs=(
+                preloaded,
+                key_cache.size if key_cache is not None else 0,
+                is_xml_cache_installed(),
+            ),
+        )
+        self._executor = executor
+        self._sent = dict.fromkeys(preloaded, self.workers)
+        self._pings = [executor.submit(_ping) for _ in range(self.workers)]
+
+    def start(self, settings=(), wait=True):
+        """Start the worker processes now instead of on the first responses.
+
+        :param settings: ``OneLogin_Saml2_Settings`` to load in the workers
+            when they start, the other ones are sent with the responses.
+        :param wait: Wait for the workers to be started.
+        """
+        for s in settings:
+            self._token(s)
+        with self._executor_lock:
+            if self._executor is None:
+                self._start()
+            pings = self._pings
+        if wait:
+            for future in pings:
+                future.result()
+
+    def ready(self, settings):
+        """Whether the workers are started.
+
+        Otherwise they are started in the background, and the responses
+        should meanwhile be processed in the request thread.
+
+        :param settings: ``OneLogin_Saml2_Settings`` of the IdP, loaded in
+            the workers when they start.
+        """
+        if self._executor is not None and all(future.done() for future in self._pings):
+            return True
+        self.start([settings], wait=False)
+        return False
+
+    def _reset(self, executor):
+        """Replace a broken executor."""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def process(
+        self,
+        settings,
+        request_data,
+        request_id=None,
+        projection=None,
+        max_xml_size=None,
+    ):
+        """Process a response in a worker.
+
+        The workers must be started, see :meth:`ready`.
+
+        :param settings: ``OneLogin_Saml2_Settings`` of the IdP.
+        :param request_data: Request data, with the ``SAMLResponse`` in the
+            ``post_data``, as given to ``OneLogin_Saml2_Auth``.
+        :param request_id: ID of the request the response must answer.
+        :param projection: Names of the only attributes to read, or ``None``.
+        :param max_xml_size: Maximum size in bytes of the XML of the response.
+        :returns: A :class:`ProcessedResponse`.
+        :raises invenio_saml.errors.OffloadUnavailable: If the pool is full,
+            the response is not processed in time or a worker died.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise OffloadUnavailable("Too many pending SAML responses")
+        token, blob = self._token(settings)
+        args = (request_data, request_id, projection, max_xml_size)
+        deadline = time.monotonic() + self.timeout
+        future = None
+        try:
+            executor, future = self._submit(token, blob, args)
+            result = self._wait(executor, future, deadline)
+            if result is None:
+                # The worker did not get the settings yet
+                executor, future = self._submit(token, blob, args, send=True)
+                result = self._wait(executor, future, deadline)
+            return result
+        finally:
+            if future is None:
+                self._slots.release()
+            else:
+                future.add_done_callback(lambda f: self._slots.release())
+
+    def _submit(self, token, blob, args, send=False):
+        """Submit a response to the executor.
+
+        The settings are sent along with the first ``workers`` responses of
+        an IdP, or if ``send`` is set.
+
+        :returns: The executor and the future of the response.
+        """
+        # Not shut down while submitting
+        with self._executor_lock:
+            executor = self._executor
+            if executor is None:
+                raise OffloadUnavailable("SAML response workers not started")
+            sent = self._sent.get(token, 0)
+            if send or sent < self.workers:
+                self._sent[token] = sent + 1
+            else:
+                blob = None
+            return executor, executor.submit(_process_response, token, blob, *args)
+
+    def _wait(self, executor, future, deadline):
+        """Wait for a response processed by a worker until the deadline."""
+        try:
+            return future.result(max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            raise OffloadUnavailable("SAML response not processed in time")
+        except BrokenProcessPool as e:
+            self._reset(executor)
+            raise OffloadUnavailable("SAML response worker died") from e
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
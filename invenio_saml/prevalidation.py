@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cheap checks of the SAML messages before they are processed.
+
+The ACS and SLS otherwise decode, inflate and parse any payload before
+rejecting it. :func:`check_message` rejects the oversized or malformed
+messages first, with a bounded amount of work:
+
+* the size of the encoded message is checked first,
+* the root element of the XML is sniffed from its first bytes, so that most
+  garbage is rejected after decoding the beginning of the message,
+* the base64 alphabet and padding of the message are matched, without
+  decoding it,
+* the size of the XML is computed from the size of the message, and a
+  deflated message, which is decoded first, is inflated at most up to the
+  maximum XML size and inflate ratio.
+
+The rejected messages are answered with a 400 and the reason, one of
+:data:`REASONS`, which is also the outcome of the request in the metrics.
+"""
+
+import base64
+import binascii
+import re
+import zlib
+from collections import namedtuple
+
+from .errors import MessageRejected
+
+REASONS = (
+    "message_too_large",
+    "invalid_base64",
+    "xml_too_large",
+    "inflate_ratio_exceeded",
+    "unexpected_root",
+)
+"""Reasons of the rejections of the messages."""
+
+MessageLimits = namedtuple(
+    "MessageLimits", ("max_message_size", "max_xml_size", "max_inflate_ratio")
+)
+"""Limits of the SAML messages, each one ``None`` for no limit: the maximum
+size of the encoded message, of its XML in bytes and the maximum ratio of the
+inflated to the deflated size."""
+
+SNIFF_SIZE = 1024
+"""Number of bytes of the XML in which the root element must start."""
+
+# IdPs may wrap the messages in lines
+_WHITESPACE = "\r\n\t "
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/\r\n\t ]*(?:=[\r\n\t ]*){0,2}")
+
+_STRIP_WHITESPACE = str.maketrans("", "", _WHITESPACE)
+
+_ROOT = re.compile(
+    rb"(?:\xef\xbb\xbf)?\s*(?:<\?xml[^>]*\?>\s*)?(?:<!--.*?-->\s*)*"
+    rb"<(?:[A-Za-z_][\w.-]*:)?([A-Za-z_][\w.-]*)[\s/>]",
+    re.S,
+)
+
+
+def _strip(message):
+    """Check the base64 alphabet of a message and remove its whitespace."""
+    if not _BASE64.fullmatch(message):
+        raise MessageRejected("invalid_base64")
+    if any(c in message for c in _WHITESPACE):
+        message = message.translate(_STRIP_WHITESPACE)
+    return message
+
+
+def _decode(message):
+    try:
+        return base64.b64decode(message)
+    except binascii.Error:
+        raise MessageRejected("invalid_base64", "incorrect padding")
+
+
+def _inflate(data, limits):
+    """Inflate a message like OneLogin, failing once it exceeds the limits."""
+    max_size, reason = limits.max_xml_size, "xml_too_large"
+    if limits.max_inflate_ratio is not None:
+        max_ratio_size = len(data) * limits.max_inflate_ratio
+        if max_size is None or max_ratio_size < max_size:
+            max_size, reason = max_ratio_size, "inflate_ratio_exceeded"
+
+    inflater = zlib.decompressobj(-15)
+    try:
+        xml = inflater.decompress(data, 0 if max_size is None else max_size + 1)
+    except zlib.error:
+        # OneLogin falls back to the message which is not deflated
+        return data
+    if max_size is not None and len(xml) > max_size:
+        raise MessageRejected(reason, "inflated beyond {} bytes".format(max_size))
+    return xml if inflater.eof else data
+
+
+def _sniff(xml, root):
+    """Check the root element of the beginning of an XML document."""
+    match = _ROOT.match(xml, 0, SNIFF_SIZE)
+    if match is None or match.group(1).decode() != root:
+        raise MessageRejected(
+            "unexpected_root",
+            match.group(1).decode() if match is not None else "not found",
+        )
+
+
+def check_message(
+    message, root, deflated=False, limits=MessageLimits(None, None, None)
+):
+    """Check a SAML message of a request before it is processed.
+
+    :param message: Base64 encoded message, e.g. the ``SAMLResponse``.
+    :param root: Expected local name of the root element, e.g.
+        ``"Response"``.
+    :param deflated: Whether the message is deflated, as with the
+        HTTP-Redirect binding.
+    :param limits: :class:`MessageLimits` of the message.
+    :raises invenio_saml.errors.MessageRejected: If the message is rejected.
+    """
+    max_message_size = limits.max_message_size
+    if max_message_size is not None and len(message) > max_message_size:
+        raise MessageRejected("message_too_large", "{} characters".format(len(message)))
+
+    if deflated:
+        xml = _inflate(_decode(_strip(message)), limits)
+        size = len(xml)
+    else:
+        # Most garbage is rejected from the beginning of the message
+        sniff_length = SNIFF_SIZE // 3 * 4
+        head = _strip(message[: sniff_length * 2])[:sniff_length]
+        _sniff(_decode(head[: len(head) // 4 * 4]), root)
+        message = _strip(message)
+        if len(message) % 4:
+            raise MessageRejected("invalid_base64", "incorrect padding")
+        # The size of the XML is known without decoding the message
+        size = len(message) // 4 * 3 - message[-2:].count("=")
+    if limits.max_xml_size is not None and size > limits.max_xml_size:
+        raise MessageRejected("xml_too_large", "{} bytes".format(size))
+    if deflated:
+        _sniff(xml, root)
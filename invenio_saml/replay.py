@@ -0,0 +1,100 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Replay detection of SAML assertions.
+
+The ID of every accepted assertion is remembered until the assertion expires,
+so that posting the same response again is rejected.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReplayCache(object):
+    """Interface of the replay cache backends."""
+
+    def add(self, key, expires):
+        """Remember a key until it expires.
+
+        :param key: Key to remember, e.g. the assertion ID.
+        :param expires: Unix timestamp until which the key is remembered.
+        :returns: ``False`` if the key was already known (a replay), ``True``
+            otherwise.
+        """
+        raise NotImplementedError()
+
+
+class MemoryReplayCache(ReplayCache):
+    """In-process replay cache.
+
+    Keys are kept in insertion order and evicted once expired or, when the
+    cache is full, from the oldest one. Lookups and insertions are O(1).
+    Each worker process has its own cache, use a shared backend when running
+    several of them.
+    """
+
+    def __init__(self, max_size=100000):
+        """Initialize the cache.
+
+        :param max_size: Maximum number of keys kept.
+        """
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of keys in the cache."""
+        return len(self._keys)
+
+    def add(self, key, expires):
+        """Remember a key until it expires."""
+        now = time.time()
+        with self._lock:
+            known = self._keys.get(key)
+            if known is not None and known > now:
+                return False
+            self._keys[key] = expires
+            self._keys.move_to_end(key)
+            while self._keys:
+                oldest, oldest_expires = next(iter(self._keys.items()))
+                if oldest_expires > now and len(self._keys) <= self.max_size:
+                    break
+                del self._keys[oldest]
+        return True
+
+
+class RedisReplayCache(ReplayCache):
+    """Replay cache shared between processes through Redis.
+
+    Any client implementing ``set(name, value, nx=True, ex=seconds)`` with the
+    Redis semantics can be used.
+    """
+
+    def __init__(self, client, prefix="saml:replay:"):
+        """Initialize the cache.
+
+        :param client: Redis client.
+        :param prefix: Prefix of the Redis keys.
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def add(self, key, expires):
+        """Remember a key until it expires."""
+        ttl = max(1, int(math.ceil(expires - time.time())))
+        return bool(self.client.set(self.prefix + key, 1, nx=True, ex=ttl))
+
+
+def memory_replay_cache_factory(app):
+    """Create an in-process replay cache."""
+    return MemoryReplayCache(max_size=app.config["SSO_SAML_REPLAY_CACHE_SIZE"])
+
+
+def redis_replay_cache_factory(app):
+    """Create a replay cache stored in the ``CACHE_REDIS_URL`` Redis."""
+    from redis import StrictRedis
+
+    return RedisReplayCache(StrictRedis.from_url(app.config["CACHE_REDIS_URL"]))
@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Compiled runtime of an Identity Provider."""
+
+import os
+from copy import deepcopy
+from types import MappingProxyType
+
+from onelogin.saml2.settings import OneLogin_Saml2_Settings
+
+from .keys import get_key_cache, load_key_material
+from .mappings import ACCOUNT_FIELDS, AttributeExtractor
+
+HANDLERS = (
+    "settings_handler",
+    "login_handler",
+    "acs_handler",
+    "logout_handler",
+    "sls_handler",
+)
+"""Names of the handlers an Identity Provider can define."""
+
+SOURCE_FILES = (
+    "settings_file_path",
+    "sp_cert_file",
+    "sp_key_file",
+    "federation_file",
+    "federation_index",
+)
+"""Configuration keys of the files an Identity Provider is built from."""
+
+
+def _mtime(path):
+    """Modification time of a file or ``None`` if it cannot be read."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class IdentityProviderRuntime(object):
+    """Read-only runtime object of an Identity Provider.
+
+    It bundles everything needed to serve a request for an IdP: the
+    validated ``OneLogin_Saml2_Settings`` object, the resolved handlers, the
+    compiled attribute mappings and the loaded SP and IdP key material. It is
+    built once per IdP and shared by all the requests, so it must not be
+    modified.
+    """
+
+    __slots__ = (
+        "_idp",
+        "_config",
+        "_settings",
+        "_handlers",
+        "_extractor",
+        "_sources",
+        "_keys",
+    )
+
+    def __init__(self, idp, config):
+        """Compile the runtime from a fully built IdP configuration.
+
+        :param idp: Identity provider key.
+        :param config: Configuration dictionary as built by
+            ``_InvenioSSOSAMLState._build_configuration``.
+        """
+        object.__setattr__(self, "_idp", idp)
+        object.__setattr__(self, "_config", config)
+        # OneLogin formats certificates and keys in place, work on a copy so
+        # that the configuration keeps the values as they were provided.
+        object.__setattr__(
+            self, "_settings", OneLogin_Saml2_Settings(deepcopy(config["settings"]))
+        )
+        object.__setattr__(
+            self,
+            "_handlers",
+            MappingProxyType({name: config.get(name) for name in HANDLERS}),
+        )
+        object.__setattr__(
+            self,
+            "_extractor",
+            AttributeExtractor(config.get("mappings") or {}, ACCOUNT_FIELDS),
+        )
+        object.__setattr__(
+            self,
+            "_sources",
+            tuple(
+                (config[key], _mtime(config[key]))
+                for key in SOURCE_FILES
+                if config.get(key)
+            ),
+        )
+        cache = get_key_cache()
+        object.__setattr__(
+            self,
+            "_keys",
+            load_key_material(self._settings, cache) if cache is not None else None,
+        )
+
+    def __setattr__(self, name, value):
+        """Prevent modifications, the runtime is shared between requests."""
+        raise AttributeError("IdentityProviderRuntime is read-only")
+
+    @property
+    def idp(self):
+        """Identity provider key."""
+        return self._idp
+
+    @property
+    def config(self):
+        """Configuration dictionary the runtime was built from."""
+        return self._config
+
+    @property
+    def settings(self):
+        """Validated ``OneLogin_Saml2_Settings`` object."""
+        return self._settings
+
+    @property
+    def handlers(self):
+        """Read-only mapping of handler names to callables (or ``None``)."""
+        return self._handlers
+
+    @property
+    def extractor(self):
+        """Compiled :class:`invenio_saml.mappings.AttributeExtractor`."""
+        return self._extractor
+
+    @property
+    def keys(self):
+        """Loaded :class:`invenio_saml.keys.KeyMaterial` or ``None``.
+
+        It is only loaded if the key cache is installed.
+        """
+        return self._keys
+
+    def is_stale(self):
+        """Whether any of the files the runtime was built from has changed."""
+        return any(_mtime(path) != mtime for path, mtime in self._sources)
+
+    @property
+    def sp_cert(self):
+        """Formatted SP certificate or ``None``."""
+        return self._settings.get_sp_cert()
+
+    @property
+    def sp_key(self):
+        """Formatted SP private key or ``None``."""
+        return self._settings.get_sp_key()
@@ -0,0 +1,798 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Helpers to exercise the SP without a real Identity Provider.
+
+They build the messages an IdP would send, signed with the given IdP key and
+optionally encrypted for the SP, so that the views can be tested and
+benchmarked offline. :class:`MockIdP` answers the requests of the SP like an
+IdP would, either called directly or through its Flask application, and
+:class:`LoadDriver` runs complete login and logout cycles against the views
+to measure them under load, see the ``saml load-test`` command.
+"""
+
+import base64
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlencode, urljoin, urlsplit
+from urllib.request import (
+    HTTPCookieProcessor,
+    HTTPRedirectHandler,
+    HTTPSHandler,
+    build_opener,
+)
+from xml.sax.saxutils import escape, quoteattr
+
+import xmlsec
+from flask import Flask, abort, redirect, request
+from lxml import etree
+from onelogin.saml2.constants import OneLogin_Saml2_Constants
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
+
+_RESPONSE = """<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" \
+xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" ID="{response_id}" \
+Version="2.0" IssueInstant="{now}" Destination={destination}{in_response_to}>\
+<saml:Issuer>{issuer}</saml:Issuer>\
+<samlp:Status><samlp:StatusCode \
+Value="urn:oasis:names:tc:SAML:2.0:status:Success"/></samlp:Status>\
+</samlp:Response>"""
+
+_ASSERTION = """<saml:Assertion xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" \
+xmlns:xs="http://www.w3.org/2001/XMLSchema" \
+xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ID="{assertion_id}" \
+Version="2.0" IssueInstant="{now}">\
+<saml:Issuer>{issuer}</saml:Issuer>\
+<saml:Subject><saml:NameID Format={name_id_format}>{name_id}</saml:NameID>\
+<saml:SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">\
+<saml:SubjectConfirmationData NotOnOrAfter="{not_on_or_after}" \
+Recipient={destination}{in_response_to}/></saml:SubjectConfirmation>\
+</saml:Subject>\
+<saml:Conditions NotBefore="{not_before}" NotOnOrAfter="{not_on_or_after}">\
+<saml:AudienceRestriction><saml:Audience>{audience}</saml:Audience>\
+</saml:AudienceRestriction></saml:Conditions>\
+<saml:AuthnStatement AuthnInstant="{now}" SessionIndex="{session_index}" \
+SessionNotOnOrAfter="{not_on_or_after}"><saml:AuthnContext>\
+<saml:AuthnContextClassRef>\
+urn:oasis:names:tc:SAML:2.0:ac:classes:PasswordProtectedTransport\
+</saml:AuthnContextClassRef></saml:AuthnContext></saml:AuthnStatement>\
+{attributes}</saml:Assertion>"""
+
+_ATTRIBUTE_STATEMENT = """<saml:AttributeStatement>{attributes}\
+</saml:AttributeStatement>"""
+
+_ATTRIBUTE = """<saml:Attribute Name={name} \
+NameFormat="urn:oasis:names:tc:SAML:2.0:attrname-format:uri">{values}\
+</saml:Attribute>"""
+
+_ATTRIBUTE_VALUE = """<saml:AttributeValue \
+xsi:type="xs:string">{value}</saml:AttributeValue>"""
+
+_LOGOUT_RESPONSE = """<samlp:LogoutResponse \
+xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" \
+xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" ID="{response_id}" \
+Version="2.0" IssueInstant="{now}" Destination={destination}{in_response_to}>\
+<saml:Issuer>{issuer}</saml:Issuer>\
+<samlp:Status><samlp:StatusCode \
+Value="urn:oasis:names:tc:SAML:2.0:status:Success"/></samlp:Status>\
+</samlp:LogoutResponse>"""
+
+
+_LOGOUT_REQUEST = """<samlp:LogoutRequest \
+xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" \
+xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" ID="{request_id}" \
+Version="2.0" IssueInstant="{now}" Destination={destination}>\
+<saml:Issuer>{issuer}</saml:Issuer>\
+<saml:NameID Format={name_id_format}>{name_id}</saml:NameID>{session_index}\
+</samlp:LogoutRequest>"""
+
+_SESSION_INDEX = "<samlp:SessionIndex>{}</samlp:SessionIndex>"
+
+_POST_FORM = """<!DOCTYPE html>
+<html><body onload="document.forms[0].submit()">
+<form method="post" action={action}>{inputs}
+<noscript><button type="submit">Continue</button></noscript>
+</form></body></html>"""
+
+_INPUT = '<input type="hidden" name={name} value={value}>'
+
+_IDP_METADATA = """<md:EntityDescriptor \
+xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata" \
+xmlns:ds="http://www.w3.org/2000/09/xmldsig#" entityID={entity_id}>\
+<md:IDPSSODescriptor WantAuthnRequestsSigned="false" \
+protocolSupportEnumeration="urn:oasis:names:tc:SAML:2.0:protocol">\
+<md:KeyDescriptor use="signing"><ds:KeyInfo><ds:X509Data>\
+<ds:X509Certificate>{cert}</ds:X509Certificate>\
+</ds:X509Data></ds:KeyInfo></md:KeyDescriptor>\
+<md:SingleLogoutService \
+Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect" Location={slo_url}/>\
+<md:SingleSignOnService \
+Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect" Location={sso_url}/>\
+</md:IDPSSODescriptor></md:EntityDescriptor>"""
+
+_NAME_ID_FORMAT = "urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified"
+
+
+def _now():
+    return OneLogin_Saml2_Utils.parse_time_to_SAML(int(time.time()))
+
+
+def _in_response_to(request_id):
+    return " InResponseTo={}".format(quoteattr(request_id)) if request_id else ""
+
+
+def _attribute_statement(attributes):
+    """Build the ``AttributeStatement``, omitted if there are no attributes."""
+    if not attributes:
+        return ""
+    return _ATTRIBUTE_STATEMENT.format(
+        attributes="".join(
+            _ATTRIBUTE.format(
+                name=quoteattr(name),
+                values="".join(
+                    _ATTRIBUTE_VALUE.format(value=escape(value)) for value in values
+                ),
+            )
+            for name, values in attributes.items()
+        )
+    )
+
+
+def _sign(xml, key, cert):
+    """Sign the root element of ``xml``, return the signed element."""
+    return OneLogin_Saml2_XML.to_etree(
+        OneLogin_Saml2_Utils.add_sign(
+            xml,
+            key,
+            cert,
+            sign_algorithm=OneLogin_Saml2_Constants.RSA_SHA256,
+            digest_algorithm=OneLogin_Saml2_Constants.SHA256,
+        )
+    )
+
+
+def _encrypt(element, cert):
+    """Replace ``element`` by its encryption for the holder of ``cert``."""
+    template = xmlsec.template.encrypted_data_create(
+        element, xmlsec.Transform.AES128, type=xmlsec.EncryptionType.ELEMENT, ns="xenc"
+    )
+    xmlsec.template.encrypted_data_ensure_cipher_value(template)
+    key_info = xmlsec.template.encrypted_data_ensure_key_info(template, ns="dsig")
+    encrypted_key = xmlsec.template.add_encrypted_key(
+        key_info, xmlsec.Transform.RSA_OAEP
+    )
+    xmlsec.template.encrypted_data_ensure_cipher_value(encrypted_key)
+
+    manager = xmlsec.KeysManager()
+    manager.add_key(xmlsec.Key.from_memory(cert, xmlsec.KeyFormat.CERT_PEM, None))
+    context = xmlsec.EncryptionContext(manager)
+    context.key = xmlsec.Key.generate(
+        xmlsec.KeyData.AES, 128, xmlsec.KeyDataType.SESSION
+    )
+    return context.encrypt_xml(template, element)
+
+
+class ServiceProvider(object):
+    """What an IdP knows about a Service Provider."""
+
+    __slots__ = (
+        "entity_id",
+        "acs_url",
+        "sls_url",
+        "name_id_format",
+        "cert",
+        "want_assertions_encrypted",
+    )
+
+    def __init__(
+        self,
+        entity_id,
+        acs_url,
+        sls_url=None,
+        name_id_format=_NAME_ID_FORMAT,
+        cert=None,
+        want_assertions_encrypted=False,
+    ):
+        """Initialize the Service Provider.
+
+        :param entity_id: Entity ID of the SP, the audience of the assertions.
+        :param acs_url: URL of its Assertion Consumer Service.
+        :param sls_url: URL of its Single Logout Service.
+        :param name_id_format: Format of the NameID it expects.
+        :param cert: Its certificate (PEM), used to encrypt the assertions.
+        :param want_assertions_encrypted: Encrypt the assertions sent to it.
+        """
+        self.entity_id = entity_id
+        self.acs_url = acs_url
+        self.sls_url = sls_url
+        self.name_id_format = name_id_format
+        self.cert = cert
+        self.want_assertions_encrypted = want_assertions_encrypted
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build it from the ``OneLogin_Saml2_Settings`` of the SP for an IdP."""
+        sp = settings.get_sp_data()
+        return cls(
+            sp["entityId"],
+            sp["assertionConsumerService"]["url"],
+            sls_url=sp.get("singleLogoutService", {}).get("url"),
+            name_id_format=sp.get("NameIDFormat", _NAME_ID_FORMAT),
+            cert=settings.get_sp_cert(),
+            want_assertions_encrypted=settings.get_security_data().get(
+                "wantAssertionsEncrypted", False
+            ),
+        )
+
+
+def _build_response(
+    issuer,
+    sp,
+    idp_key,
+    idp_cert,
+    name_id,
+    attributes=None,
+    in_response_to=None,
+    session_index=None,
+    sign_assertion=True,
+    sign_response=False,
+    encrypt=False,
+    lifetime=300,
+):
+    """Build the ``Response`` of the IdP ``issuer`` to the :class:`ServiceProvider`."""
+    now = int(time.time())
+    values = dict(
+        response_id=OneLogin_Saml2_Utils.generate_unique_id(),
+        assertion_id=OneLogin_Saml2_Utils.generate_unique_id(),
+        session_index=session_index or OneLogin_Saml2_Utils.generate_unique_id(),
+        now=OneLogin_Saml2_Utils.parse_time_to_SAML(now),
+        not_before=OneLogin_Saml2_Utils.parse_time_to_SAML(now - 60),
+        not_on_or_after=OneLogin_Saml2_Utils.parse_time_to_SAML(now + lifetime),
+        destination=quoteattr(sp.acs_url),
+        in_response_to=_in_response_to(in_response_to),
+        issuer=escape(issuer),
+        audience=escape(sp.entity_id),
+        name_id=escape(name_id),
+        name_id_format=quoteattr(sp.name_id_format),
+        attributes=_attribute_statement(attributes),
+    )
+
+    assertion = _ASSERTION.format(**values)
+    if sign_assertion:
+        assertion = _sign(assertion, idp_key, idp_cert)
+    else:
+        assertion = OneLogin_Saml2_XML.to_etree(assertion)
+
+    response = OneLogin_Saml2_XML.to_etree(_RESPONSE.format(**values))
+    if encrypt:
+        container = etree.SubElement(
+            response, "{%s}EncryptedAssertion" % OneLogin_Saml2_Constants.NS_SAML
+        )
+        container.append(assertion)
+        _encrypt(assertion, sp.cert)
+    else:
+        response.append(assertion)
+
+    if sign_response:
+        response = _sign(response, idp_key, idp_cert)
+    return etree.tostring(response)
+
+
+def build_response(
+    settings,
+    idp_key,
+    idp_cert,
+    name_id,
+    attributes=None,
+    in_response_to=None,
+    session_index=None,
+    sign_assertion=True,
+    sign_response=False,
+    encrypt=False,
+    lifetime=300,
+):
+    """Build the ``Response`` an IdP sends to the ACS of the SP.
+
+    :param settings: ``OneLogin_Saml2_Settings`` of the SP for the IdP.
+    :param idp_key: Private key (PEM) the IdP signs with.
+    :param idp_cert: Certificate (PEM) of ``idp_key``.
+    :param name_id: NameID of the subject.
+    :param attributes: Dictionary of attribute names to lists of values.
+    :param in_response_to: ID of the ``AuthnRequest`` answered, if any.
+    :param session_index: Session index, a new one by default.
+    :param sign_assertion: Sign the assertion.
+    :param sign_response: Sign the response.
+    :param encrypt: Encrypt the assertion for the SP certificate.
+    :param lifetime: Seconds the assertion is valid.
+    :returns: The response XML (bytes).
+    """
+    return _build_response(
+        settings.get_idp_data()["entityId"],
+        ServiceProvider.from_settings(settings),
+        idp_key,
+        idp_cert,
+        name_id,
+        attributes=attributes,
+        in_response_to=in_response_to,
+        session_index=session_index,
+        sign_assertion=sign_assertion,
+        sign_response=sign_response,
+        encrypt=encrypt,
+        lifetime=lifetime,
+    )
+
+
+def build_logout_response(settings, in_response_to=None):
+    """Build the ``LogoutResponse`` an IdP sends to the SLS of the SP.
+
+    :param settings: ``OneLogin_Saml2_Settings`` of the SP for the IdP.
+    :param in_response_to: ID of the ``LogoutRequest`` answered, if any.
+    :returns: The response XML (str), to be sent with
+        ``OneLogin_Saml2_Utils.deflate_and_base64_encode``.
+    """
+    sp, idp = settings.get_sp_data(), settings.get_idp_data()
+    return _LOGOUT_RESPONSE.format(
+        response_id=OneLogin_Saml2_Utils.generate_unique_id(),
+        now=_now(),
+        destination=quoteattr(sp["singleLogoutService"]["url"]),
+        in_response_to=_in_response_to(in_response_to),
+        issuer=escape(idp["entityId"]),
+    )
+
+
+def default_attributes(name_id):
+    """Attributes released for ``name_id`` by :class:`MockIdP`.
+
+    The usual eduPerson attributes, named by their OID, derived from the
+    NameID, e.g. ``federico@example.org``.
+    """
+    user, _, domain = name_id.partition("@")
+    domain = domain or "example.org"
+    return {
+        "urn:oid:0.9.2342.19200300.100.1.3": [user + "@" + domain],
+        "urn:oid:2.5.4.42": [user],
+        "urn:oid:2.5.4.4": ["Tester"],
+        "urn:oid:1.3.6.1.4.1.5923.1.1.1.6": [user + "@" + domain],
+        "urn:oid:1.3.6.1.4.1.5923.1.1.1.9": ["member@" + domain],
+    }
+
+
+class MockIdP(object):
+    """Stand-in Identity Provider.
+
+    It answers the ``AuthnRequest`` and ``LogoutRequest`` of the registered
+    Service Providers with signed messages and sends them ``LogoutRequest``.
+    Requests from unknown SPs are answered at the URL given in the request,
+    without encryption. It keeps no state, so one instance can be shared by
+    many threads.
+    """
+
+    def __init__(
+        self,
+        key,
+        cert,
+        entity_id="https://idp.example.org",
+        attributes=default_attributes,
+        sign_response=False,
+    ):
+        """Initialize the IdP.
+
+        :param key: Private key (PEM) the IdP signs with.
+        :param cert: Certificate (PEM) of ``key``.
+        :param entity_id: Entity ID of the IdP.
+        :param attributes: Callable returning the attributes released for a
+            NameID.
+        :param sign_response: Sign the responses besides the assertions.
+        """
+        self.key = key
+        self.cert = cert
+        self.entity_id = entity_id
+        self.attributes = attributes
+        self.sign_response = sign_response
+        self.service_providers = {}
+
+    def add_service_provider(self, sp):
+        """Register a :class:`ServiceProvider` or SP ``OneLogin_Saml2_Settings``."""
+        if not isinstance(sp, ServiceProvider):
+            sp = ServiceProvider.from_settings(sp)
+        self.service_providers[sp.entity_id] = sp
+        return sp
+
+    def _service_provider(self, message, url_attribute=None):
+        """Get the SP which sent a message, or a stand-in for unknown ones."""
+        issuer = message.find("{%s}Issuer" % OneLogin_Saml2_Constants.NS_SAML)
+        entity_id = issuer.text.strip() if issuer is not None else None
+        sp = self.service_providers.get(entity_id)
+        if sp is None and url_attribute and message.get(url_attribute):
+            sp = ServiceProvider(entity_id, message.get(url_attribute))
+        if sp is None:
+            raise ValueError("Unknown Service Provider {!r}".format(entity_id))
+        return sp
+
+    def _signed_query(self, url, saml_type, xml, relay_state=None):
+        """Add a message to an URL with the HTTP-Redirect binding, signed."""
+        escape_url = OneLogin_Saml2_Utils.escape_url
+        query = [
+            "{}={}".format(
+                saml_type,
+                escape_url(OneLogin_Saml2_Utils.deflate_and_base64_encode(xml)),
+            )
+        ]
+        if relay_state is not None:
+            query.append("RelayState=" + escape_url(relay_state))
+        query.append("SigAlg=" + escape_url(OneLogin_Saml2_Constants.RSA_SHA256))
+        signature = OneLogin_Saml2_Utils.sign_binary("&".join(query), self.key)
+        query.append("Signature=" + escape_url(base64.b64encode(signature).decode()))
+        return url + ("&" if "?" in url else "?") + "&".join(query)
+
+    def login(self, url, name_id, session_index=None):
+        """Authenticate ``name_id`` for the ``AuthnRequest`` in ``url``.
+
+        :param url: URL the SP redirected to, with the ``SAMLRequest`` and
+            ``RelayState`` of the HTTP-Redirect binding.
+        :param name_id: NameID of the authenticated user.
+        :param session_index: Session index, a new one by default.
+        :returns: The ACS URL and the form data to post to it.
+        """
+        args = parse_qs(urlsplit(url).query)
+        request = OneLogin_Saml2_XML.to_etree(
+            OneLogin_Saml2_Utils.decode_base64_and_inflate(args["SAMLRequest"][0])
+        )
+        sp = self._service_provider(request, "AssertionConsumerServiceURL")
+        response = _build_response(
+            self.entity_id,
+            sp,
+            self.key,
+            self.cert,
+            name_id,
+            attributes=self.attributes(name_id),
+            in_response_to=request.get("ID"),
+            session_index=session_index,
+            sign_response=self.sign_response,
+            encrypt=sp.want_assertions_encrypted and sp.cert is not None,
+        )
+        data = {"SAMLResponse": base64.b64encode(response).decode()}
+        if "RelayState" in args:
+            data["RelayState"] = args["RelayState"][0]
+        return sp.acs_url, data
+
+    def logout(self, url):
+        """Log out for the ``LogoutRequest`` of a SP in ``url``.
+
+        :param url: URL the SP redirected to, with the ``SAMLRequest`` and
+            ``RelayState`` of the HTTP-Redirect binding.
+        :returns: The SLS URL of the SP with the signed ``LogoutResponse``.
+        """
+        args = parse_qs(urlsplit(url).query)
+        request = OneLogin_Saml2_XML.to_etree(
+            OneLogin_Saml2_Utils.decode_base64_and_inflate(args["SAMLRequest"][0])
+        )
+        sp = self._service_provider(request)
+        response = _LOGOUT_RESPONSE.format(
+            response_id=OneLogin_Saml2_Utils.generate_unique_id(),
+            now=_now(),
+            destination=quoteattr(sp.sls_url),
+            in_response_to=_in_response_to(request.get("ID")),
+            issuer=escape(self.entity_id),
+        )
+        relay_state = args.get("RelayState", [None])[0]
+        return self._signed_query(sp.sls_url, "SAMLResponse", response, relay_state)
+
+    def logout_request(self, sp, name_id, session_index=None, relay_state=None):
+        """Ask a SP to log out ``name_id``.
+
+        :param sp: Entity ID of a registered SP or a :class:`ServiceProvider`.
+        :param name_id: NameID of the user.
+        :param session_index: Session index of the login, if any.
+        :param relay_state: RelayState, where the SP redirects to afterwards.
+        :returns: The SLS URL of the SP with the signed ``LogoutRequest``.
+        """
+        if not isinstance(sp, ServiceProvider):
+            sp = self.service_providers[sp]
+        request = _LOGOUT_REQUEST.format(
+            request_id=OneLogin_Saml2_Utils.generate_unique_id(),
+            now=_now(),
+            destination=quoteattr(sp.sls_url),
+            issuer=escape(self.entity_id),
+            name_id=escape(name_id),
+            name_id_format=quoteattr(sp.name_id_format),
+            session_index=(
+                _SESSION_INDEX.format(escape(session_index)) if session_index else ""
+            ),
+        )
+        return self._signed_query(sp.sls_url, "SAMLRequest", request, relay_state)
+
+    def metadata(self, sso_url, slo_url):
+        """Metadata of the IdP, to be used as ``settings_url`` by the SP."""
+        return _IDP_METADATA.format(
+            entity_id=quoteattr(self.entity_id),
+            cert=OneLogin_Saml2_Utils.format_cert(self.cert, heads=False),
+            sso_url=quoteattr(sso_url),
+            slo_url=quoteattr(slo_url),
+        )
+
+    def create_app(self, name_id="user@example.org"):
+        """Create the Flask application of the IdP.
+
+        It logs every user in as ``name_id`` without asking anything, the
+        NameID can be chosen with the ``user`` query argument of the login
+        request instead.
+
+        - ``/sso`` answers the ``AuthnRequest`` with a form posting the
+          response to the ACS.
+        - ``/slo`` answers the ``LogoutRequest`` of the SPs.
+        - ``/metadata`` serves the metadata of the IdP.
+        """
+        app = Flask(__name__)
+
+        @app.route("/sso", methods=["GET"])
+        def sso():
+            if "SAMLRequest" not in request.args:
+                abort(400)
+            try:
+                acs_url, data = self.login(
+                    request.url, request.args.get("user", name_id)
+                )
+            except ValueError:
+                abort(400)
+            inputs = "".join(
+                _INPUT.format(name=quoteattr(key), value=quoteattr(value))
+                for key, value in data.items()
+            )
+            return _POST_FORM.format(action=quoteattr(acs_url), inputs=inputs)
+
+        @app.route("/slo", methods=["GET"])
+        def slo():
+            if "SAMLRequest" in request.args:
+                try:
+                    return redirect(self.logout(request.url))
+                except ValueError:
+                    abort(400)
+            return "Logged out"
+
+        @app.route("/metadata")
+        def metadata():
+            return (
+                self.metadata(
+                    urljoin(request.host_url, "sso"), urljoin(request.host_url, "slo")
+                ),
+                200,
+                {"Content-Type": "text/xml"},
+            )
+
+        return app
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """Return the redirects instead of following them."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient(object):
+    """Client of a SP running as a server, keeping its cookies."""
+
+    def __init__(self, context=None, timeout=30):
+        """Initialize the client.
+
+        :param context: ``ssl.SSLContext`` for HTTPS, e.g. one not verifying
+            the certificates of a local instance.
+        :param timeout: Seconds to wait for a response.
+        """
+        self.timeout = timeout
+        self._opener = build_opener(
+            HTTPCookieProcessor(CookieJar()),
+            HTTPSHandler(context=context),
+            _NoRedirect,
+        )
+
+    def request(self, method, url, data=None):
+        """Send a request.
+
+        :returns: The status code and ``Location`` header of the response.
+        """
+        body = urlencode(data).encode() if data is not None else None
+        try:
+            with self._opener.open(url, data=body, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers.get("Location")
+        except HTTPError as e:
+            e.read()
+            return e.code, e.headers.get("Location")
+
+
+class WSGIClient(object):
+    """Client of a SP application running in this process."""
+
+    def __init__(self, app):
+        """Initialize the client with the Flask application."""
+        self._client = app.test_client()
+
+    def request(self, method, url, data=None):
+        """Send a request.
+
+        :returns: The status code and ``Location`` header of the response.
+        """
+        response = self._client.open(url, method=method, data=data)
+        return response.status_code, response.headers.get("Location")
+
+
+def percentile(values, p):
+    """Get the nearest-rank ``p``-th percentile of the values, ``p`` in 0-100."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+class LoadReport(object):
+    """Latencies and errors of the steps of a load test."""
+
+    def __init__(self):
+        """Initialize an empty report."""
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.cycles = 0
+        self.failed_cycles = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, step, latency, error=None):
+        """Record a step, with the error it failed with if any."""
+        with self._lock:
+            self.latencies[step].append(latency)
+            if error is not None:
+                self.errors[step][error] += 1
+
+    def add_cycle(self, ok):
+        """Record a complete or failed cycle."""
+        with self._lock:
+            self.cycles += 1
+            if not ok:
+                self.failed_cycles += 1
+
+    def summary(self):
+        """Statistics of each step, in milliseconds."""
+        return {
+            step: {
+                "count": len(latencies),
+                "errors": sum(self.errors[step].values()),
+                "p50": percentile(latencies, 50) * 1e3,
+                "p90": percentile(latencies, 90) * 1e3,
+                "p99": percentile(latencies, 99) * 1e3,
+                "max": max(latencies) * 1e3,
+            }
+            for step, latencies in self.latencies.items()
+        }
+
+    def format(self):
+        """Format the report as a table followed by the errors."""
+        lines = [
+            "{:<6} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+                "step", "count", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms"
+            )
+        ]
+        for step, stats in self.summary().items():
+            lines.append(
+                "{:<6} {count:>7} {errors:>7} {p50:>9.2f} {p90:>9.2f} "
+                "{p99:>9.2f} {max:>9.2f}".format(step, **stats)
+            )
+        rate = self.cycles / self.duration if self.duration else 0.0
+        lines.append(
+            "{} cycles, {} failed, in {:.2f}s ({:.1f} cycles/s)".format(
+                self.cycles, self.failed_cycles, self.duration, rate
+            )
+        )
+        for step, errors in self.errors.items():
+            for error, count in sorted(errors.items()):
+                lines.append("{}: {} x {}".format(step, count, error))
+        return "\n".join(lines)
+
+
+class LoadDriver(object):
+    """Run login and logout cycles against the views of a SP.
+
+    Each cycle logs a new user in and out, with its own cookies:
+
+    - ``sso``: the SP redirects to the IdP with an ``AuthnRequest``.
+    - ``acs``: the response of the :class:`MockIdP` is posted to the ACS.
+    - ``slo``: the SP redirects to the IdP with a ``LogoutRequest``.
+    - ``sls``: the ``LogoutResponse`` of the IdP is sent to the SLS.
+
+    With ``idp_logout`` the IdP sends a ``LogoutRequest`` to the SLS instead
+    of the last two steps.
+    """
+
+    def __init__(
+        self,
+        idp,
+        sso_url,
+        slo_url,
+        sp,
+        client_factory,
+        name_id="user{}@example.org",
+        idp_logout=False,
+    ):
+        """Initialize the driver.
+
+        :param idp: The :class:`MockIdP` the SP trusts.
+        :param sso_url: URL of the SSO view of the SP for the IdP.
+        :param slo_url: URL of the SLO view of the SP for the IdP.
+        :param sp: Entity ID of the SP, registered in ``idp``.
+        :param client_factory: Callable returning a new client, with a
+            ``request(method, url, data=None)`` method like
+            :class:`HTTPClient` and :class:`WSGIClient`.
+        :param name_id: Format of the NameID of the users, receiving the
+            number of the cycle.
+        :param idp_logout: Log out with a ``LogoutRequest`` of the IdP.
+        """
+        self.idp = idp
+        self.sso_url = sso_url
+        self.slo_url = slo_url
+        self.sp = sp
+        self.client_factory = client_factory
+        self.name_id = name_id
+        self.idp_logout = idp_logout
+
+    def _step(self, report, name, client, method, url, data=None):
+        """Send the request of a step, return its redirect or ``None``."""
+        start = time.perf_counter()
+        try:
+            status, location = client.request(method, url, data)
+        except Exception as e:
+            report.add(name, time.perf_counter() - start, type(e).__name__)
+            return None
+        latency = time.perf_counter() - start
+        if status != 302 or not location:
+            report.add(name, latency, "HTTP {}".format(status))
+            return None
+        report.add(name, latency)
+        return urljoin(url, location)
+
+    def cycle(self, number, report):
+        """Run one cycle, return whether all its steps succeeded."""
+        client = self.client_factory()
+        name_id = self.name_id.format(number)
+        session_index = OneLogin_Saml2_Utils.generate_unique_id()
+
+        location = self._step(report, "sso", client, "GET", self.sso_url)
+        if location is None:
+            return False
+        acs_url, data = self.idp.login(location, name_id, session_index)
+        if self._step(report, "acs", client, "POST", acs_url, data) is None:
+            return False
+
+        if self.idp_logout:
+            sls_url = self.idp.logout_request(self.sp, name_id, session_index)
+        else:
+            location = self._step(report, "slo", client, "GET", self.slo_url)
+            if location is None:
+                return False
+            sls_url = self.idp.logout(location)
+        return self._step(report, "sls", client, "GET", sls_url) is not None
+
+    def run(self, cycles, concurrency=1):
+        """Run ``cycles`` cycles, ``concurrency`` at a time.
+
+        :returns: A :class:`LoadReport`.
+        """
+        report = LoadReport()
+
+        def run_cycle(number):
+            try:
+                ok = self.cycle(number, report)
+            except Exception as e:
+                report.add("cycle", 0.0, type(e).__name__)
+                ok = False
+            report.add_cycle(ok)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run_cycle, range(cycles)))
+        report.duration = time.perf_counter() - start
+        return report
@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Timing of the phases of the SAML requests.
+
+The phases of a request are timed when ``SSO_SAML_SERVER_TIMING`` or
+``SSO_SAML_METRICS_SINK_FACTORY`` is set. The time of a phase excludes the
+phases nested in it, and the phases with the same name are added up, so the
+durations of a request can be summed. Otherwise timing a phase costs a lookup
+in the application context.
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+
+from .metrics import request_outcome
+from .proxies import current_sso_saml
+
+_TIMER = "_sso_saml_timer"
+
+
+class PhaseTimer(object):
+    """Durations of the phases of a request."""
+
+    __slots__ = ("start", "phases", "_nested")
+
+    def __init__(self):
+        """Start timing the request."""
+        self.start = time.perf_counter()
+        self.phases = {}
+        self._nested = []
+
+    def add(self, name, duration):
+        """Add ``duration`` seconds to the phase ``name``."""
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    @property
+    def elapsed(self):
+        """Seconds since the start of the request."""
+        return time.perf_counter() - self.start
+
+
+def current_timer():
+    """Get the timer of the current request or ``None``."""
+    return g.get(_TIMER) if has_app_context() else None
+
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block as the phase ``name`` of the request."""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+
+    nested = timer._nested
+    nested.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        inner = nested.pop()
+        if nested:
+            nested[-1] += elapsed
+        timer.add(name, elapsed - inner)
+
+
+def add_phases(phases):
+    """Add phases timed elsewhere, e.g. in another process, to the request.
+
+    Their durations are excluded from the enclosing phase, if any.
+    """
+    timer = current_timer()
+    if timer is None:
+        return
+    for name, duration in phases.items():
+        timer.add(name, duration)
+        if timer._nested:
+            timer._nested[-1] += duration
+
+
+def timed(name):
+    """Time the calls of the decorated function as the phase ``name``."""
+
+    def decorator(f):
+        @wraps(f)
+        def inner(*args, **kwargs):
+            with phase(name):
+                return f(*args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+def start_timing():
+    """Start timing the request to an IdP, if enabled."""
+    config = current_app.config
+    if not (
+        config["SSO_SAML_SERVER_TIMING"] or config["SSO_SAML_METRICS_SINK_FACTORY"]
+    ):
+        return
+    if "idp" in (request.view_args or {}):
+        setattr(g, _TIMER, PhaseTimer())
+
+
+def finish_timing(response):
+    """Report the phases of the request.
+
+    They are sent to the metrics sink, with the total time of the view as the
+    ``total`` phase and the outcome of the request, and added to the
+    ``Server-Timing`` header.
+    """
+    timer = g.pop(_TIMER, None)
+    if timer is None:
+        return response
+
+    total = timer.elapsed
+    sink = current_sso_saml.metrics_sink
+    if sink is not None:
+        idp = (request.view_args or {}).get("idp")
+        if not current_sso_saml.is_known_idp(idp):
+            # Do not create metrics for any name requested
+            idp = "unknown"
+        endpoint = request.endpoint.rpartition(".")[2]
+        for name, duration in timer.phases.items():
+            sink.observe(idp, endpoint, name, duration)
+        sink.observe(idp, endpoint, "total", total)
+        sink.request(idp, endpoint, request_outcome(response), total)
+
+    if current_app.config["SSO_SAML_SERVER_TIMING"]:
+        metrics = [
+            "saml_{};dur={:.3f}".format(name, duration * 1e3)
+            for name, duration in timer.phases.items()
+        ]
+        metrics.append("saml;dur={:.3f}".format(total * 1e3))
+        response.headers.add("Server-Timing", ", ".join(metrics))
+    return response
@@ -0,0 +1,203 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Tracing of the SAML messages.
+
+The messages and documents exchanged with the IdPs, and the attributes they
+release, are logged at the debug level by the ``saml`` child of the
+application logger. They are only traced when that logger is enabled for
+debug and the request is sampled, see ``SSO_SAML_TRACE_SAMPLE_RATE`` and
+``SSO_SAML_TRACE_IDPS``, and they are only redacted and truncated when the
+record is formatted, in a background thread if ``SSO_SAML_TRACE_QUEUE_SIZE``
+is set.
+"""
+
+import itertools
+import logging
+import queue
+import re
+from collections.abc import Mapping
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import current_app, g, has_request_context, request
+
+from .proxies import current_sso_saml
+
+_SAMPLED = "_sso_saml_trace_sampled"
+
+_requests = itertools.count()
+
+REDACTED = "[redacted]"
+"""Replacement of the redacted values."""
+
+_REDACTED_ELEMENTS = re.compile(
+    r"(<(?:[\w.-]+:)?(AttributeValue|SignatureValue|X509Certificate|CipherValue)"
+    r"\b[^>]*>).*?(</(?:[\w.-]+:)?\2\s*>)",
+    re.DOTALL,
+)
+
+
+def redact(payload):
+    """Redact the values of a SAML message or of attributes.
+
+    :param payload: XML string, in which the attribute values, signatures,
+        certificates and encrypted data are redacted, or dictionary, possibly
+        nested, of which only the keys are kept.
+    """
+    if isinstance(payload, Mapping):
+        return {
+            key: redact(value) if isinstance(value, Mapping) else REDACTED
+            for key, value in payload.items()
+        }
+    return _REDACTED_ELEMENTS.sub(r"\1{}\3".format(REDACTED), str(payload))
+
+
+class TracedPayload(object):
+    """SAML message or document, redacted and truncated when formatted."""
+
+    __slots__ = ("payload", "max_size", "redact")
+
+    def __init__(self, payload, max_size=None, redact=True):
+        """Initialize the payload.
+
+        :param payload: XML string or bytes, or dictionary of attributes.
+        :param max_size: Maximum number of characters formatted, if any.
+        :param redact: Whether to redact the values, see :func:`redact`.
+        """
+        self.payload = payload
+        self.max_size = max_size
+        self.redact = redact
+
+    def __str__(self):
+        """Format the payload."""
+        payload = self.payload
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", "replace")
+        if self.redact:
+            payload = redact(payload)
+        text = payload if isinstance(payload, str) else repr(payload)
+        if self.max_size and len(text) > self.max_size:
+            text = "{}... [{} characters truncated]".format(
+                text[: self.max_size], len(text) - self.max_size
+            )
+        return text
+
+
+def trace_enabled(idp):
+    """Whether the SAML messages of the current request to ``idp`` are traced.
+
+    The sampling is decided once per request.
+    """
+    if not current_sso_saml.trace_logger.isEnabledFor(logging.DEBUG):
+        return False
+
+    current = request._get_current_object() if has_request_context() else None
+    # The application context may be shared by several requests, e.g. in tests
+    sampled_request, sampled = g.get(_SAMPLED, (None, None))
+    if current is None or sampled_request is not current:
+        config = current_app.config
+        idps = config["SSO_SAML_TRACE_IDPS"]
+        rate = config["SSO_SAML_TRACE_SAMPLE_RATE"]
+        sampled = (idps is None or idp in idps) and (
+            rate <= 1 or next(_requests) % rate == 0
+        )
+        if current is not None:
+            setattr(g, _SAMPLED, (current, sampled))
+    return sampled
+
+
+def trace(kind, idp, payload):
+    """Trace a SAML message or document of the current request.
+
+    :param kind: Kind of the payload, e.g. ``"Response"``.
+    :param idp: Identity provider key.
+    :param payload: XML string or bytes, dictionary of attributes, or callable
+        returning it, only called if the request is traced.
+    """
+    if not trace_enabled(idp):
+        return
+    if callable(payload):
+        payload = payload()
+    config = current_app.config
+    current_sso_saml.trace_logger.debug(
+        "SAML %s for %s:\n%s",
+        kind,
+        idp,
+        TracedPayload(
+            payload, config["SSO_SAML_TRACE_MAX_SIZE"], config["SSO_SAML_TRACE_REDACT"]
+        ),
+    )
+
+
+class _ParentHandler(logging.Handler):
+    """Handler passing the records to the handlers of a logger."""
+
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+
+    def emit(self, record):
+        self.logger.handle(record)
+
+
+class _Listener(QueueListener):
+    """Listener waiting for room in the queue to stop."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class TraceQueueHandler(QueueHandler):
+    """Handler queuing the traces for a background thread.
+
+    The records are formatted by the thread, and dropped when the queue is
+    full instead of blocking the requests.
+    """
+
+    def __init__(self, logger, size):
+        """Start the thread passing the records to the parent of ``logger``.
+
+        :param logger: Trace logger.
+        :param size: Maximum number of queued records.
+        """
+        super().__init__(queue.Queue(size))
+        self.dropped = 0
+        self.listener = _Listener(self.queue, _ParentHandler(logger.parent))
+        self.listener.start()
+
+    def prepare(self, record):
+        """Keep the record as is, it is formatted by the thread."""
+        return record
+
+    def enqueue(self, record):
+        """Queue the record, or drop it if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Stop the thread once the queued records are handled."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+def create_trace_logger(app):
+    """Create the logger of the SAML messages of the application.
+
+    With ``SSO_SAML_TRACE_QUEUE_SIZE`` its records are queued and passed to
+    the handlers of the application logger by a background thread.
+    """
+    logger = app.logger.getChild("saml")
+    for handler in list(logger.handlers):
+        if isinstance(handler, TraceQueueHandler):
+            logger.removeHandler(handler)
+            handler.close()
+
+    size = app.config["SSO_SAML_TRACE_QUEUE_SIZE"]
+    if size:
+        logger.addHandler(TraceQueueHandler(logger, size))
+    logger.propagate = not size
+    return logger
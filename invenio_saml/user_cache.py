@@ -0,0 +1,229 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cache of the user IDs of the external identities.
+
+Maps ``(external_method, external_id)`` to the ID of the linked user, so that
+returning users are fetched by primary key. Entries are invalidated when an
+identity is unlinked or a user deactivated.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from invenio_accounts.models import User, UserIdentity
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class UserCache(object):
+    """Interface of the user ID caches."""
+
+    def get(self, method, external_id):
+        """Get the user ID of an external identity or ``None``."""
+        raise NotImplementedError()
+
+    def set(self, method, external_id, user_id):
+        """Remember the user ID of an external identity."""
+        raise NotImplementedError()
+
+    def invalidate(self, method, external_id):
+        """Forget an external identity."""
+        raise NotImplementedError()
+
+    def invalidate_user(self, user_id):
+        """Forget all the external identities of a user."""
+        raise NotImplementedError()
+
+    def clear(self):
+        """Forget all the external identities."""
+        raise NotImplementedError()
+
+
+class MemoryUserCache(UserCache):
+    """In-process user ID cache.
+
+    Entries are kept in insertion order and evicted once expired or, when the
+    cache is full, from the oldest one. Each worker process has its own cache
+    and only sees the invalidations made by itself, the others see them after
+    ``ttl`` seconds. Use a shared cache when running several workers.
+    """
+
+    def __init__(self, max_size=100000, ttl=300):
+        """Initialize the cache.
+
+        :param max_size: Maximum number of identities kept.
+        :param ttl: Seconds an identity is kept.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of identities in the cache."""
+        return len(self._entries)
+
+    def get(self, method, external_id):
+        """Get the user ID of an external identity or ``None``."""
+        user_id, expires = self._entries.get((method, external_id), (None, 0))
+        if expires <= time.monotonic():
+            return None
+        return user_id
+
+    def set(self, method, external_id, user_id):
+        """Remember the user ID of an external identity."""
+        key = (method, external_id)
+        now = time.monotonic()
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (user_id, now + self.ttl)
+            self._users.setdefault(user_id, set()).add(key)
+            while self._entries:
+                oldest, (_, expires) = next(iter(self._entries.items()))
+                if expires > now and len(self._entries) <= self.max_size:
+                    break
+                self._pop(oldest)
+
+    def _pop(self, key):
+        """Remove an entry, the lock must be held."""
+        user_id, _ = self._entries.pop(key, (None, 0))
+        keys = self._users.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._users[user_id]
+
+    def invalidate(self, method, external_id):
+        """Forget an external identity."""
+        with self._lock:
+            self._pop((method, external_id))
+
+    def invalidate_user(self, user_id):
+        """Forget all the external identities of a user."""
+        with self._lock:
+            for key in list(self._users.get(user_id, ())):
+                self._pop(key)
+
+    def clear(self):
+        """Forget all the external identities."""
+        with self._lock:
+            self._entries.clear()
+            self._users.clear()
+
+
+class RedisUserCache(UserCache):
+    """User ID cache shared between processes through Redis."""
+
+    def __init__(self, client, ttl=300, prefix="saml:user:"):
+        """Initialize the cache.
+
+        :param client: Redis client.
+        :param ttl: Seconds an identity is kept.
+        :param prefix: Prefix of the Redis keys.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, method, external_id):
+        return "{}id:{}".format(self.prefix, json.dumps([method, external_id]))
+
+    def _user_key(self, user_id):
+        return "{}user:{}".format(self.prefix, user_id)
+
+    def get(self, method, external_id):
+        """Get the user ID of an external identity or ``None``."""
+        user_id = self.client.get(self._key(method, external_id))
+        return int(user_id) if user_id is not None else None
+
+    def set(self, method, external_id, user_id):
+        """Remember the user ID of an external identity."""
+        key, user_key = self._key(method, external_id), self._user_key(user_id)
+        pipe = self.client.pipeline()
+        pipe.set(key, user_id, ex=self.ttl)
+        pipe.sadd(user_key, key)
+        pipe.expire(user_key, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, method, external_id):
+        """Forget an external identity."""
+        self.client.delete(self._key(method, external_id))
+
+    def invalidate_user(self, user_id):
+        """Forget all the external identities of a user."""
+        user_key = self._user_key(user_id)
+        keys = self.client.smembers(user_key)
+        self.client.delete(user_key, *keys)
+
+    def clear(self):
+        """Forget all the external identities."""
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def memory_user_cache_factory(app):
+    """Create an in-process user ID cache."""
+    return MemoryUserCache(
+        max_size=app.config["SSO_SAML_USER_CACHE_SIZE"],
+        ttl=app.config["SSO_SAML_USER_CACHE_TTL"],
+    )
+
+
+def redis_user_cache_factory(app):
+    """Create a user ID cache stored in the ``CACHE_REDIS_URL`` Redis."""
+    from redis import StrictRedis
+
+    return RedisUserCache(
+        StrictRedis.from_url(app.config["CACHE_REDIS_URL"]),
+        ttl=app.config["SSO_SAML_USER_CACHE_TTL"],
+    )
+
+
+def _current_cache():
+    """User ID cache of the current application or ``None``."""
+    if not current_app:
+        return None
+    state = current_app.extensions.get("invenio-sso-saml")
+    return state.user_cache if state is not None else None
+
+
+def _on_identity_changed(mapper, connection, target):
+    """Forget an identity deleted or modified through the ORM."""
+    cache = _current_cache()
+    if cache is not None:
+        cache.invalidate(target.method, target.id)
+
+
+def _on_active_set(target, value, oldvalue, initiator):
+    """Forget the identities of a deactivated user."""
+    cache = _current_cache()
+    if cache is not None and not value and target.id is not None:
+        cache.invalidate_user(target.id)
+
+
+def _on_orm_execute(state):
+    """Forget all identities on bulk changes of identities or users."""
+    if not (state.is_delete or state.is_update):
+        return
+    cache = _current_cache()
+    if cache is None:
+        return
+    mappers = {mapper.class_ for mapper in state.all_mappers}
+    if UserIdentity in mappers or User in mappers:
+        cache.clear()
+
+
+def register_invalidation():
+    """Register the listeners invalidating the user ID caches."""
+    if event.contains(UserIdentity, "after_delete", _on_identity_changed):
+        return
+    event.listen(UserIdentity, "after_delete", _on_identity_changed)
+    event.listen(UserIdentity, "after_update", _on_identity_changed)
+    event.listen(User.active, "set", _on_active_set)
+    event.listen(Session, "do_orm_execute", _on_orm_execute)
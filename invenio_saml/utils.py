@@ -2,13 +2,25 @@
 # SPDX-License-Identifier: MIT
 """Utility functions."""
 
-from functools import wraps
+from copy import copy
+from functools import partial, wraps
 from urllib.parse import urlparse
 
-from flask import request
+from flask import current_app, request
 from onelogin.saml2.auth import OneLogin_Saml2_Auth
+from onelogin.saml2.constants import OneLogin_Saml2_Constants
+from onelogin.saml2.errors import OneLogin_Saml2_Error, OneLogin_Saml2_ValidationError
+from onelogin.saml2.logout_request import OneLogin_Saml2_Logout_Request
+from onelogin.saml2.logout_response import OneLogin_Saml2_Logout_Response
+from onelogin.saml2.response import OneLogin_Saml2_Response
+from onelogin.saml2.settings import OneLogin_Saml2_Settings
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
 
+from invenio_saml.authn_requests import SessionRequests
+from invenio_saml.metrics import set_outcome
 from invenio_saml.proxies import current_sso_saml
+from invenio_saml.timing import add_phases, phase, timed
+from invenio_saml.xml_utils import max_xml_size
 
 
 def prepare_flask_request(request):
@@ -37,7 +49,8 @@ def run_handler(handler_name):
             res = f(self, *args, **kwargs)
             handler = current_sso_saml.get_handler(self.idp, handler_name)
             if handler:
-                return handler(self, res)
+                with phase("handler"):
+                    return handler(self, res)
             return res
 
         return inner
@@ -45,15 +58,218 @@ def run_handler(handler_name):
     return decorated
 
 
+def project_attributes(response, names, key="Name", allow_duplicates=False):
+    """Get only some attributes of a response.
+
+    Same as ``OneLogin_Saml2_Response.get_attributes``, but the values of the
+    attributes that are not requested are neither read nor copied. The names
+    of all the attributes are still checked for duplicates.
+
+    :param response: A validated ``OneLogin_Saml2_Response``.
+    :param names: Names of the attributes to get.
+    :param key: Attribute of the ``Attribute`` elements holding their name.
+    :param allow_duplicates: Whether an attribute can be repeated, as set by
+        ``allowRepeatAttributeName`` in the security settings.
+    """
+    saml = OneLogin_Saml2_Constants.NSMAP["saml"]
+    # A valid response has a single assertion, the signed one
+    nodes = OneLogin_Saml2_XML.query(
+        response.get_xml_document(),
+        "/samlp:Response/saml:Assertion/saml:AttributeStatement/saml:Attribute",
+    )
+    seen, attributes = set(), {}
+    for node in nodes:
+        name = node.get(key)
+        if not name:
+            continue
+        if name in seen and not allow_duplicates:
+            raise OneLogin_Saml2_ValidationError(
+                "Found an Attribute element with duplicated " + key,
+                OneLogin_Saml2_ValidationError.DUPLICATED_ATTRIBUTE_NAME_FOUND,
+            )
+        seen.add(name)
+        if name not in names:
+            continue
+        values = attributes.setdefault(name, [])
+        for value in node.iterchildren("{%s}AttributeValue" % saml):
+            text = (OneLogin_Saml2_XML.element_text(value) or "").strip()
+            if text:
+                values.append(text)
+            for nameid in value.iterchildren("{%s}NameID" % saml):
+                values.append(
+                    {
+                        "NameID": {
+                            "Format": nameid.get("Format"),
+                            "NameQualifier": nameid.get("NameQualifier"),
+                            "value": nameid.text,
+                        }
+                    }
+                )
+    return attributes
+
+
+def project_response(response, settings, names):
+    """Make a validated response read only some of its attributes.
+
+    Its ``get_attributes`` and ``get_friendlyname_attributes`` are replaced
+    by :func:`project_attributes`.
+
+    :param response: A validated ``OneLogin_Saml2_Response``.
+    :param settings: ``OneLogin_Saml2_Settings`` of the response.
+    :param names: Names of the attributes to get.
+    """
+    security = settings.get_security_data()
+    project = partial(
+        project_attributes,
+        response,
+        names,
+        allow_duplicates=security.get("allowRepeatAttributeName", False),
+    )
+    response.get_attributes = project
+    response.get_friendlyname_attributes = partial(project, "FriendlyName")
+
+
+SIGNATURE_ERRORS = frozenset(
+    (
+        OneLogin_Saml2_ValidationError.WRONG_SIGNED_ELEMENT,
+        OneLogin_Saml2_ValidationError.ID_NOT_FOUND_IN_SIGNED_ELEMENT,
+        OneLogin_Saml2_ValidationError.DUPLICATED_ID_IN_SIGNED_ELEMENTS,
+        OneLogin_Saml2_ValidationError.INVALID_SIGNED_ELEMENT,
+        OneLogin_Saml2_ValidationError.DUPLICATED_REFERENCE_IN_SIGNED_ELEMENTS,
+        OneLogin_Saml2_ValidationError.UNEXPECTED_SIGNED_ELEMENTS,
+        OneLogin_Saml2_ValidationError.WRONG_NUMBER_OF_SIGNATURES_IN_RESPONSE,
+        OneLogin_Saml2_ValidationError.WRONG_NUMBER_OF_SIGNATURES_IN_ASSERTION,
+        OneLogin_Saml2_ValidationError.NO_SIGNED_MESSAGE,
+        OneLogin_Saml2_ValidationError.NO_SIGNED_ASSERTION,
+        OneLogin_Saml2_ValidationError.NO_SIGNATURE_FOUND,
+        OneLogin_Saml2_ValidationError.INVALID_SIGNATURE,
+        OneLogin_Saml2_ValidationError.WRONG_NUMBER_OF_SIGNATURES,
+        OneLogin_Saml2_ValidationError.DEPRECATED_SIGNATURE_METHOD,
+    )
+)
+"""Validation error codes of ``OneLogin_Saml2_ValidationError`` caused by
+missing or invalid signatures."""
+
+
+class TimedResponse(OneLogin_Saml2_Response):
+    """Response timing its decoding, decryption and verification."""
+
+    @timed("decode")
+    def __init__(self, *args, **kwargs):
+        """Decode the response and decrypt its assertion."""
+        super(TimedResponse, self).__init__(*args, **kwargs)
+
+    @timed("decrypt")
+    def _decrypt_assertion(self, *args, **kwargs):
+        """Decrypt the assertion."""
+        return super(TimedResponse, self)._decrypt_assertion(*args, **kwargs)
+
+    @timed("verify")
+    def is_valid(self, request_data, request_id=None, raise_exceptions=False):
+        """Validate the response and verify its signatures.
+
+        The ``request_id`` can also be the
+        :class:`invenio_saml.authn_requests.SessionRequests` of the session,
+        one of which the response must then answer. Invalid signatures are
+        reported as the ``signature_error`` outcome of the request.
+        """
+        if isinstance(request_id, SessionRequests):
+            request_id = request_id.match(self.get_in_response_to())
+        try:
+            return super(TimedResponse, self).is_valid(
+                request_data, request_id, raise_exceptions=True
+            )
+        except Exception as e:
+            if getattr(e, "code", None) in SIGNATURE_ERRORS:
+                set_outcome("signature_error")
+            if raise_exceptions:
+                raise
+            return False
+
+
+class TimedLogoutRequest(OneLogin_Saml2_Logout_Request):
+    """Logout request timing its decoding and verification."""
+
+    @timed("decode")
+    def __init__(self, *args, **kwargs):
+        """Decode or build the logout request."""
+        super(TimedLogoutRequest, self).__init__(*args, **kwargs)
+
+    @timed("verify")
+    def is_valid(self, *args, **kwargs):
+        """Validate the logout request."""
+        return super(TimedLogoutRequest, self).is_valid(*args, **kwargs)
+
+
+class TimedLogoutResponse(OneLogin_Saml2_Logout_Response):
+    """Logout response timing its decoding and verification."""
+
+    @timed("decode")
+    def __init__(self, *args, **kwargs):
+        """Decode or build the logout response."""
+        super(TimedLogoutResponse, self).__init__(*args, **kwargs)
+
+    @timed("verify")
+    def is_valid(self, *args, **kwargs):
+        """Validate the logout response."""
+        return super(TimedLogoutResponse, self).is_valid(*args, **kwargs)
+
+
+def copy_settings(settings):
+    """Shallow copy of a ``OneLogin_Saml2_Settings`` object.
+
+    The attributes, e.g. ``strict``, and the ``sp``, ``idp``, ``security``,
+    ``contacts`` and ``organization`` dictionaries are copied, so that they can
+    be changed without changing the original settings. The values of the
+    dictionaries are shared.
+    """
+    settings = copy(settings)
+    for name in ("_paths", "_sp", "_idp", "_security", "_contacts", "_organization"):
+        setattr(settings, name, dict(getattr(settings, name)))
+    settings._errors = list(settings._errors)
+    return settings
+
+
 class SAMLAuth(OneLogin_Saml2_Auth):
-    """Encapsulate OneLogin SP SAML instance."""
+    """Encapsulate OneLogin SP SAML instance.
+
+    The phases of the processing of the messages are timed, see
+    :mod:`invenio_saml.timing`.
+    """
+
+    response_class = TimedResponse
+    logout_request_class = TimedLogoutRequest
+    logout_response_class = TimedLogoutResponse
+
+    def __init__(self, idp, settings, *args, projection=None, **kwargs):
+        """Initialization.
 
-    def __init__(self, idp, settings, *args, **kwargs):
-        """Initialization."""
+        :param idp: Identity provider key.
+        :param settings: Settings dictionary or an already built
+            ``OneLogin_Saml2_Settings`` object, shared by the requests. A
+            shallow copy of it is used, see :func:`copy_settings`, so that the
+            changes made for a request, e.g. by the ``settings_handler``, do not
+            affect the other requests.
+        :param projection: Names of the only attributes to read from the
+            responses, or ``None`` to read all of them.
+        """
         self.idp = idp
-        self._settings = settings
+        self.projection = projection
+        shared = None
+        if isinstance(settings, OneLogin_Saml2_Settings):
+            shared, settings = settings, copy_settings(settings)
         req = current_sso_saml.prepare_flask_request(request)
-        super(SAMLAuth, self).__init__(req, self._settings, *args, **kwargs)
+        super(SAMLAuth, self).__init__(req, settings, *args, **kwargs)
+        # The workers know the shared settings by their fingerprint
+        self.shared_settings = shared or self._settings
+
+    def store_valid_response(self, response):
+        """Store the data of a valid response, projecting its attributes."""
+        if self.projection is not None:
+            project_response(
+                response, OneLogin_Saml2_Auth.get_settings(self), self.projection
+            )
+        super(SAMLAuth, self).store_valid_response(response)
 
     @run_handler("settings_handler")
     def get_settings(self):
@@ -64,13 +280,71 @@ class SAMLAuth(OneLogin_Saml2_Auth):
         settings = super(SAMLAuth, self).get_settings()
         return settings
 
+    @timed("process")
+    def process_response(self, request_id=None):
+        """Wrapper around ``OneLogin_Saml2_Auth.process_response``.
+
+        :param request_id: ID of the ``AuthnRequest`` the response must
+            answer, or the :class:`invenio_saml.authn_requests.SessionRequests`
+            one of which it must answer.
+
+        With ``SSO_SAML_OFFLOAD_WORKERS``, the response is decoded, decrypted
+        and validated by a worker process once the workers are started, see
+        :mod:`invenio_saml.offload`, with the :attr:`shared_settings` of the
+        IdP, i.e. without the changes made to the settings of the request.
+
+        :raises invenio_saml.errors.OffloadUnavailable: If the worker
+            processes cannot process the response.
+        """
+        max_size = current_app.config["SSO_SAML_MAX_XML_SIZE"]
+        pool = current_sso_saml.response_pool
+        if (
+            pool is None
+            or "SAMLResponse" not in self._request_data.get("post_data", {})
+            or not pool.ready(self.shared_settings)
+        ):
+            with max_xml_size(max_size):
+                return super(SAMLAuth, self).process_response(request_id)
+
+        self._errors = []
+        self._error_reason = None
+        with phase("offload"):
+            response = pool.process(
+                self.shared_settings,
+                self._request_data,
+                request_id,
+                self.projection,
+                max_xml_size=max_size,
+            )
+            add_phases(response.phases)
+        if response.exception is not None:
+            raise OneLogin_Saml2_Error(response.exception)
+
+        self._last_response = response.xml
+        if response.is_valid:
+            # The attributes are already projected by the worker
+            OneLogin_Saml2_Auth.store_valid_response(self, response)
+        else:
+            if response.code in SIGNATURE_ERRORS:
+                set_outcome("signature_error")
+            self._errors.append("invalid_response")
+            self._error_reason = response.error
+
+    @timed("process")
+    def process_slo(self, *args, **kwargs):
+        """Wrapper around ``OneLogin_Saml2_Auth.process_slo``."""
+        with max_xml_size(current_app.config["SSO_SAML_MAX_XML_SIZE"]):
+            return super(SAMLAuth, self).process_slo(*args, **kwargs)
+
     @run_handler("login_handler")
+    @timed("request")
     def login(self, *args, **kwargs):
         """Wrapper around ``OneLogin_Saml2_Auth.login``."""
         next_url = super(SAMLAuth, self).login(*args, **kwargs)
         return next_url
 
     @run_handler("logout_handler")
+    @timed("request")
     def logout(self, *args, **kwargs):
         """Wrapper around ``OneLogin_Saml2_Auth.logout``."""
         next_url = super(SAMLAuth, self).logout(*args, **kwargs)
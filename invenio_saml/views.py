@@ -4,6 +4,7 @@
 
 """SAML integration functions."""
 
+import math
 from functools import wraps
 
 from flask import (
@@ -17,8 +18,19 @@ from flask import (
     session,
 )
 
-from invenio_saml.errors import IdentityProviderNotFound
+from invenio_saml.errors import (
+    AttributeMappingError,
+    FederationUnavailable,
+    IdentityProviderNotFound,
+    MessageRejected,
+    OffloadUnavailable,
+    XMLTooLarge,
+)
+from invenio_saml.metrics import set_outcome
+from invenio_saml.prevalidation import MessageLimits, check_message
 from invenio_saml.proxies import current_sso_saml
+from invenio_saml.timing import finish_timing, phase, start_timing
+from invenio_saml.tracing import trace
 
 
 def verify_idp(f):
@@ -27,19 +39,138 @@ def verify_idp(f):
     @wraps(f)
     def inner(idp, *args, **kwargs):
         try:
-            return f(idp=idp, auth=current_sso_saml.get_auth(idp), *args, **kwargs)
+            with phase("auth"):
+                auth = current_sso_saml.get_auth(idp)
+            return f(idp=idp, auth=auth, *args, **kwargs)
         except IdentityProviderNotFound:
             # IdP name not found inside the configuration
             return abort(404, "Identity Provider not found")
+        except FederationUnavailable:
+            # The federation metadata is being compiled
+            return abort(503, "Federation metadata not available yet")
 
     return inner
 
 
-@verify_idp
-def metadata(idp, auth):
-    """Expose XML configuration of the Service Provider (us)."""
-    current_app.logger.debug("Handling metadata request for {}".format(idp))
+def _retry_later(status, reason, seconds):
+    """Answer a request which can be retried after some seconds."""
+    response = jsonify([reason])
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, int(math.ceil(seconds))))
+    return response
+
+
+def admit(endpoint, concurrency=False):
+    """Admit the requests of the IdPs to an endpoint.
+
+    See :mod:`invenio_saml.admission`.
+
+    :param endpoint: Name of the endpoint in the rate limits.
+    :param concurrency: Whether to limit the requests executed at once with
+        ``SSO_SAML_ACS_CONCURRENCY``.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def inner(idp, *args, **kwargs):
+            state = current_sso_saml
+            rate_limiter = state.rate_limiter
+            limit = None
+            if rate_limiter is not None:
+                limit = state.get_rate_limit(idp, endpoint)
+            if limit is not None:
+                with phase("admission"):
+                    wait = rate_limiter.acquire(*limit)
+                if wait:
+                    return _retry_later(429, "rate_limited", wait)
+
+            limiter = state.acs_limiter if concurrency else None
+            if limiter is None:
+                return f(idp, *args, **kwargs)
+            with phase("queue"):
+                admitted = limiter.acquire()
+            if not admitted:
+                current_app.logger.warning(
+                    "Rejected %s request: %d executed, %d waiting",
+                    endpoint,
+                    limiter.active,
+                    limiter.waiting,
+                )
+                return _retry_later(503, "overloaded", limiter.timeout)
+            try:
+                return f(idp, *args, **kwargs)
+            finally:
+                limiter.release()
+
+        return inner
+
+    return decorator
+
+
+def prevalidate(source, roots, deflated=False):
+    """Reject the oversized or malformed SAML messages of the requests.
+
+    :param source: Attribute of the request with the messages, ``"form"`` or
+        ``"args"``.
+    :param roots: Expected root element of each message by parameter.
+    :param deflated: Whether the messages are deflated.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def inner(*args, **kwargs):
+            config = current_app.config
+            if not config["SSO_SAML_PREVALIDATION"]:
+                return f(*args, **kwargs)
+
+            limits = MessageLimits(
+                config["SSO_SAML_MAX_MESSAGE_SIZE"],
+                config["SSO_SAML_MAX_XML_SIZE"],
+                config["SSO_SAML_MAX_INFLATE_RATIO"],
+            )
+            messages = getattr(request, source)
+            try:
+                with phase("prevalidation"):
+                    for name, root in roots.items():
+                        if name in messages:
+                            check_message(messages[name], root, deflated, limits)
+            except MessageRejected as e:
+                current_app.logger.info("Rejected SAML message: %s", e)
+                set_outcome(e.reason)
+                return jsonify([e.reason]), 400
+            return f(*args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+def metadata(idp):
+    """Expose XML configuration of the Service Provider (us).
+
+    The rendered metadata is cached per IdP and served with ``ETag``,
+    ``Last-Modified`` and ``Cache-Control`` headers, so conditional requests
+    are answered with a 304 without rendering or validating it again.
+    """
+    current_app.logger.debug("Handling metadata request for %s", idp)
+
+    try:
+        cached = current_sso_saml.get_cached_sp_metadata(idp)
+    except IdentityProviderNotFound:
+        # IdP name not found inside the configuration
+        return abort(404, "Identity Provider not found")
+    except FederationUnavailable:
+        # The federation metadata is being compiled
+        return abort(503, "Federation metadata not available yet")
+
+    if cached is None:
+        return _render_metadata(idp)
+    return _metadata_response(cached)
 
+
+@verify_idp
+def _render_metadata(idp, auth):
+    """Render, validate and cache the SP metadata."""
     settings = auth.get_settings()
     sp_metadata = settings.get_sp_metadata()
     errors = settings.validate_metadata(sp_metadata)
@@ -48,36 +179,49 @@ def metadata(idp, auth):
         error_reason = auth.get_last_error_reason()
         if error_reason:
             errors.append(auth.get_last_error_reason())
-            current_app.logger.error("Handling metadata request: {}".format(errors))
+            current_app.logger.error("Handling metadata request: %s", errors)
         return jsonify(errors), 401
     else:
-        current_app.logger.debug("Metadata request response: {}".format(sp_metadata))
-        resp = make_response(sp_metadata, 200)
-        resp.headers["Content-Type"] = "text/xml"
-        return resp
+        trace("metadata", idp, sp_metadata)
+        return _metadata_response(current_sso_saml.cache_sp_metadata(idp, sp_metadata))
 
 
+def _metadata_response(cached):
+    """Build the (possibly 304) metadata response from a cache entry."""
+    resp = make_response(cached.xml, 200)
+    resp.headers["Content-Type"] = "text/xml"
+    resp.set_etag(cached.etag)
+    resp.last_modified = cached.last_modified
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config["SSO_SAML_METADATA_CACHE_TIMEOUT"]
+    return resp.make_conditional(request)
+
+
+@admit("sso")
 @verify_idp
 def sso(idp, auth):
     """Send user to IdP login page (SAML single sign-on)."""
-    current_app.logger.debug("SSO SAML for {}".format(idp))
+    current_app.logger.debug("SSO SAML for %s", idp)
 
     next_url = request.args.get("next", request.referrer) or request.host_url
     login = auth.login(return_to=next_url)
 
-    current_app.logger.debug(
-        "SSO Request XML: \n{}".format(auth.get_last_request_xml())
-    )
-    current_app.logger.debug('Redirecting to "{}" to initiate login'.format(login))
+    trace("AuthnRequest", idp, auth.get_last_request_xml)
+    current_app.logger.debug('Redirecting to "%s" to initiate login', login)
 
     if not login:
         # This should never happen, but just in case
         abort(401)
 
+    # Remember the request to match it with the response in acs
+    current_sso_saml.remember_request(auth, relay_state=next_url)
+
     return redirect(login)
 
 
+@admit("acs", concurrency=True)
 @verify_idp
+@prevalidate("form", {"SAMLResponse": "Response"})
 def acs(idp, auth):
     """Authorized handler callback (Assertion Consumer Service).
 
@@ -85,30 +229,60 @@ def acs(idp, auth):
     performed.
     """
     try:
-        # TODO https://github.com/onelogin/python3-saml/issues/39 ?
-        auth.process_response()
+        # A response to a request must answer one of the session
+        auth.process_response(request_id=current_sso_saml.get_session_requests())
+    except OffloadUnavailable as e:
+        current_app.logger.warning("Handling ACS request: %s", e)
+        return abort(503)
     except Exception:  # TODO better exception handling
         return abort(400)
 
+    trace("Response", idp, auth.get_last_response_xml)
     errors = auth.get_errors()
 
     if errors:
         error_reason = auth.get_last_error_reason()
         if error_reason:
             errors.append(auth.get_last_error_reason())
-            current_app.logger.error("Handling ACS request: {}".format(errors))
+            current_app.logger.error("Handling ACS request: %s", errors)
         return jsonify(errors), 401
 
     if not auth.is_authenticated():
         return abort(403)
 
+    # Reject replayed assertions before the handler does any work
+    with phase("replay"):
+        replayed = current_sso_saml.is_replayed(auth)
+    if replayed:
+        current_app.logger.warning(
+            "Handling ACS request: replayed assertion %s",
+            auth.get_last_assertion_id(),
+        )
+        return jsonify(["replayed_assertion"]), 401
+
+    # Match the response with the request it answers, if any
+    authn_request = current_sso_saml.pop_request(auth)
+    if authn_request is None and current_app.config["SSO_SAML_SOLICITED_ONLY"]:
+        current_app.logger.warning(
+            "Handling ACS request: unsolicited response to %s",
+            auth.get_last_response_in_response_to(),
+        )
+        return jsonify(["unsolicited_response"]), 401
+
     # Set SSO specific IdP metadata in the session, (used later in slo)
     session[current_app.config["SSO_SAML_SESSION_KEY_NAME_ID"]] = auth.get_nameid()
     session[current_app.config["SSO_SAML_SESSION_KEY_SESSION_INDEX"]] = (
         auth.get_session_index()
     )
 
-    next_url = auth.acs_handler(request.form.get("RelayState")) or "/"
+    relay_state = request.form.get("RelayState")
+    if relay_state is None and authn_request is not None:
+        relay_state = authn_request.relay_state
+    try:
+        next_url = auth.acs_handler(relay_state) or "/"
+    except AttributeMappingError as e:
+        current_app.logger.warning("Handling ACS request: %s", e.errors)
+        return jsonify(e.errors), 401
 
     return redirect(next_url)
 
@@ -127,10 +301,8 @@ def slo(idp, auth):
         return_to=next_url, name_id=name_id, session_index=session_index
     )
 
-    current_app.logger.debug(
-        "SLO Request XML: \n{}".format(auth.get_last_request_xml())
-    )
-    current_app.logger.debug('Redirecting to "{}" to initiate logout'.format(logout))
+    trace("LogoutRequest", idp, auth.get_last_request_xml)
+    current_app.logger.debug('Redirecting to "%s" to initiate logout', logout)
 
     if not logout:
         # This should never happen, but just in case
@@ -140,20 +312,31 @@ def slo(idp, auth):
 
 
 @verify_idp
+@prevalidate(
+    "args",
+    {"SAMLRequest": "LogoutRequest", "SAMLResponse": "LogoutResponse"},
+    deflated=True,
+)
 def sls(idp, auth):
     """Logout handler callback (Single Logout Service).
 
     It Consumes LogoutResponse from IdP when logout has been performed.
     """
     # Process the SLO message received from IdP
-    next_url = auth.process_slo(delete_session_cb=lambda: session.clear())
+    try:
+        next_url = auth.process_slo(delete_session_cb=lambda: session.clear())
+    except XMLTooLarge:
+        return abort(400)
+    if "SAMLRequest" in request.args:
+        trace("LogoutRequest", idp, auth.get_last_request_xml)
+    trace("LogoutResponse", idp, auth.get_last_response_xml)
 
     errors = auth.get_errors()
     if errors:
         error_reason = auth.get_last_error_reason()
         if error_reason:
             errors.append(auth.get_last_error_reason())
-            current_app.logger.error("Handling SLS request: {}".format(errors))
+            current_app.logger.error("Handling SLS request: %s", errors)
         return jsonify(errors), 401
 
     next_url = auth.sls_handler(next_url) or "/"
@@ -161,6 +344,18 @@ def sls(idp, auth):
     return redirect(next_url)
 
 
+def metrics():
+    """Expose the metrics of the SAML requests."""
+    sink = current_sso_saml.metrics_sink
+    if sink is None:
+        abort(404)
+    try:
+        text = sink.render()
+    except NotImplementedError:
+        abort(404)
+    return text, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
 def create_blueprint(state, import_name):
     """Create the SSO SAML extension blueprint."""
     bp = Blueprint(
@@ -170,6 +365,9 @@ def create_blueprint(state, import_name):
         template_folder="templates",
     )
 
+    bp.before_request(start_timing)
+    bp.after_request(finish_timing)
+
     bp.add_url_rule(state.metadata_url, endpoint="metadata", view_func=metadata)
 
     bp.add_url_rule(
@@ -186,4 +384,7 @@ def create_blueprint(state, import_name):
 
     bp.add_url_rule(state.sls_url, endpoint="sls", view_func=sls)
 
+    if state.metrics_url:
+        bp.add_url_rule(state.metrics_url, endpoint="metrics", view_func=metrics)
+
     return bp
@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Cached XSD schemas and hardened parsers for the SAML messages.
+
+OneLogin compiles the XSD schema of the SAML protocol, with the schemas it
+imports, on each validation of a message, which takes milliseconds. Once
+:func:`install_xml_cache` is called, the compiled schemas are kept, and the
+messages are parsed by hardened parsers: without network access, DTD
+loading, entity resolution or huge trees, and limited in size while
+:func:`max_xml_size` is in effect, e.g. while ``SAMLAuth`` processes a
+message.
+
+The lxml parsers and validators must not be used by several threads at once,
+so each thread has its own parser and compiled schemas.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os.path import dirname, join
+
+import onelogin.saml2.xml_utils
+from lxml import etree
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
+from onelogin.saml2.xmlparser import RestrictedElement
+from onelogin.saml2.xmlparser import fromstring as _fromstring
+
+from .errors import XMLTooLarge
+
+SCHEMAS_DIR = join(dirname(onelogin.saml2.xml_utils.__file__), "schemas")
+"""Directory of the XSD schemas of OneLogin."""
+
+PARSER_OPTIONS = {
+    "resolve_entities": False,
+    "remove_comments": True,
+    "remove_pis": True,
+    "no_network": True,
+    "load_dtd": False,
+    "dtd_validation": False,
+    "huge_tree": False,
+}
+"""Options of the ``lxml.etree.XMLParser`` of the SAML messages."""
+
+_max_size = ContextVar("invenio_saml_max_xml_size", default=None)
+
+
+class _ThreadCache(threading.local):
+    """Parser and compiled schemas of a thread."""
+
+    def __init__(self):
+        self.parser = None
+        self.schemas = {}
+
+
+_local = _ThreadCache()
+
+
+@contextmanager
+def max_xml_size(size):
+    """Limit the size of the XML documents parsed in the block.
+
+    :param size: Maximum size in bytes, or ``None`` for no limit.
+    """
+    token = _max_size.set(size)
+    try:
+        yield
+    finally:
+        _max_size.reset(token)
+
+
+def get_parser():
+    """Get the hardened parser of the current thread."""
+    parser = _local.parser
+    if parser is None:
+        parser = etree.XMLParser(**PARSER_OPTIONS)
+        parser.set_element_class_lookup(
+            etree.ElementDefaultClassLookup(element=RestrictedElement)
+        )
+        _local.parser = parser
+    return parser
+
+
+def _size(text, max_size):
+    """Size in bytes of a document, encoded only if it could be too large."""
+    # A character is encoded in four bytes at most
+    if isinstance(text, bytes) or len(text) * 4 <= max_size:
+        return len(text)
+    return len(text.encode("utf-8"))
+
+
+def fromstring(text, parser=None, base_url=None, forbid_dtd=True, forbid_entities=True):
+    """Parse an XML document like OneLogin, with the parser of the thread.
+
+    :raises invenio_saml.errors.XMLTooLarge: If the document exceeds the
+        :func:`max_xml_size`.
+    """
+    max_size = _max_size.get()
+    if max_size is not None:
+        size = _size(text, max_size)
+        if size > max_size:
+            raise XMLTooLarge(size, max_size)
+    return _fromstring(
+        text,
+        parser if parser is not None else get_parser(),
+        base_url=base_url,
+        forbid_dtd=forbid_dtd,
+        forbid_entities=forbid_entities,
+    )
+
+
+def get_schema(name):
+    """Get a compiled schema of OneLogin for the current thread.
+
+    :param name: File name of the schema in :data:`SCHEMAS_DIR`.
+    """
+    schema = _local.schemas.get(name)
+    if schema is None:
+        with open(join(SCHEMAS_DIR, name), "rb") as f:
+            schema = etree.XMLSchema(etree.parse(f))
+        _local.schemas[name] = schema
+    return schema
+
+
+def validate_xml(xml, schema, debug=False):
+    """Validate an XML document against a cached schema.
+
+    Same as ``OneLogin_Saml2_XML.validate_xml``, without printing the errors
+    in debug mode.
+
+    :returns: ``"unloaded_xml"`` or ``"invalid_xml"`` on errors, otherwise
+        the root element of the document.
+    """
+    try:
+        xml = OneLogin_Saml2_XML.to_etree(xml)
+    except Exception:
+        return "unloaded_xml"
+    if not get_schema(schema).validate(xml):
+        return "invalid_xml"
+    return xml
+
+
+_originals = None
+
+
+def install_xml_cache():
+    """Make OneLogin parse and validate the XML with the cached objects.
+
+    It replaces private functions of OneLogin for the whole process, which is
+    why ``SSO_SAML_XML_CACHE`` is opt-in.
+    """
+    global _originals
+    if _originals is None:
+        _originals = (
+            OneLogin_Saml2_XML.__dict__["_parse_etree"],
+            OneLogin_Saml2_XML.__dict__["validate_xml"],
+        )
+        OneLogin_Saml2_XML._parse_etree = staticmethod(fromstring)
+        OneLogin_Saml2_XML.validate_xml = staticmethod(validate_xml)
+
+
+def uninstall_xml_cache():
+    """Restore the parsing and validation of OneLogin."""
+    global _originals
+    if _originals is not None:
+        OneLogin_Saml2_XML._parse_etree, OneLogin_Saml2_XML.validate_xml = _originals
+        _originals = None
+
+
+def is_xml_cache_installed():
+    """Whether :func:`install_xml_cache` is in effect."""
+    return _originals is not None
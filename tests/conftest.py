@@ -20,6 +20,8 @@ from flask_webpackext.manifest import (
 from invenio_app.factory import create_app as create_invenio_app
 from onelogin.saml2.utils import OneLogin_Saml2_Utils as saml_utils
 
+from invenio_saml.proxies import current_sso_saml
+
 
 #
 # Mock the webpack manifest to avoid having to compile the full assets.
@@ -80,6 +82,16 @@ def app_config(app_config):
             "sp_key_file": str(resources.files(__name__) / "data" / "cert.key"),
         },
         "idp-url": {"settings_url": "https://test-idp.com/settings"},
+        "idp-federation": {
+            "federation": "test-federation",
+            "entity_id": "https://idp-one.example.org",
+        },
+    }
+    app_config["SSO_SAML_FEDERATIONS"] = {
+        "test-federation": {
+            "metadata_file": str(resources.files(__name__) / "data" / "federation.xml"),
+            "defaults": {"auto_confirm": True},
+        },
     }
     # Add template
     app_config["OAUTHCLIENT_LOGIN_USER_TEMPLATE"] = "invenio_saml/login_user.html"
@@ -121,3 +133,35 @@ def metadata_response():
     """Metadata response."""
     with (resources.files(__name__) / "data" / "metadata.xml").open("rb") as f:
         return f.read()
+
+
+@pytest.fixture
+def signed_idp(appctx):
+    """Identity provider requiring signed and encrypted assertions."""
+    appctx.config["SSO_SAML_IDPS"]["idp-signed"] = {
+        "settings": {
+            "idp": {
+                "entityId": "https://idp.example.org",
+                "singleSignOnService": {"url": "https://idp.example.org/sso"},
+                "singleLogoutService": {"url": "https://idp.example.org/slo"},
+                "x509cert": (
+                    resources.files(__name__) / "data" / "idp.crt"
+                ).read_text(),
+            },
+            "security": {
+                "wantAssertionsSigned": True,
+                "wantAssertionsEncrypted": True,
+            },
+        },
+        "sp_cert_file": str(resources.files(__name__) / "data" / "sp.crt"),
+        "sp_key_file": str(resources.files(__name__) / "data" / "sp.key"),
+        "acs_handler": lambda auth, next_url: next_url,
+        "sls_handler": lambda auth, next_url: next_url,
+    }
+    try:
+        with appctx.test_request_context():
+            settings = current_sso_saml.get_runtime("idp-signed").settings
+        yield settings
+    finally:
+        del appctx.config["SSO_SAML_IDPS"]["idp-signed"]
+        current_sso_saml.invalidate("idp-signed")
@@ -0,0 +1,143 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""Admission control tests."""
+
+import threading
+
+from flask import url_for
+
+from invenio_saml import admission
+from invenio_saml.admission import (
+    ConcurrencyLimiter,
+    MemoryRateLimiter,
+    RedisRateLimiter,
+)
+
+
+class LocalRedis(object):
+    """Local stand-in for the subset of the Redis client used."""
+
+    def __init__(self, wait):
+        """Initialize the client returning a wait."""
+        self.wait = wait
+        self.calls = []
+
+    def eval(self, script, numkeys, *keys_and_args):
+        """Record the evaluated script."""
+        self.calls.append((numkeys,) + keys_and_args)
+        return str(self.wait).encode()
+
+
+def test_memory_rate_limiter(monkeypatch):
+    """Test the token buckets are refilled over time."""
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = MemoryRateLimiter()
+
+    assert [limiter.acquire("idp:sso", 2, 3) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("idp:sso", 2, 3) == 0.5
+    # Other buckets are independent
+    assert limiter.acquire("idp:acs", 2, 3) == 0
+
+    now[0] += 0.25
+    assert limiter.acquire("idp:sso", 2, 3) == 0.25
+    now[0] += 0.25
+    assert limiter.acquire("idp:sso", 2, 3) == 0
+    # The buckets do not exceed their burst
+    now[0] += 60
+    assert [limiter.acquire("idp:sso", 2, 3) for _ in range(4)] == [0, 0, 0, 0.5]
+
+
+def test_redis_rate_limiter():
+    """Test the Redis token buckets."""
+    client = LocalRedis(0.25)
+    limiter = RedisRateLimiter(client)
+    assert limiter.acquire("idp:sso", 2, 3) == 0.25
+    numkeys, key, rate, burst, _ = client.calls[0]
+    assert (numkeys, key, rate, burst) == (1, "saml:rate:idp:sso", 2, 3)
+
+
+def test_concurrency_limiter():
+    """Test the requests over the limit wait in the queue."""
+    limiter = ConcurrencyLimiter(1, queue_size=1, timeout=5)
+    assert limiter.acquire()
+
+    admitted = []
+    waiting = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+    waiting.start()
+    while not limiter.waiting:
+        pass
+    # The queue is full
+    assert not limiter.acquire()
+
+    limiter.release()
+    waiting.join()
+    assert admitted == [True]
+    assert limiter.active == 1
+
+    limiter.timeout = 0.01
+    assert not limiter.acquire()
+    limiter.release()
+    assert limiter.acquire()
+
+
+def test_concurrency_limiter_free_slot():
+    """Test a free slot is taken even if the queue is full."""
+    limiter = ConcurrencyLimiter(1, queue_size=1, timeout=5)
+    assert limiter.acquire()
+
+    admitted = []
+    waiting = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+    waiting.start()
+    while not limiter.waiting:
+        pass
+    with limiter._condition:
+        # The waiting request is not woken up before the lock is released
+        limiter.release()
+        assert limiter.waiting == 1
+        assert limiter.acquire()
+    limiter.release()
+    waiting.join()
+    assert admitted == [True]
+
+
+def test_admission_views(appctx, base_client, signed_idp):
+    """Test the requests over the limits are rejected with Retry-After."""
+    state = appctx.extensions["invenio-sso-saml"]
+    sso_url = url_for("sso_saml.sso", idp="idp-signed")
+    acs_url = url_for("sso_saml.acs", idp="idp-signed")
+
+    # The IdPs which are not built yet are limited too
+    state.invalidate("idp-signed")
+    appctx.config["SSO_SAML_RATE_LIMITS"] = {"sso": (0.1, 1)}
+    state.__dict__["rate_limiter"] = MemoryRateLimiter()
+    try:
+        assert base_client.get(sso_url).status_code == 302
+        res = base_client.get(sso_url)
+        assert res.status_code == 429
+        assert res.headers["Retry-After"] == "10"
+        assert res.json == ["rate_limited"]
+
+        # The unknown IdPs share a bucket
+        unknown_url = url_for("sso_saml.sso", idp="unknown-1")
+        assert base_client.get(unknown_url).status_code == 404
+        unknown_url = url_for("sso_saml.sso", idp="unknown-2")
+        assert base_client.get(unknown_url).status_code == 429
+        assert set(state.rate_limiter._buckets) == {"idp-signed:sso", "*:sso"}
+    finally:
+        appctx.config["SSO_SAML_RATE_LIMITS"] = {}
+        del state.__dict__["rate_limiter"]
+
+    limiter = state.__dict__["acs_limiter"] = ConcurrencyLimiter(1, timeout=1)
+    try:
+        assert limiter.acquire()
+        res = base_client.post(acs_url, data={"SAMLResponse": "garbage"})
+        assert res.status_code == 503
+        assert res.headers["Retry-After"] == "1"
+        limiter.release()
+
+        res = base_client.post(acs_url, data={"SAMLResponse": "garbage"})
+        assert res.status_code == 400
+        assert limiter.active == 0
+    finally:
+        del state.__dict__["acs_limiter"]
@@ -0,0 +1,95 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Outstanding request store tests."""
+
+import json
+
+from invenio_saml.authn_requests import (
+    MemoryRequestStore,
+    OutstandingRequest,
+    RedisRequestStore,
+    SessionRequests,
+)
+
+
+class LocalRedis(object):
+    """Local stand-in for the subset of the Redis client used."""
+
+    def __init__(self):
+        """Initialize the store."""
+        self.data = {}
+
+    def set(self, name, value, ex=None):
+        """Set a key."""
+        self.data[name] = value
+
+    def get(self, name):
+        """Get a key."""
+        return self.data.get(name)
+
+    def delete(self, name):
+        """Delete a key."""
+        return int(self.data.pop(name, None) is not None)
+
+    def pipeline(self):
+        """Pipeline running the commands on ``execute``."""
+        client, commands = self, []
+
+        class Pipeline(object):
+            def get(self, name):
+                commands.append(lambda: client.get(name))
+
+            def delete(self, name):
+                commands.append(lambda: client.delete(name))
+
+            def execute(self):
+                return [command() for command in commands]
+
+        return Pipeline()
+
+
+def test_memory_request_store():
+    """Test the in-process outstanding request store."""
+    store = MemoryRequestStore(max_size=3)
+    store.add(OutstandingRequest("a", "idp", relay_state="/next"), 60)
+    request = store.pop("a")
+    assert (request.id, request.idp, request.relay_state) == ("a", "idp", "/next")
+    # Requests are answered once
+    assert store.pop("a") is None
+    assert store.pop("unknown") is None
+
+    # Expired requests are forgotten
+    store.add(OutstandingRequest("b", "idp"), -1)
+    assert store.pop("b") is None
+
+    # The store is bounded, the oldest requests are evicted first
+    for request_id in "cdef":
+        store.add(OutstandingRequest(request_id, "idp"), 60)
+    assert len(store) == 3
+    assert store.pop("c") is None
+    store.discard("d")
+    assert store.pop("d") is None
+    assert store.pop("f").id == "f"
+
+
+def test_redis_request_store():
+    """Test the Redis outstanding request store."""
+    client = LocalRedis()
+    store = RedisRequestStore(client)
+    store.add(OutstandingRequest("a", "idp", issued=1, relay_state="/next"), 60)
+    assert json.loads(client.data["saml:request:a"]) == ["idp", 1, "/next"]
+    request = store.pop("a")
+    assert (request.id, request.idp, request.issued) == ("a", "idp", 1)
+    assert store.pop("a") is None
+
+
+def test_session_requests():
+    """Test the outstanding requests of a session match a response."""
+    requests = SessionRequests(["a", "b"])
+    assert requests.match("a") == "a"
+    assert requests.match("b") == "b"
+    # OneLogin then rejects the response with the latest ID
+    assert requests.match("c") == "b"
+    assert requests.match(None) == "b"
+    assert SessionRequests().match("a") is None
@@ -5,7 +5,11 @@
 
 import pytest
 
-from invenio_saml.invenio_app import get_safe_redirect_target
+from invenio_saml.invenio_app import (
+    TrustedHosts,
+    get_safe_redirect_target,
+    get_trusted_hosts,
+)
 
 
 @pytest.mark.parametrize(
@@ -15,6 +19,9 @@ from invenio_saml.invenio_app import get_safe_redirect_target
         ("/foo", "/foo"),
         ("http://not-safe.com", None),
         ("https://example.com", "https://example.com"),
+        ("https://not-safe.com/foo?bar=1#baz", "/foo?bar=1#baz"),
+        ("http://tests.com:5000/foo", "http://tests.com:5000/foo"),
+        ("http://tests.com/foo", "/foo"),
     ],
 )
 def test_get_safe_redirect(base_app, next_url, expected):
@@ -22,3 +29,37 @@ def test_get_safe_redirect(base_app, next_url, expected):
     with base_app.test_request_context(query_string={"next": next_url}):
         safe_next = get_safe_redirect_target()
         assert safe_next == expected
+
+
+def test_trusted_hosts():
+    """Test the exact and wildcard trusted hosts."""
+    hosts = TrustedHosts(
+        ["example.com", ".example.org", "*.example.net", "tests.com:5000"]
+    )
+    assert hosts.match("example.com")
+    assert hosts.match("example.com", "443")
+    assert not hosts.match("www.example.com")
+
+    assert hosts.match("example.org")
+    assert hosts.match("a.b.example.org")
+    assert not hosts.match("badexample.org")
+
+    assert hosts.match("www.example.net")
+    assert not hosts.match("example.net")
+
+    assert hosts.match("tests.com", "5000")
+    assert not hosts.match("tests.com", "80")
+    assert not hosts.match("tests.com")
+
+
+def test_get_trusted_hosts(base_app):
+    """Test the trusted hosts are compiled once per setting."""
+    with base_app.app_context():
+        assert get_trusted_hosts() is get_trusted_hosts()
+        hosts = base_app.config["TRUSTED_HOSTS"]
+        try:
+            base_app.config["TRUSTED_HOSTS"] = [".example.com"]
+            assert get_trusted_hosts().match("www.example.com")
+        finally:
+            base_app.config["TRUSTED_HOSTS"] = hosts
+        assert not get_trusted_hosts().match("www.example.com")
@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Federation metadata tests."""
+
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import importlib_resources as resources
+import pytest
+from mock import patch
+
+from invenio_saml.cli import saml
+from invenio_saml.errors import FederationUnavailable, IdentityProviderNotFound
+from invenio_saml.federation import (
+    FederationMetadata,
+    federation_idp_name,
+    iter_idp_entities,
+)
+from invenio_saml.index import compile_index
+from invenio_saml.proxies import current_sso_saml
+
+FEDERATION_FILE = str(resources.files(__name__) / "data" / "federation.xml")
+
+
+def test_iter_idp_entities():
+    """Test only IdPs are streamed out of the aggregate."""
+    entities = dict(iter_idp_entities(FEDERATION_FILE))
+    assert sorted(entities) == [
+        "https://idp-one.example.org",
+        "https://idp-two.example.org",
+    ]
+    assert b"cert-two" in entities["https://idp-two.example.org"]
+    assert b"cert-one" not in entities["https://idp-two.example.org"]
+
+
+def test_federation_metadata(tmp_path):
+    """Test the federation index."""
+    federation = FederationMetadata("fed", FEDERATION_FILE, cache_dir=str(tmp_path))
+    assert len(federation) == 2
+    assert "https://idp-two.example.org" in federation
+    assert "https://sp.example.org" not in federation
+
+    name = federation_idp_name("fed", "https://idp-two.example.org")
+    assert name.startswith("fed-")
+    assert federation.resolve(name) == "https://idp-two.example.org"
+    assert federation.resolve("fed-unknown") is None
+
+    settings = federation.get_settings("https://idp-two.example.org")
+    assert settings["idp"]["entityId"] == "https://idp-two.example.org"
+    assert settings["idp"]["x509cert"] == "cert-two"
+    assert (
+        settings["idp"]["singleSignOnService"]["url"]
+        == "https://idp-two.example.org/sso"
+    )
+
+    with pytest.raises(KeyError):
+        federation.get_settings("https://sp.example.org")
+
+
+def test_federation_metadata_cache(tmp_path):
+    """Test the compiled index is reused until the aggregate changes."""
+    path = tmp_path / "federation.xml"
+    shutil.copy(FEDERATION_FILE, path)
+    cache_dir = tmp_path / "cache"
+    federation = FederationMetadata("fed", str(path), cache_dir=str(cache_dir))
+    assert len(federation) == 2
+    (index,) = cache_dir.iterdir()
+
+    with patch("invenio_saml.federation.compile_index") as compile_index:
+        assert len(FederationMetadata("fed", str(path), str(cache_dir))) == 2
+    assert not compile_index.called
+
+    os.utime(path, ns=(0, 0))
+    assert federation.is_stale()
+    federation = FederationMetadata("fed", str(path), cache_dir=str(cache_dir))
+    assert "https://idp-one.example.org" in federation
+    # The index of the former aggregate is removed
+    (new_index,) = cache_dir.iterdir()
+    assert new_index.name != index.name
+
+
+def test_federation_idps(appctx):
+    """Test IdPs are resolved from the federation."""
+    current_sso_saml.get_federation("test-federation", wait=True)
+    settings = current_sso_saml.get_settings("idp-federation")
+    assert settings["idp"]["entityId"] == "https://idp-one.example.org"
+
+    name = federation_idp_name("test-federation", "https://idp-two.example.org")
+    settings = current_sso_saml.get_settings(name)
+    assert settings["idp"]["entityId"] == "https://idp-two.example.org"
+    assert current_sso_saml.get_idp_config(name)["auto_confirm"]
+
+    with pytest.raises(IdentityProviderNotFound):
+        current_sso_saml.get_settings("test-federation-unknown")
+
+
+@contextmanager
+def paused_compilation():
+    """Hold the compilation of the indexes until the context exits."""
+    resume = threading.Event()
+
+    def compile_later(*args):
+        resume.wait()
+        return compile_index(*args)
+
+    with patch("invenio_saml.federation.compile_index", side_effect=compile_later):
+        try:
+            yield
+        finally:
+            resume.set()
+
+
+def test_federation_metadata_background(tmp_path):
+    """Test the aggregate is compiled in background without waiting."""
+    path = tmp_path / "federation.xml"
+    shutil.copy(FEDERATION_FILE, path)
+    federation = FederationMetadata("fed", str(path), cache_dir=str(tmp_path))
+    with paused_compilation():
+        with pytest.raises(FederationUnavailable):
+            federation.load(wait=False)
+    federation._compiling.join()
+    assert federation.load(wait=False) is federation
+    index_path = federation.index_path
+
+    # The former index is served until the new one is compiled
+    os.utime(path, ns=(0, 0))
+    with paused_compilation():
+        assert federation.load(wait=False).index_path == index_path
+        assert federation.is_stale()
+    federation._compiling.join()
+    assert federation.load(wait=False).index_path != index_path
+    assert not federation.is_stale()
+    assert not os.path.exists(index_path)
+
+    # Another instance serves the former index too
+    os.utime(path, ns=(1, 1))
+    other = FederationMetadata("fed", str(path), cache_dir=str(tmp_path))
+    with paused_compilation():
+        assert other.load(wait=False).index_path == federation.index_path
+    other._compiling.join()
+
+
+def test_federation_idps_rebuilt(appctx, tmp_path):
+    """Test the IdPs of a federation are rebuilt when the aggregate changes."""
+    state = appctx.extensions["invenio-sso-saml"]
+    config = appctx.config["SSO_SAML_FEDERATIONS"]["test-federation"]
+    path = tmp_path / "federation.xml"
+    shutil.copy(FEDERATION_FILE, path)
+    metadata_file = config["metadata_file"]
+    config["metadata_file"] = str(path)
+    appctx.config["SSO_SAML_FEDERATION_CACHE_DIR"] = str(tmp_path / "cache")
+    appctx.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"] = 0
+    try:
+        state.invalidate()
+        with paused_compilation(), appctx.test_client() as client:
+            # Not compiled yet
+            assert client.get("/saml/sso/idp-federation").status_code == 503
+        state.federations["test-federation"]._compiling.join()
+
+        with appctx.test_request_context():
+            runtime = state.get_runtime("idp-federation")
+            assert runtime.config["settings"]["idp"]["x509cert"] == "cert-one"
+            assert state.get_runtime("idp-federation") is runtime
+
+            path.write_text(path.read_text().replace("cert-one", "cert-new"))
+            os.utime(path, ns=(0, 0))
+            with paused_compilation():
+                # Built from the former index while the new one is compiled
+                rebuilt = state.get_runtime("idp-federation")
+                assert rebuilt.config["settings"]["idp"]["x509cert"] == "cert-one"
+            state.federations["test-federation"]._compiling.join()
+            rebuilt = state.get_runtime("idp-federation")
+        assert rebuilt is not runtime
+        assert rebuilt.config["settings"]["idp"]["x509cert"] == "cert-new"
+    finally:
+        config["metadata_file"] = metadata_file
+        appctx.config["SSO_SAML_FEDERATION_CACHE_DIR"] = None
+        appctx.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"] = 5
+        state.invalidate()
+
+
+def test_compile_federation_cli(appctx, tmp_path):
+    """Test compiling the index of a federation into the cache directory."""
+    appctx.config["SSO_SAML_FEDERATION_CACHE_DIR"] = str(tmp_path)
+    try:
+        current_sso_saml.invalidate()
+        result = appctx.test_cli_runner().invoke(
+            saml, ["compile-metadata", "test-federation"]
+        )
+        assert result.exit_code == 0
+        (index,) = tmp_path.iterdir()
+        assert "Compiled 2 IdPs into {}".format(index) in result.output
+    finally:
+        appctx.config["SSO_SAML_FEDERATION_CACHE_DIR"] = None
+        current_sso_saml.invalidate()
@@ -8,10 +8,12 @@ from datetime import datetime, timezone
 import pytest
 from flask import current_app
 from flask_security import current_user, login_user
+from flask_security.signals import user_registered
 from invenio_accounts.models import User
 from invenio_accounts.proxies import current_datastore
 from invenio_oauthclient.models import UserIdentity
 from mock import Mock, patch
+from sqlalchemy import event
 from werkzeug.exceptions import Unauthorized
 
 from invenio_saml.handlers import (
@@ -19,6 +21,34 @@ from invenio_saml.handlers import (
     default_account_setup,
     default_sls_handler,
 )
+from invenio_saml.invenio_accounts.utils import account_get_user
+
+
+class QueryCounter(object):
+    """Count the ``SELECT`` statements and the commits of a database."""
+
+    def __init__(self, db):
+        """Initialize the counter."""
+        self.engine = db.engine
+        self.commit = patch.object(db.session, "commit", wraps=db.session.commit)
+        self.selects = 0
+        self.commits = 0
+
+    def _count(self, conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.selects += 1
+
+    def __enter__(self):
+        """Start counting."""
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        self.mock_commit = self.commit.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop counting."""
+        event.remove(self.engine, "before_cursor_execute", self._count)
+        self.commits = self.mock_commit.call_count
+        self.commit.stop()
 
 
 def test_default_account_setup(users):
@@ -43,6 +73,43 @@ def test_default_account_setup(users):
     assert identities[0].user == user
 
 
+def test_account_get_user_queries(appctx, db, users):
+    """Test the queries needed to resolve and link the user of a login."""
+    account_info = dict(
+        user=dict(email="unknown@example.com"),
+        external_id="123456",
+        external_method="external",
+    )
+
+    # New user: one query and nothing to look up when linking
+    with QueryCounter(db) as counter:
+        assert account_get_user(account_info) is None
+    assert counter.selects == 1
+    assert account_info["external_linked"] is False
+
+    # Existing user found by email, not linked yet
+    account_info["user"]["email"] = "federico@example.com"
+    with QueryCounter(db) as counter:
+        user = account_get_user(account_info)
+        default_account_setup(user, account_info)
+    assert user.email == "federico@example.com"
+    assert counter.selects == 1
+    assert UserIdentity.query.filter_by(id_user=user.id).count() == 1
+
+    # Returning user found by the external id, even if the email changed
+    account_info = dict(
+        user=dict(email="changed@example.com"),
+        external_id="123456",
+        external_method="external",
+    )
+    with QueryCounter(db) as counter:
+        assert account_get_user(account_info) == user
+        default_account_setup(user, account_info)
+    assert counter.selects == 1
+    assert account_info["external_linked"] is True
+    assert UserIdentity.query.filter_by(id_user=user.id).count() == 1
+
+
 def test_default_sls_handler(appctx, users):
     """Test default SLS handler."""
     with appctx.test_request_context():
@@ -122,6 +189,93 @@ def test_acs_handler_factory_config(appctx, db):
         assert current_user.confirmed_at
 
 
+def test_acs_handler_single_commit(appctx, db):
+    """Test that a login is committed at once and rolled back on errors."""
+    appctx.config["SSO_SAML_IDPS"] = {
+        "test": {
+            "mappings": {
+                "email": "email",
+                "name": "name",
+                "surname": "surname",
+                "external_id": "external_id",
+            },
+            "auto_confirm": True,
+        }
+    }
+    attrs = dict(
+        email=["single-commit@example.com"],
+        name=["federico"],
+        surname=["Fernandez"],
+        external_id=["single-commit"],
+    )
+
+    failing_setup = Mock(side_effect=RuntimeError("setup failed"))
+    with (
+        appctx.test_request_context(),
+        patch("invenio_saml.utils.SAMLAuth") as mock_saml_auth,
+    ):
+        mock_saml_auth.get_attributes.return_value = attrs
+        with pytest.raises(RuntimeError):
+            acs_handler_factory("test", account_setup=failing_setup)(
+                mock_saml_auth, "/foo"
+            )
+        assert not current_user.is_authenticated
+    # Committed by Flask-Security, but neither linked nor logged in
+    user = User.query.filter_by(email="single-commit@example.com").one()
+    assert UserIdentity.query.filter_by(id_user=user.id).count() == 0
+    assert not user.login_count
+
+    with (
+        appctx.test_request_context(),
+        patch("invenio_saml.utils.SAMLAuth") as mock_saml_auth,
+        QueryCounter(db) as counter,
+    ):
+        mock_saml_auth.get_attributes.return_value = attrs
+        acs_handler_factory("test")(mock_saml_auth, "/foo")
+        assert current_user.is_authenticated
+    # The session, then the datastore with its signals
+    assert counter.commits == 2
+    user = User.query.filter_by(email="single-commit@example.com").one()
+    assert UserIdentity.query.filter_by(id_user=user.id).count() == 1
+    assert user.login_count == 1
+
+
+def test_acs_handler_registered_signal(appctx, db):
+    """Test the changes of the registration receivers are committed."""
+    appctx.config["SSO_SAML_IDPS"] = {
+        "test": {
+            "mappings": {
+                "email": "email",
+                "name": "name",
+                "surname": "surname",
+                "external_id": "external_id",
+            },
+            "auto_confirm": True,
+        }
+    }
+    attrs = dict(
+        email=["registered@example.com"],
+        name=["federico"],
+        surname=["Fernandez"],
+        external_id=["registered"],
+    )
+
+    def receiver(app, user, confirm_token):
+        user.username = "registered"
+
+    with (
+        appctx.test_request_context(),
+        patch("invenio_saml.utils.SAMLAuth") as mock_saml_auth,
+        user_registered.connected_to(receiver),
+    ):
+        mock_saml_auth.get_attributes.return_value = attrs
+        acs_handler_factory("test")(mock_saml_auth, "/foo")
+        assert current_user.is_authenticated
+    db.session.expire_all()
+    user = User.query.filter_by(email="registered@example.com").one()
+    assert user.username == "registered"
+
+
 def test_acs_handler_authetication_error(appctx, db):
     """Test ACS handler factory authentication errors."""
     attrs = dict(
@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Compiled metadata index tests."""
+
+import importlib_resources as resources
+import pytest
+
+from invenio_saml.cli import saml
+from invenio_saml.federation import federation_idp_name
+from invenio_saml.index import InvalidIndexError, MetadataIndex, compile_index
+from invenio_saml.proxies import current_sso_saml
+
+FEDERATION_FILE = str(resources.files(__name__) / "data" / "federation.xml")
+
+
+def test_compile_index(tmp_path):
+    """Test binary search lookups over a compiled index."""
+    path = str(tmp_path / "idps.idx")
+    entities = [
+        (
+            "https://idp{}.example.org".format(i),
+            "fed-{}".format(i),
+            {"idp": {"entityId": "https://idp{}.example.org".format(i)}},
+        )
+        for i in range(100)
+    ]
+    assert compile_index(path, reversed(entities)) == 100
+
+    index = MetadataIndex(path)
+    assert len(index) == 100
+    assert sorted(index.entity_ids()) == sorted(e[0] for e in entities)
+    for entity_id, name, settings in entities:
+        assert entity_id in index
+        assert index.resolve(name) == entity_id
+        assert index.get_settings(entity_id) == settings
+    assert "https://unknown.example.org" not in index
+    assert index.resolve("fed-unknown") is None
+    with pytest.raises(KeyError):
+        index.get_settings("https://unknown.example.org")
+
+    assert not index.is_stale()
+    compile_index(path, entities[:1])
+    assert index.is_stale()
+    assert len(MetadataIndex(path)) == 1
+    index.close()
+
+
+def test_invalid_index(tmp_path):
+    """Test opening a file which is not an index."""
+    path = tmp_path / "idps.idx"
+    path.write_bytes(b"<xml/>" * 10)
+    with pytest.raises(InvalidIndexError):
+        MetadataIndex(str(path))
+
+
+def test_compile_metadata_cli(appctx, tmp_path):
+    """Test compiling a federation and using the index."""
+    path = str(tmp_path / "federation.idx")
+    runner = appctx.test_cli_runner()
+    result = runner.invoke(
+        saml, ["compile-metadata", "other", "--source", FEDERATION_FILE]
+    )
+    assert result.exit_code != 0
+
+    result = runner.invoke(
+        saml,
+        ["compile-metadata", "test-federation", "--output", path],
+    )
+    assert result.exit_code == 0
+    assert "Compiled 2 IdPs" in result.output
+
+    federations = appctx.config["SSO_SAML_FEDERATIONS"]
+    federations["test-federation"]["index_file"] = path
+    current_sso_saml.invalidate()
+    try:
+        index = current_sso_saml.get_federation("test-federation")
+        assert isinstance(index, MetadataIndex)
+
+        name = federation_idp_name("test-federation", "https://idp-two.example.org")
+        settings = current_sso_saml.get_settings(name)
+        assert settings["idp"]["entityId"] == "https://idp-two.example.org"
+        assert settings["idp"]["x509cert"] == "cert-two"
+    finally:
+        del federations["test-federation"]["index_file"]
+        current_sso_saml.invalidate()
@@ -3,13 +3,20 @@
 
 """Module tests."""
 
+import gc
+import threading
+import time
+import weakref
+
 import importlib_resources as resources
 import pytest
 from flask import Flask
 from mock import patch
 
-from invenio_saml import InvenioSSOSAML
+from invenio_saml import InvenioSSOSAML, idp_metadata
+from invenio_saml.cli import saml
 from invenio_saml.errors import IdentityProviderNotFound
+from invenio_saml.idp_metadata import RemoteMetadataCache
 from invenio_saml.proxies import current_sso_saml
 
 
@@ -71,3 +78,282 @@ def test_auth(appctx, metadata_response):
         auth = current_sso_saml.get_auth("test-idp")
         assert auth
         assert auth.idp == "test-idp"
+
+
+def test_runtime(appctx):
+    """Test the compiled IdP runtime is built once and reused."""
+    runtime = current_sso_saml.get_runtime("idp-file")
+    assert runtime is current_sso_saml.get_runtime("idp-file")
+    assert runtime.idp == "idp-file"
+    assert runtime.settings.get_idp_data()["entityId"] == "https://login.idp.com"
+    assert "BEGIN CERTIFICATE" in runtime.sp_cert
+    assert "PRIVATE KEY" in runtime.sp_key
+    assert runtime.handlers["acs_handler"] is None
+    # The configuration keeps the values as provided
+    assert runtime.config["settings"]["sp"]["x509cert"] == "crt\n"
+
+    with pytest.raises(AttributeError):
+        runtime.idp = "foo"
+    with pytest.raises(TypeError):
+        runtime.handlers["acs_handler"] = None
+
+    with appctx.test_request_context():
+        auth1 = current_sso_saml.get_auth("idp-file")
+        auth2 = current_sso_saml.get_auth("idp-file")
+        assert auth1.shared_settings is runtime.settings
+        assert auth2.shared_settings is runtime.settings
+
+        # Changing the settings of a request does not affect the others
+        settings = auth1.get_settings()
+        settings.set_strict(False)
+        settings.get_security_data()["wantAssertionsSigned"] = True
+        assert runtime.settings.is_strict()
+        assert auth2.get_settings().is_strict()
+        assert not runtime.settings.get_security_data()["wantAssertionsSigned"]
+        assert not auth2.get_settings().get_security_data()["wantAssertionsSigned"]
+
+
+def test_idp_metadata_refresh(appctx):
+    """Test the remote IdP metadata is refreshed in the background."""
+    url = "https://test-idp.com/metadata"
+    with (resources.files(__name__) / "data" / "idp.xml").open() as f:
+        xml = f.read()
+
+    refreshed = threading.Event()
+    cache = RemoteMetadataCache(appctx, on_refresh=lambda url: refreshed.set())
+    with patch.object(cache, "fetch", return_value=xml) as mock_fetch:
+        settings = cache.get(url)
+        assert settings["idp"]["entityId"] == "https://login.idp.com"
+        assert cache.get(url) is settings
+        assert mock_fetch.call_count == 1
+
+        # Unchanged metadata does not rebuild the IdPs
+        cache._entries[url].expires = 0
+        cache.refresh(url, wait=True)
+        assert mock_fetch.call_count == 2
+        assert not refreshed.is_set()
+        assert cache.get(url) is settings
+        assert not cache._entries[url].expired
+
+        # The stale copy is served while refreshing
+        cache._entries[url].expires = 0
+        mock_fetch.return_value = xml.replace(
+            "<md:EntityDescriptor ",
+            '<md:EntityDescriptor cacheDuration="PT600S" ',
+        ).replace("https://login.idp.com", "https://new.idp.com")
+        assert cache.get(url) is settings
+        assert refreshed.wait(5)
+        assert cache.get(url)["idp"]["entityId"] == "https://new.idp.com"
+        assert cache._entries[url].expires <= time.time() + 600
+
+        # Failures keep the last good copy and are retried later
+        cache._entries[url].expires = 0
+        mock_fetch.side_effect = Exception("IdP down")
+        cache.refresh(url, wait=True)
+        assert cache.get(url)["idp"]["entityId"] == "https://new.idp.com"
+        assert not cache._entries[url].expired
+
+
+def test_idp_metadata_prefetch(appctx):
+    """Test the first access waits for the prefetched remote IdP metadata."""
+    url = "https://test-idp.com/metadata"
+    with (resources.files(__name__) / "data" / "idp.xml").open() as f:
+        xml = f.read()
+
+    fetching, release = threading.Event(), threading.Event()
+
+    def fetch(url):
+        fetching.set()
+        release.wait(5)
+        return xml
+
+    cache = RemoteMetadataCache(appctx)
+    with patch.object(cache, "fetch", side_effect=fetch) as mock_fetch:
+        cache.prefetch([url])
+        assert fetching.wait(5)
+        threading.Timer(0.05, release.set).start()
+        settings = cache.get(url)
+        assert settings["idp"]["entityId"] == "https://login.idp.com"
+        assert mock_fetch.call_count == 1
+
+        # Already cached
+        cache.prefetch([url])
+        assert mock_fetch.call_count == 1
+
+
+def test_idp_metadata_forked(appctx):
+    """Test the refreshes in flight are forgotten in a forked process."""
+    cache = RemoteMetadataCache(appctx)
+    cache._refreshing["https://test-idp.com/metadata"] = threading.Event()
+    idp_metadata._after_fork()
+    assert cache._refreshing == {}
+
+    # The hook does not keep the caches alive
+    ref = weakref.ref(cache)
+    del cache
+    gc.collect()
+    assert ref() is None
+
+
+def test_idp_metadata_refresh_rebuilds_runtime(appctx):
+    """Test the IdPs using refreshed metadata get rebuilt."""
+    with (resources.files(__name__) / "data" / "idp.xml").open() as f:
+        response = f.read()
+
+    with patch("onelogin.saml2.idp_metadata_parser.urllib2.urlopen") as urlopen_mock:
+        urlopen_mock.return_value = type(
+            "Response", (), {"read": lambda *args, **kwargs: response}
+        )()
+        runtime = current_sso_saml.get_runtime("idp-url")
+        file_runtime = current_sso_saml.get_runtime("idp-file")
+
+        current_sso_saml._on_idp_metadata_refresh("https://test-idp.com/settings")
+        assert current_sso_saml.get_runtime("idp-url") is not runtime
+        assert current_sso_saml.get_runtime("idp-file") is file_runtime
+
+
+def test_warmup(appctx):
+    """Test the IdP runtimes are built ahead of time without a request."""
+    current_sso_saml.invalidate()
+    results = current_sso_saml.warmup(["test-idp", "idp-file", "wrong-idp"])
+
+    assert [r.idp for r in results] == ["test-idp", "idp-file", "wrong-idp"]
+    assert results[0].ok and results[1].ok
+    assert isinstance(results[2].error, IdentityProviderNotFound)
+    assert all(r.duration >= 0 for r in results)
+    assert "test-idp" in current_sso_saml._saml_config
+    settings = current_sso_saml.get_runtime("test-idp").settings
+    assert (
+        settings.get_sp_data()["entityId"] == "http://localhost/saml/metadata/test-idp"
+    )
+
+    # Without SERVER_NAME the base URL provides the host
+    current_sso_saml.invalidate()
+    appctx.config["SERVER_NAME"] = None
+    appctx.config["SSO_SAML_WARMUP_BASE_URL"] = "https://example.com"
+    try:
+        (result,) = current_sso_saml.warmup(["test-idp"])
+        assert result.ok
+        settings = current_sso_saml.get_runtime("test-idp").settings
+        assert settings.get_sp_data()["entityId"] == (
+            "https://example.com/saml/metadata/test-idp"
+        )
+    finally:
+        appctx.config["SERVER_NAME"] = "localhost"
+        appctx.config["SSO_SAML_WARMUP_BASE_URL"] = None
+        current_sso_saml.invalidate()
+
+
+def test_warmup_init_app():
+    """Test the warm-up at application initialization."""
+    app = Flask("testapp")
+    app.config.update(
+        SERVER_NAME="sso.example.org",
+        SSO_SAML_WARMUP=True,
+        SSO_SAML_IDPS={
+            "test-idp": {
+                "settings": {
+                    "idp": {
+                        "entityId": "https://test-idp.com",
+                        "singleSignOnService": {"url": "https://test-ipd.com/sso"},
+                        "x509cert": "cert",
+                    }
+                },
+            },
+        },
+    )
+    state = InvenioSSOSAML().init_app(app)
+    assert "test-idp" in state._saml_config
+
+
+def test_warmup_cli(appctx):
+    """Test the warm-up command."""
+    runner = appctx.test_cli_runner()
+    result = runner.invoke(saml, ["warmup", "test-idp"])
+    assert result.exit_code == 0
+    assert result.output.startswith("test-idp ")
+
+    result = runner.invoke(saml, ["warmup", "test-idp", "wrong-idp"])
+    assert result.exit_code == 1
+    assert "wrong-idp FAILED" in result.output
+
+
+def test_single_flight_build(appctx):
+    """Test concurrent first requests for an IdP build it only once."""
+    state = appctx.extensions["invenio-sso-saml"]
+    state.invalidate()
+    build = state._build_configuration
+    calls = []
+
+    def slow_build(idp):
+        calls.append(idp)
+        time.sleep(0.05)
+        return build(idp)
+
+    runtimes = []
+    barrier = threading.Barrier(32)
+
+    def request(idp):
+        with appctx.app_context():
+            barrier.wait()
+            runtimes.append(state.get_runtime(idp))
+
+    with patch.object(state, "_build_configuration", side_effect=slow_build):
+        threads = [
+            threading.Thread(target=request, args=(idp,))
+            for idp in ["test-idp", "idp-file"] * 16
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sorted(calls) == ["idp-file", "test-idp"]
+    assert len(runtimes) == 32
+    assert len(set(map(id, runtimes))) == 2
+
+
+def test_build_failures_cached(appctx):
+    """Test a broken IdP is not rebuilt on every request."""
+    state = appctx.extensions["invenio-sso-saml"]
+    state.invalidate()
+    with patch.object(
+        state, "_build_configuration", side_effect=ValueError("broken")
+    ) as mock_build:
+        appctx.config["SSO_SAML_BUILD_FAILURE_TTL"] = 0
+        try:
+            for _ in range(2):
+                with pytest.raises(ValueError):
+                    state.get_runtime("test-idp")
+            assert mock_build.call_count == 2
+        finally:
+            appctx.config["SSO_SAML_BUILD_FAILURE_TTL"] = 30
+
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                state.get_runtime("test-idp")
+        assert mock_build.call_count == 3
+
+    # Unknown IdPs are not remembered
+    with pytest.raises(IdentityProviderNotFound):
+        state.get_runtime("wrong-idp")
+    assert "wrong-idp" not in state._build_failures
+
+    state.invalidate("test-idp")
+    assert state.get_runtime("test-idp")
+
+
+def test_invalidated_during_build(appctx):
+    """Test a runtime invalidated right after being built is still served."""
+    state = appctx.extensions["invenio-sso-saml"]
+    state.invalidate()
+
+    class Invalidated(dict):
+        # The runtimes are dropped by a concurrent refresh as soon as set
+        def __setitem__(self, key, value):
+            pass
+
+    with patch.object(state, "_saml_config", Invalidated()):
+        assert state.get_settings("test-idp")["idp"]["entityId"]
+        assert callable(state.get_handler("test-idp", "login_handler"))
+    state.invalidate()
@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""Key cache tests."""
+
+import base64
+import os
+
+import importlib_resources as resources
+import pytest
+import xmlsec
+from flask import url_for
+from onelogin.saml2.settings import OneLogin_Saml2_Settings
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+from invenio_saml.keys import (
+    KeyCache,
+    discard_key_material,
+    get_key_cache,
+    load_key_material,
+)
+from invenio_saml.testing import build_response
+
+DATA = resources.files(__name__) / "data"
+
+
+@pytest.fixture(scope="module")
+def app_config(app_config):
+    """Install the key cache."""
+    app_config["SSO_SAML_KEY_CACHE_SIZE"] = 256
+    return app_config
+
+
+def test_key_cache():
+    """Test the keys are parsed once by content."""
+    cache = KeyCache(size=2)
+    cert, key = (DATA / "idp.crt").read_text(), (DATA / "idp.key").read_text()
+
+    # Certificates are only read by OneLogin and shared
+    assert cache.load(cert, xmlsec.KeyFormat.CERT_PEM) is cache.load(
+        cert, xmlsec.KeyFormat.CERT_PEM
+    )
+    # Private keys are copied
+    first = cache.load(key, xmlsec.KeyFormat.PEM)
+    first.load_cert_from_memory(cert, xmlsec.KeyFormat.PEM)
+    assert cache.load(key, xmlsec.KeyFormat.PEM) is not first
+    assert len(cache) == 2
+
+    other = (DATA / "sp.crt").read_text()
+    cache.load(other, xmlsec.KeyFormat.CERT_PEM)
+    assert len(cache) == 2
+    assert (cert, xmlsec.KeyFormat.CERT_PEM, None) not in cache._keys
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_key_material():
+    """Test the keys of the settings are loaded, with the rollover ones."""
+    cache = KeyCache()
+    idp_cert, sp_cert = (DATA / "idp.crt").read_text(), (DATA / "sp.crt").read_text()
+    settings = OneLogin_Saml2_Settings(
+        {
+            "sp": {
+                "entityId": "https://sp.example.org",
+                "assertionConsumerService": {"url": "https://sp.example.org/acs"},
+                "x509cert": sp_cert,
+                "privateKey": (DATA / "sp.key").read_text(),
+            },
+            "idp": {
+                "entityId": "https://idp.example.org",
+                "singleSignOnService": {"url": "https://idp.example.org/sso"},
+                "x509certMulti": {
+                    "signing": [idp_cert, sp_cert, "invalid"],
+                    "encryption": [idp_cert],
+                },
+            },
+        }
+    )
+    keys = load_key_material(settings, cache)
+    assert keys.sp_key is not None and keys.sp_cert is not None
+    assert len(keys.idp_signing) == 2
+    assert len(keys.idp_encryption) == 1
+    # The certificates shared by the SP and the IdP are loaded once
+    assert len(cache) == 3
+
+    discard_key_material(settings, cache)
+    assert len(cache) == 0
+
+
+def test_onelogin_key_cache(appctx, base_client, signed_idp):
+    """Test OneLogin loads its keys from the installed cache."""
+    cache = get_key_cache()
+    assert cache is not None
+    cache.clear()
+
+    with appctx.test_request_context():
+        runtime = appctx.extensions["invenio-sso-saml"].get_runtime("idp-signed")
+    assert runtime.keys.sp_key is not None
+    assert len(runtime.keys.idp_signing) == 1
+
+    key, cert = (DATA / "idp.key").read_text(), (DATA / "idp.crt").read_text()
+    loaded = []
+    for _ in range(2):
+        response = build_response(
+            signed_idp,
+            key,
+            cert,
+            "federico@example.com",
+            {"email": ["federico@example.com"]},
+            encrypt=True,
+        )
+        res = base_client.post(
+            url_for("sso_saml.acs", idp="idp-signed"),
+            data={"SAMLResponse": base64.b64encode(response)},
+        )
+        assert res.status_code == 302
+        loaded.append(len(cache))
+
+    # The IdP and SP keys and the IdP certificate
+    assert loaded == [3, 3]
+
+    info = cache.fingerprint.cache_info()
+    for _ in range(2):
+        assert OneLogin_Saml2_Utils.calculate_x509_fingerprint(
+            cert, "sha256"
+        ) == OneLogin_Saml2_Utils.calculate_x509_fingerprint.__wrapped__(cert, "sha256")
+    assert cache.fingerprint.cache_info().hits == info.hits + 1
+
+
+def test_stale_keys_discarded(appctx, signed_idp, tmp_path):
+    """Test the keys of a runtime whose files changed are loaded again."""
+    state = appctx.extensions["invenio-sso-saml"]
+    cert_file = tmp_path / "sp.crt"
+    cert_file.write_text((DATA / "sp.crt").read_text())
+    appctx.config["SSO_SAML_IDPS"]["idp-signed"]["sp_cert_file"] = str(cert_file)
+    appctx.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"] = 0
+    try:
+        state.invalidate("idp-signed")
+        with appctx.test_request_context():
+            runtime = state.get_runtime("idp-signed")
+            assert state.get_runtime("idp-signed") is runtime
+
+            os.utime(cert_file, ns=(0, 0))
+            rebuilt = state.get_runtime("idp-signed")
+        assert rebuilt is not runtime
+        # Certificates are shared, the cached one would be the same object
+        assert rebuilt.keys.sp_cert is not runtime.keys.sp_cert
+    finally:
+        appctx.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"] = 5
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Attribute mappings tests."""
+
+import pytest
+from mock import patch
+
+from invenio_saml.errors import AttributeMappingError
+from invenio_saml.mappings import ACCOUNT_FIELDS, AttributeExtractor
+from invenio_saml.proxies import current_sso_saml
+
+
+def test_extractor_transforms():
+    """Test the transforms of the mappings."""
+    extractor = AttributeExtractor(
+        {
+            "email": "mail",
+            "external_id": {"attribute": "uid", "transforms": ["first", "lowercase"]},
+            "groups": {"attribute": "groups", "transforms": ["all"]},
+            "names": {"attribute": "cn", "transforms": [["join", ", "]]},
+            "domains": {
+                "attribute": "scoped",
+                "transforms": [["regex", "@(.+)$"], ["join", ","]],
+            },
+            "user": {
+                "attribute": "scoped",
+                "transforms": ["first", ["regex", "^\\w+"]],
+            },
+            "optional": {"attribute": "unknown", "default": "none"},
+        }
+    )
+    assert extractor.attributes == {"mail", "uid", "groups", "cn", "scoped", "unknown"}
+    assert extractor.extract(
+        {
+            "mail": ["federico@example.com", "other@example.com"],
+            "uid": ["ABC"],
+            "groups": ["a", "b"],
+            "cn": ["Federico", "Fede"],
+            "scoped": ["fede@example.com", "unscoped", "fede@example.org"],
+        }
+    ) == {
+        "email": "federico@example.com",
+        "external_id": "abc",
+        "groups": ["a", "b"],
+        "names": "Federico, Fede",
+        "domains": "example.com,example.org",
+        "user": "fede",
+        "optional": "none",
+    }
+
+
+def test_extractor_errors():
+    """Test the errors of missing required fields."""
+    extractor = AttributeExtractor(
+        {
+            "email": "mail",
+            "name": "givenName",
+            "surname": {"attribute": "sn", "transforms": [["regex", "^[A-Z]"]]},
+        },
+        ACCOUNT_FIELDS,
+    )
+    with pytest.raises(AttributeMappingError) as exc:
+        extractor.extract({"givenName": ["federico"], "sn": ["fernandez"], "mail": []})
+    assert exc.value.errors == [
+        {"field": "email", "attribute": "mail", "error": "missing"},
+        {"field": "surname", "attribute": "sn", "error": "invalid"},
+        {"field": "external_id", "attribute": None, "error": "not_mapped"},
+    ]
+
+    with pytest.raises(ValueError):
+        AttributeExtractor({"email": {"attribute": "mail", "transforms": ["upper"]}})
+
+
+def test_get_attribute_extractor(appctx):
+    """Test that the mappings are compiled once per IdP."""
+    mappings = dict(
+        email="email", name="name", surname="surname", external_id="external_id"
+    )
+    idp_config = appctx.config["SSO_SAML_IDPS"]["test-idp"]
+    with patch.dict(idp_config, mappings=mappings):
+        extractor = current_sso_saml.get_attribute_extractor("test-idp")
+        assert current_sso_saml.get_attribute_extractor("test-idp") is extractor
+        # Affiliations are optional
+        values = extractor.extract(
+            {
+                "email": ["federico@example.com"],
+                "name": ["federico"],
+                "surname": ["fernandez"],
+                "external_id": ["12345"],
+            }
+        )
+        assert values["email"] == "federico@example.com"
+        assert values["affiliations"] == ""
+
+        current_sso_saml.invalidate("test-idp")
+        assert current_sso_saml.get_attribute_extractor("test-idp") is not extractor
+
+    # New mappings are compiled with the runtime
+    assert current_sso_saml.get_attribute_extractor("test-idp").fields[0].attribute
+    current_sso_saml.invalidate("test-idp")
+    assert not current_sso_saml.get_attribute_extractor("test-idp").fields[0].attribute
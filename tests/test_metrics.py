@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""Request metrics tests."""
+
+import base64
+import threading
+
+import importlib_resources as resources
+import pytest
+from flask import url_for
+
+from invenio_saml.metrics import (
+    PHASE_DURATION,
+    REQUEST_DURATION,
+    REQUESTS,
+    InProcessMetrics,
+    PrometheusMetricsSink,
+)
+from invenio_saml.testing import build_response
+
+DATA = resources.files(__name__) / "data"
+
+
+@pytest.fixture(scope="module")
+def app_config(app_config):
+    """Expose the in-process metrics."""
+    app_config["SSO_SAML_METRICS_SINK_FACTORY"] = (
+        "invenio_saml.metrics.in_process_metrics_factory"
+    )
+    app_config["SSO_SAML_METRICS_ROUTE"] = "/metrics"
+    return app_config
+
+
+def test_in_process_metrics_threads():
+    """Test the metrics of the threads are added up."""
+    metrics = InProcessMetrics(buckets=(0.1, 1.0))
+
+    def record():
+        for _ in range(100):
+            metrics.observe("idp", "acs", "decode", 0.05)
+            metrics.observe("idp", "acs", "total", 0.5)
+            metrics.request("idp", "acs", "success", 0.5)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {(REQUESTS, "idp", "acs", "success"): 400}
+    assert snapshot["histograms"][(PHASE_DURATION, "idp", "acs", "decode")][:4] == [
+        400,
+        0,
+        0,
+        pytest.approx(20.0),
+    ]
+    # The total is recorded with the outcome
+    assert (PHASE_DURATION, "idp", "acs", "total") not in snapshot["histograms"]
+    request_duration = snapshot["histograms"][
+        (REQUEST_DURATION, "idp", "acs", "success")
+    ]
+    assert request_duration[-1] == 400
+
+
+def test_in_process_metrics_exited_threads():
+    """Test the shards of the exited threads are folded."""
+    metrics = InProcessMetrics(buckets=(0.1, 1.0))
+
+    for _ in range(50):
+        thread = threading.Thread(
+            target=metrics.request, args=("idp", "acs", "success", 0.5)
+        )
+        thread.start()
+        thread.join()
+    metrics.request("idp", "acs", "success", 0.5)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {(REQUESTS, "idp", "acs", "success"): 51}
+    assert snapshot["histograms"][(REQUEST_DURATION, "idp", "acs", "success")] == [
+        0,
+        51,
+        0,
+        pytest.approx(25.5),
+        51,
+    ]
+    # Only the shard of this thread is left
+    assert len(metrics._shards) == 1
+
+
+def test_in_process_metrics_render():
+    """Test the metrics are rendered in the Prometheus text format."""
+    metrics = InProcessMetrics(buckets=(0.1, 1.0))
+    metrics.request("idp", "acs", "success", 0.05)
+    metrics.request("idp", "acs", "success", 0.5)
+    metrics.request("idp", "acs", 'bad"outcome', 5)
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE invenio_saml_requests_total counter" in lines
+    assert (
+        'invenio_saml_requests_total{idp="idp",endpoint="acs",outcome="success"} 2'
+        in lines
+    )
+    assert (
+        'invenio_saml_requests_total{idp="idp",endpoint="acs",'
+        'outcome="bad\\"outcome"} 1' in lines
+    )
+    labels = 'idp="idp",endpoint="acs",outcome="success"'
+    name = "invenio_saml_request_duration_seconds"
+    assert "# TYPE {} histogram".format(name) in lines
+    assert '{}_bucket{{{},le="0.1"}} 1'.format(name, labels) in lines
+    assert '{}_bucket{{{},le="1"}} 2'.format(name, labels) in lines
+    assert '{}_bucket{{{},le="+Inf"}} 2'.format(name, labels) in lines
+    assert "{}_sum{{{}}} 0.55".format(name, labels) in lines
+    assert "{}_count{{{}}} 2".format(name, labels) in lines
+
+
+def test_in_process_metrics_directory(tmp_path):
+    """Test the metrics of the processes are added up through files."""
+    first = InProcessMetrics(directory=str(tmp_path), flush_interval=0)
+    second = InProcessMetrics(directory=str(tmp_path), flush_interval=60)
+    first.request("idp", "acs", "success", 0.1)
+    second.request("idp", "acs", "success", 0.1)
+    second.request("idp", "sso", "success", 0.1)
+    # Written when due, or when collecting
+    assert len(list(tmp_path.iterdir())) == 1
+
+    assert first.collect()["counters"] == {(REQUESTS, "idp", "acs", "success"): 1}
+    counters = second.collect()["counters"]
+    assert counters == {
+        (REQUESTS, "idp", "acs", "success"): 2,
+        (REQUESTS, "idp", "sso", "success"): 1,
+    }
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # Metrics with other buckets are ignored
+    other = InProcessMetrics(buckets=(1.0,), directory=str(tmp_path))
+    other.request("idp", "acs", "success", 0.1)
+    assert second.collect()["counters"][(REQUESTS, "idp", "acs", "success")] == 2
+
+
+def _count(client, idp, endpoint, outcome):
+    text = client.get(url_for("sso_saml.metrics")).text
+    prefix = '{}{{idp="{}",endpoint="{}",outcome="{}"}} '.format(
+        REQUESTS, idp, endpoint, outcome
+    )
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return int(line[len(prefix) :])
+    return 0
+
+
+def test_metrics_route(appctx, base_client, signed_idp):
+    """Test the outcomes of the requests are exposed."""
+    res = base_client.get(url_for("sso_saml.metrics"))
+    assert res.status_code == 200
+    assert res.content_type.startswith("text/plain; version=0.0.4")
+
+    key, cert = (DATA / "idp.key").read_text(), (DATA / "idp.crt").read_text()
+    acs_url = url_for("sso_saml.acs", idp="idp-signed")
+
+    def post(key):
+        response = build_response(
+            signed_idp,
+            key,
+            cert,
+            "federico@example.com",
+            {"email": ["federico@example.com"]},
+            encrypt=True,
+        )
+        return base_client.post(
+            acs_url, data={"SAMLResponse": base64.b64encode(response)}
+        )
+
+    success = _count(base_client, "idp-signed", "acs", "success")
+    assert post(key).status_code == 302
+    assert _count(base_client, "idp-signed", "acs", "success") == success + 1
+
+    # Signed with another key
+    errors = _count(base_client, "idp-signed", "acs", "signature_error")
+    assert post((DATA / "sp.key").read_text()).status_code == 401
+    assert _count(base_client, "idp-signed", "acs", "signature_error") == errors + 1
+
+    unknown = _count(base_client, "unknown", "sso", "unknown_idp")
+    assert base_client.get(url_for("sso_saml.sso", idp="other")).status_code == 404
+    assert _count(base_client, "unknown", "sso", "unknown_idp") == unknown + 1
+
+
+def test_prometheus_metrics_shared():
+    """Test the sinks of a Prometheus registry share its metrics."""
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    sink = PrometheusMetricsSink(registry=registry)
+    # A second application does not register the metrics again
+    other = PrometheusMetricsSink(registry=registry)
+    assert other.histogram is sink.histogram
+
+    other.request("idp", "acs", "success", 0.05)
+    labels = {"idp": "idp", "endpoint": "acs", "outcome": "success"}
+    assert registry.get_sample_value(REQUESTS, labels) == 1
@@ -0,0 +1,143 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""Response offloading tests."""
+
+import base64
+
+import importlib_resources as resources
+import pytest
+from flask import url_for
+
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_response
+
+DATA = resources.files(__name__) / "data"
+
+
+@pytest.fixture
+def pool(appctx, signed_idp):
+    """Process the responses in a worker process."""
+    state = appctx.extensions["invenio-sso-saml"]
+    appctx.config["SSO_SAML_OFFLOAD_WORKERS"] = 1
+    appctx.config["SSO_SAML_SERVER_TIMING"] = True
+    state.__dict__.pop("response_pool", None)
+    with appctx.test_request_context():
+        pool = state.response_pool
+    pool.start([signed_idp])
+    yield pool
+    pool.shutdown()
+    appctx.config["SSO_SAML_OFFLOAD_WORKERS"] = 0
+    appctx.config["SSO_SAML_SERVER_TIMING"] = False
+    state.__dict__.pop("response_pool", None)
+
+
+def _post(client, settings, key=None, **kwargs):
+    response = build_response(
+        settings,
+        key or (DATA / "idp.key").read_text(),
+        (DATA / "idp.crt").read_text(),
+        "federico@example.com",
+        {"email": ["federico@example.com"]},
+        encrypt=True,
+        **kwargs,
+    )
+    return client.post(
+        url_for("sso_saml.acs", idp="idp-signed"),
+        data={"SAMLResponse": base64.b64encode(response), "RelayState": "/next"},
+    )
+
+
+def test_offload(appctx, base_client, signed_idp, pool):
+    """Test the responses are processed by the workers."""
+    res = _post(base_client, signed_idp)
+    assert res.status_code == 302
+    assert res.location == "/next"
+    metrics = [m.split(";")[0] for m in res.headers["Server-Timing"].split(", ")]
+    for name in ["offload", "decode", "decrypt", "verify", "process"]:
+        assert "saml_" + name in metrics
+
+    # Signed with another key
+    res = _post(base_client, signed_idp, key=(DATA / "sp.key").read_text())
+    assert res.status_code == 401
+    assert "invalid_response" in res.json
+
+    res = base_client.post(
+        url_for("sso_saml.acs", idp="idp-signed"),
+        data={"SAMLResponse": base64.b64encode(b"<not a response")},
+    )
+    assert res.status_code == 400
+
+
+def test_offload_starting(appctx, base_client, signed_idp, pool):
+    """Test the responses are processed inline until the workers are started."""
+
+    def offloaded(res):
+        assert res.status_code == 302
+        return "saml_offload" in res.headers["Server-Timing"]
+
+    assert offloaded(_post(base_client, signed_idp))
+
+    def rebuild():
+        current_sso_saml.invalidate("idp-signed")
+        with appctx.test_request_context():
+            return current_sso_saml.get_runtime("idp-signed").settings
+
+    # Same settings, known by their fingerprint
+    assert offloaded(_post(base_client, rebuild()))
+
+    pool.shutdown()
+    assert not offloaded(_post(base_client, signed_idp))
+    pool.start()
+    assert offloaded(_post(base_client, signed_idp))
+
+
+def test_offload_settings_sent(appctx, base_client, pool):
+    """Test new settings are sent to the workers with the responses."""
+    executor = pool._executor
+    security = appctx.config["SSO_SAML_IDPS"]["idp-signed"]["settings"]["security"]
+
+    def post(**changes):
+        security.update(changes)
+        current_sso_saml.invalidate("idp-signed")
+        with appctx.test_request_context():
+            settings = current_sso_saml.get_runtime("idp-signed").settings
+        token = pool._token(settings)[0]
+        assert token not in pool._sent
+        return token, settings
+
+    try:
+        token, settings = post(requestedAuthnContext=False)
+        res = _post(base_client, settings)
+        assert "saml_offload" in res.headers["Server-Timing"]
+        assert pool._sent[token] == 1
+
+        # Not sent with the response, the worker asks for them
+        token, settings = post(rejectDeprecatedAlgorithm=True)
+        pool._sent[token] = pool.workers
+        res = _post(base_client, settings)
+        assert res.status_code == 302
+        assert "saml_offload" in res.headers["Server-Timing"]
+        assert pool._sent[token] == pool.workers + 1
+
+        # The workers are not started again
+        assert pool._executor is executor
+    finally:
+        security.pop("requestedAuthnContext", None)
+        security.pop("rejectDeprecatedAlgorithm", None)
+        current_sso_saml.invalidate("idp-signed")
+
+
+def test_offload_unavailable(appctx, base_client, signed_idp, pool):
+    """Test the responses are rejected when the workers are busy."""
+    acquired = 0
+    while pool._slots.acquire(blocking=False):
+        acquired += 1
+    assert acquired == 1 + appctx.config["SSO_SAML_OFFLOAD_QUEUE_SIZE"]
+    try:
+        assert _post(base_client, signed_idp).status_code == 503
+    finally:
+        for _ in range(acquired):
+            pool._slots.release()
+
+    pool.timeout = 0
+    assert _post(base_client, signed_idp).status_code == 503
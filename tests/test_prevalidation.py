@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""SAML message pre-validation tests."""
+
+import base64
+import zlib
+
+import pytest
+from flask import url_for
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+from invenio_saml.errors import MessageRejected
+from invenio_saml.metrics import REQUESTS
+from invenio_saml.prevalidation import MessageLimits, check_message
+
+XML = (
+    b'<?xml version="1.0"?>\n<!-- comment -->\n'
+    b'<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">'
+    + b"<a/>" * 100
+    + b"</samlp:Response>"
+)
+
+LIMITS = MessageLimits(1024, 1024, 10)
+
+
+@pytest.fixture(scope="module")
+def app_config(app_config):
+    """Expose the in-process metrics."""
+    app_config["SSO_SAML_METRICS_SINK_FACTORY"] = (
+        "invenio_saml.metrics.in_process_metrics_factory"
+    )
+    app_config["SSO_SAML_METRICS_ROUTE"] = "/metrics"
+    return app_config
+
+
+def _reason(message, root="Response", deflated=False, limits=LIMITS):
+    try:
+        check_message(message, root, deflated, limits)
+    except MessageRejected as e:
+        return e.reason
+
+
+def test_check_message():
+    """Test the messages are rejected by reason."""
+    encoded = base64.b64encode(XML).decode()
+    assert _reason(encoded) is None
+    assert _reason(encoded[:60] + "\r\n" + encoded[60:]) is None
+    # Mostly whitespace
+    wrapped = "\r\n".join(encoded[i : i + 3] for i in range(0, len(encoded), 3))
+    limits = LIMITS._replace(max_message_size=None)
+    assert _reason(wrapped, limits=limits) is None
+    assert _reason(encoded, limits=LIMITS._replace(max_message_size=10)) == (
+        "message_too_large"
+    )
+    assert _reason(encoded[:-1] + "!") == "invalid_base64"
+    assert _reason(encoded[:-1]) == "invalid_base64"
+    assert _reason("=" + encoded[1:]) == "invalid_base64"
+    assert _reason(encoded, limits=LIMITS._replace(max_xml_size=100)) == (
+        "xml_too_large"
+    )
+    assert _reason(encoded, root="LogoutResponse") == "unexpected_root"
+    assert _reason(base64.b64encode(b"garbage").decode()) == "unexpected_root"
+    doctype = base64.b64encode(b"<!DOCTYPE a><Response/>").decode()
+    assert _reason(doctype) == "unexpected_root"
+
+
+def test_check_deflated_message():
+    """Test the deflated messages are inflated within the limits."""
+    deflated = OneLogin_Saml2_Utils.deflate_and_base64_encode(XML)
+    assert _reason(deflated, deflated=True) is None
+    limits = LIMITS._replace(max_xml_size=500)
+    assert _reason(deflated, deflated=True, limits=limits) == "xml_too_large"
+    limits = LIMITS._replace(max_inflate_ratio=2)
+    assert _reason(deflated, deflated=True, limits=limits) == "inflate_ratio_exceeded"
+    # OneLogin also accepts messages which are not deflated
+    assert _reason(base64.b64encode(XML[:400]).decode(), deflated=True) is None
+
+    compressor = zlib.compressobj(wbits=-15)
+    bomb = compressor.compress(b"<Response>" + b" " * 10**6) + compressor.flush()
+    bomb = base64.b64encode(bomb).decode()
+    limits = MessageLimits(None, None, 100)
+    assert _reason(bomb, deflated=True, limits=limits) == "inflate_ratio_exceeded"
+
+
+def _count(client, idp, endpoint, outcome):
+    text = client.get(url_for("sso_saml.metrics")).text
+    prefix = '{}{{idp="{}",endpoint="{}",outcome="{}"}} '.format(
+        REQUESTS, idp, endpoint, outcome
+    )
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return int(line[len(prefix) :])
+    return 0
+
+
+def test_prevalidation_views(appctx, base_client, signed_idp):
+    """Test the views reject the malformed messages and count them."""
+    acs_url = url_for("sso_saml.acs", idp="idp-signed")
+    sls_url = url_for("sso_saml.sls", idp="idp-signed")
+
+    count = _count(base_client, "idp-signed", "acs", "invalid_base64")
+    res = base_client.post(acs_url, data={"SAMLResponse": "not base64!"})
+    assert res.status_code == 400
+    assert res.json == ["invalid_base64"]
+    assert _count(base_client, "idp-signed", "acs", "invalid_base64") == count + 1
+
+    logout = OneLogin_Saml2_Utils.deflate_and_base64_encode(XML)
+    res = base_client.get(sls_url, query_string={"SAMLResponse": logout})
+    assert res.status_code == 400
+    assert res.json == ["unexpected_root"]
+
+    appctx.config["SSO_SAML_PREVALIDATION"] = False
+    try:
+        res = base_client.post(acs_url, data={"SAMLResponse": "not base64!"})
+    finally:
+        appctx.config["SSO_SAML_PREVALIDATION"] = True
+    assert res.status_code == 400
+    assert res.json is None
@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""Replay cache tests."""
+
+import time
+
+from invenio_saml.replay import MemoryReplayCache, RedisReplayCache
+
+
+class LocalRedis(object):
+    """Local stand-in for the subset of the Redis client used."""
+
+    def __init__(self):
+        """Initialize the store."""
+        self.data = {}
+
+    def set(self, name, value, nx=False, ex=None):
+        """Set a key, honoring ``nx`` and ``ex`` like Redis."""
+        now = time.time()
+        known = self.data.get(name)
+        if nx and known is not None and known[1] > now:
+            return None
+        self.data[name] = (value, now + ex)
+        return True
+
+
+def test_memory_replay_cache():
+    """Test the in-process replay cache."""
+    cache = MemoryReplayCache(max_size=3)
+    now = time.time()
+    assert cache.add("a", now + 60)
+    assert not cache.add("a", now + 60)
+
+    # Expired keys are accepted again and evicted
+    assert cache.add("b", now - 1)
+    assert cache.add("b", now + 60)
+    assert not cache.add("b", now + 60)
+
+    # The cache is bounded, the oldest keys are evicted first
+    for key in "cde":
+        assert cache.add(key, now + 60)
+    assert len(cache) == 3
+    assert cache.add("a", now + 60)
+    assert not cache.add("e", now + 60)
+
+
+def test_redis_replay_cache():
+    """Test the Redis replay cache."""
+    client = LocalRedis()
+    cache = RedisReplayCache(client)
+    now = time.time()
+    assert cache.add("a", now + 60)
+    assert not cache.add("a", now + 60)
+    assert 59 <= client.data["saml:replay:a"][1] - now <= 61
+
+    # Keys expire at least one second after being set
+    assert cache.add("b", now - 10)
+    assert not cache.add("b", now - 10)
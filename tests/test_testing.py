@@ -0,0 +1,167 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""Testing helpers tests."""
+
+import base64
+import subprocess
+import sys
+
+import importlib_resources as resources
+import pytest
+from flask import url_for
+from onelogin.saml2.idp_metadata_parser import OneLogin_Saml2_IdPMetadataParser
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+
+from invenio_saml.cli import saml
+from invenio_saml.testing import (
+    LoadDriver,
+    MockIdP,
+    WSGIClient,
+    build_logout_response,
+    build_response,
+)
+
+DATA = resources.files(__name__) / "data"
+
+
+@pytest.mark.parametrize("sign_response", [False, True])
+def test_build_response(appctx, base_client, signed_idp, sign_response):
+    """Test the built responses are accepted by the ACS."""
+    key, cert = (DATA / "idp.key").read_text(), (DATA / "idp.crt").read_text()
+    response = build_response(
+        signed_idp,
+        key,
+        cert,
+        "federico@example.com",
+        {"email": ["federico@example.com"]},
+        encrypt=True,
+        sign_response=sign_response,
+    )
+    acs_url = url_for("sso_saml.acs", idp="idp-signed")
+    res = base_client.post(
+        acs_url,
+        data={"SAMLResponse": base64.b64encode(response), "RelayState": "/next"},
+    )
+    assert res.status_code == 302
+    assert res.location == "/next"
+
+    # Assertions must be encrypted for this IdP
+    response = build_response(
+        signed_idp, key, cert, "federico@example.com", encrypt=False
+    )
+    res = base_client.post(acs_url, data={"SAMLResponse": base64.b64encode(response)})
+    assert res.status_code == 401
+
+
+def test_build_logout_response(appctx, base_client, signed_idp):
+    """Test the built logout responses are accepted by the SLS."""
+    res = base_client.get(
+        url_for("sso_saml.sls", idp="idp-signed"),
+        query_string={
+            "SAMLResponse": OneLogin_Saml2_Utils.deflate_and_base64_encode(
+                build_logout_response(signed_idp)
+            ),
+        },
+    )
+    assert res.status_code == 302
+    assert res.location == "/"
+
+
+@pytest.fixture
+def mock_idp(signed_idp):
+    """Mock identity provider trusted by ``idp-signed``."""
+    idp = MockIdP(
+        (DATA / "idp.key").read_text(),
+        (DATA / "idp.crt").read_text(),
+        entity_id="https://idp.example.org",
+    )
+    idp.add_service_provider(signed_idp)
+    return idp
+
+
+@pytest.mark.parametrize("idp_logout", [False, True])
+def test_load_driver(appctx, mock_idp, signed_idp, idp_logout):
+    """Test complete login and logout cycles against the views."""
+    driver = LoadDriver(
+        mock_idp,
+        url_for("sso_saml.sso", idp="idp-signed"),
+        url_for("sso_saml.slo", idp="idp-signed"),
+        signed_idp.get_sp_data()["entityId"],
+        lambda: WSGIClient(appctx),
+        idp_logout=idp_logout,
+    )
+    report = driver.run(4, concurrency=2)
+    assert report.cycles == 4
+    assert report.failed_cycles == 0
+    steps = ["sso", "acs", "sls"] if idp_logout else ["sso", "acs", "slo", "sls"]
+    assert list(report.summary()) == steps
+    assert all(stats["count"] == 4 for stats in report.summary().values())
+    assert "4 cycles, 0 failed" in report.format()
+
+
+def test_load_driver_errors(appctx, mock_idp, signed_idp):
+    """Test the failed steps are reported."""
+    mock_idp.sign_response = True
+    mock_idp.key = (DATA / "sp.key").read_text()
+    driver = LoadDriver(
+        mock_idp,
+        url_for("sso_saml.sso", idp="idp-signed"),
+        url_for("sso_saml.slo", idp="idp-signed"),
+        signed_idp.get_sp_data()["entityId"],
+        lambda: WSGIClient(appctx),
+    )
+    report = driver.run(2)
+    assert report.failed_cycles == 2
+    assert dict(report.errors["acs"]) == {"HTTP 401": 2}
+    assert "slo" not in report.summary()
+
+
+def test_mock_idp_app(appctx, base_client, mock_idp):
+    """Test the application of the mock IdP."""
+    client = mock_idp.create_app().test_client()
+
+    res = client.get("/metadata")
+    settings = OneLogin_Saml2_IdPMetadataParser.parse(res.data)
+    assert settings["idp"]["entityId"] == "https://idp.example.org"
+    assert settings["idp"]["singleSignOnService"]["url"] == "http://localhost/sso"
+
+    res = base_client.get(url_for("sso_saml.sso", idp="idp-signed", next="/next"))
+    res = client.get(res.location)
+    assert res.status_code == 200
+    assert 'name="SAMLResponse"' in res.text
+    assert 'name="RelayState" value="/next"' in res.text
+
+    assert client.get("/sso").status_code == 400
+    assert client.get("/slo").text == "Logged out"
+
+
+def test_load_test_command(appctx, signed_idp):
+    """Test the load test command."""
+    runner = appctx.test_cli_runner()
+    result = runner.invoke(
+        saml,
+        [
+            "load-test",
+            "idp-signed",
+            "--key",
+            str(DATA / "idp.key"),
+            "--cert",
+            str(DATA / "idp.crt"),
+            "--url",
+            "http://localhost",
+            "--in-process",
+            "--cycles",
+            "2",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "2 cycles, 0 failed" in result.output
+
+
+def test_cli_lazy_import():
+    """Test the testing helpers are not imported with the CLI."""
+    code = (
+        "import sys, invenio_saml.cli; "
+        "sys.exit('invenio_saml.testing' in sys.modules)"
+    )
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
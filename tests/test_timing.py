@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""Phase timing tests."""
+
+import base64
+import time
+
+import importlib_resources as resources
+import pytest
+from flask import g, url_for
+from mock import Mock
+
+from invenio_saml.handlers import acs_handler_factory
+from invenio_saml.metrics import MetricsSink
+from invenio_saml.testing import build_response
+from invenio_saml.timing import PhaseTimer, current_timer, phase, timed
+
+DATA = resources.files(__name__) / "data"
+
+
+class ListSink(MetricsSink):
+    """Sink keeping the observations in a list."""
+
+    def __init__(self):
+        """Initialize the list."""
+        self.observations = []
+
+    def observe(self, idp, endpoint, phase, seconds):
+        """Record the duration of a phase of a request."""
+        self.observations.append((idp, endpoint, phase, seconds))
+
+
+@pytest.fixture
+def timing(appctx):
+    """Enable the Server-Timing header and a metrics sink."""
+    sink = ListSink()
+    state = appctx.extensions["invenio-sso-saml"]
+    appctx.config["SSO_SAML_SERVER_TIMING"] = True
+    appctx.config["SSO_SAML_METRICS_SINK_FACTORY"] = lambda app: sink
+    state.__dict__.pop("metrics_sink", None)
+    yield sink
+    appctx.config["SSO_SAML_SERVER_TIMING"] = False
+    appctx.config["SSO_SAML_METRICS_SINK_FACTORY"] = None
+    state.__dict__.pop("metrics_sink", None)
+
+
+def test_phase(appctx):
+    """Test the phases exclude the nested ones and are added up."""
+
+    @timed("inner")
+    def inner():
+        time.sleep(0.01)
+
+    with appctx.test_request_context():
+        # Not timed unless enabled
+        with phase("outer"):
+            inner()
+        assert current_timer() is None
+
+        g._sso_saml_timer = timer = PhaseTimer()
+        with phase("outer"):
+            inner()
+            with phase("inner"):
+                pass
+        assert set(timer.phases) == {"outer", "inner"}
+        assert timer.phases["inner"] >= 0.01
+        assert timer.phases["outer"] < 0.01
+
+
+def test_acs_timing(appctx, base_client, signed_idp, timing):
+    """Test the phases of the ACS are reported."""
+    response = build_response(
+        signed_idp,
+        (DATA / "idp.key").read_text(),
+        (DATA / "idp.crt").read_text(),
+        "federico@example.com",
+        {"email": ["federico@example.com"]},
+        encrypt=True,
+    )
+    res = base_client.post(
+        url_for("sso_saml.acs", idp="idp-signed"),
+        data={"SAMLResponse": base64.b64encode(response)},
+    )
+    assert res.status_code == 302
+
+    metrics = [m.split(";")[0] for m in res.headers["Server-Timing"].split(", ")]
+    for name in ["auth", "decode", "decrypt", "verify", "process", "replay"]:
+        assert "saml_" + name in metrics
+    assert metrics[-1] == "saml"
+
+    observed = {
+        phase: (idp, endpoint) for idp, endpoint, phase, _ in timing.observations
+    }
+    assert observed["decrypt"] == ("idp-signed", "acs")
+    assert observed["total"] == ("idp-signed", "acs")
+    assert observed["handler"] == ("idp-signed", "acs")
+
+
+def test_unknown_idp_timing(appctx, base_client, timing):
+    """Test unknown IdPs are not used as labels."""
+    res = base_client.get(url_for("sso_saml.sso", idp="wrong-idp"))
+    assert res.status_code == 404
+    assert {idp for idp, _, _, _ in timing.observations} == {"unknown"}
+
+
+def test_timing_disabled(appctx, base_client):
+    """Test no header is added by default."""
+    res = base_client.get(url_for("sso_saml.sso", idp="test-idp"))
+    assert res.status_code == 302
+    assert "Server-Timing" not in res.headers
+
+
+def test_acs_handler_timing(appctx, db):
+    """Test the phases of the default ACS handler."""
+    appctx.config["SSO_SAML_IDPS"]["timing-idp"] = {
+        "mappings": {
+            "email": "email",
+            "name": "name",
+            "surname": "surname",
+            "external_id": "external_id",
+        },
+        "auto_confirm": True,
+    }
+    auth = Mock()
+    auth.get_attributes.return_value = dict(
+        email=["timing@example.com"],
+        name=["federico"],
+        surname=["Fernandez"],
+        external_id=["timing"],
+    )
+    try:
+        with appctx.test_request_context():
+            g._sso_saml_timer = timer = PhaseTimer()
+            acs_handler_factory("timing-idp")(auth, "/foo")
+    finally:
+        del appctx.config["SSO_SAML_IDPS"]["timing-idp"]
+    assert {
+        "account_info",
+        "lookup",
+        "register",
+        "login",
+        "setup",
+        "link",
+        "commit",
+    } <= set(timer.phases)
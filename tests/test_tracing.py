@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""SAML message tracing tests."""
+
+import logging
+
+import pytest
+from flask import g, request, url_for
+from mock import Mock
+
+from invenio_saml import tracing as tracing_module
+from invenio_saml.tracing import (
+    REDACTED,
+    TracedPayload,
+    TraceQueueHandler,
+    create_trace_logger,
+    redact,
+    trace,
+)
+
+XML = (
+    "<samlp:Response><ds:SignatureValue>c2ln</ds:SignatureValue>"
+    '<saml:Attribute Name="mail">'
+    '<saml:AttributeValue xsi:type="xs:string">a@example.com</saml:AttributeValue>'
+    "<saml:AttributeValue>\nb@example.com\n</saml:AttributeValue>"
+    "</saml:Attribute></samlp:Response>"
+)
+
+
+@pytest.fixture
+def tracing(appctx):
+    """Enable the debug level of the trace logger."""
+    state = appctx.extensions["invenio-sso-saml"]
+    state.__dict__.pop("trace_logger", None)
+    logger = state.trace_logger
+    logger.setLevel(logging.DEBUG)
+    yield logger
+    logger.setLevel(logging.NOTSET)
+    appctx.config["SSO_SAML_TRACE_SAMPLE_RATE"] = 1
+    appctx.config["SSO_SAML_TRACE_IDPS"] = None
+    appctx.config["SSO_SAML_TRACE_QUEUE_SIZE"] = 0
+    state.__dict__.pop("trace_logger", None)
+    create_trace_logger(appctx)
+
+
+def test_redact():
+    """Test the values of the messages and attributes are redacted."""
+    assert redact(XML) == (
+        "<samlp:Response><ds:SignatureValue>{0}</ds:SignatureValue>"
+        '<saml:Attribute Name="mail">'
+        '<saml:AttributeValue xsi:type="xs:string">{0}</saml:AttributeValue>'
+        "<saml:AttributeValue>{0}</saml:AttributeValue>"
+        "</saml:Attribute></samlp:Response>"
+    ).format(REDACTED)
+    assert redact({"user": {"email": "a@example.com"}, "id": ["1"]}) == {
+        "user": {"email": REDACTED},
+        "id": REDACTED,
+    }
+
+
+def test_traced_payload():
+    """Test the payloads are truncated."""
+    assert str(TracedPayload(b"<a>x</a>", redact=False)) == "<a>x</a>"
+    assert str(TracedPayload(XML, max_size=10, redact=False)) == (
+        "<samlp:Res... [{} characters truncated]".format(len(XML) - 10)
+    )
+    assert str(TracedPayload({"mail": ["a@example.com"]})) == str({"mail": REDACTED})
+
+
+def test_trace_sampling(appctx, tracing, caplog):
+    """Test the messages are only built for the sampled requests."""
+    caplog.set_level(logging.DEBUG, logger=tracing.name)
+    payload = Mock(return_value=XML)
+
+    tracing.setLevel(logging.INFO)
+    with appctx.test_request_context():
+        trace("Response", "test-idp", payload)
+    payload.assert_not_called()
+
+    tracing.setLevel(logging.DEBUG)
+    appctx.config["SSO_SAML_TRACE_IDPS"] = ["other-idp"]
+    with appctx.test_request_context():
+        trace("Response", "test-idp", payload)
+    payload.assert_not_called()
+
+    appctx.config["SSO_SAML_TRACE_IDPS"] = None
+    appctx.config["SSO_SAML_TRACE_SAMPLE_RATE"] = 3
+    for _ in range(6):
+        with appctx.test_request_context():
+            # Sampled per request
+            trace("Response", "test-idp", payload)
+            trace("Response", "test-idp", payload)
+            assert g.get(tracing_module._SAMPLED)[0] is request._get_current_object()
+    assert payload.call_count == 4
+    assert len(caplog.records) == 4
+    assert (
+        caplog.records[0]
+        .getMessage()
+        .startswith("SAML Response for test-idp:\n<samlp:Response>")
+    )
+    assert "a@example.com" not in caplog.text
+
+
+def test_trace_views(appctx, base_client, tracing, caplog):
+    """Test the requests sent to the IdPs are traced."""
+    caplog.set_level(logging.DEBUG, logger=tracing.name)
+    res = base_client.get(url_for("sso_saml.sso", idp="test-idp"))
+    assert res.status_code == 302
+    messages = [r.getMessage() for r in caplog.records if r.name == tracing.name]
+    assert len(messages) == 1
+    assert messages[0].startswith("SAML AuthnRequest for test-idp:\n<samlp:")
+
+
+def test_trace_queue(appctx, tracing, caplog):
+    """Test the traces are handled by a background thread."""
+    caplog.set_level(logging.DEBUG, logger=tracing.name)
+    appctx.config["SSO_SAML_TRACE_QUEUE_SIZE"] = 1
+    state = appctx.extensions["invenio-sso-saml"]
+    state.__dict__.pop("trace_logger", None)
+    logger = state.trace_logger
+    assert logger is tracing
+    (handler,) = [h for h in logger.handlers if isinstance(h, TraceQueueHandler)]
+
+    with appctx.test_request_context():
+        trace("Response", "test-idp", XML)
+    handler.close()
+    assert [r.getMessage() for r in caplog.records] == [
+        "SAML Response for test-idp:\n{}".format(redact(XML))
+    ]
+
+    # Dropped instead of blocking
+    handler.listener = None
+    for _ in range(3):
+        with appctx.test_request_context():
+            trace("Response", "test-idp", XML)
+    assert handler.dropped == 2
@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+
+"""User ID cache tests."""
+
+from invenio_accounts.models import User
+from invenio_accounts.proxies import current_datastore
+from invenio_oauthclient.models import UserIdentity
+from mock import patch
+
+from invenio_saml.invenio_accounts.utils import account_get_user
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.user_cache import MemoryUserCache, register_invalidation
+
+
+def test_memory_user_cache():
+    """Test the in-process user ID cache."""
+    cache = MemoryUserCache(max_size=3, ttl=60)
+    cache.set("idp", "a", 1)
+    cache.set("idp", "b", 1)
+    cache.set("idp", "c", 2)
+    assert cache.get("idp", "a") == 1
+    assert cache.get("other", "a") is None
+
+    cache.invalidate("idp", "a")
+    assert cache.get("idp", "a") is None
+    cache.invalidate_user(1)
+    assert cache.get("idp", "b") is None
+    assert cache.get("idp", "c") == 2
+
+    # The cache is bounded, the oldest identities are evicted first
+    for external_id in "defg":
+        cache.set("idp", external_id, 3)
+    assert len(cache) == 3
+    assert cache.get("idp", "d") is None
+    assert cache.get("idp", "g") == 3
+
+    cache.clear()
+    assert len(cache) == 0
+
+    # Expired identities are forgotten
+    cache = MemoryUserCache(ttl=-1)
+    cache.set("idp", "a", 1)
+    assert cache.get("idp", "a") is None
+
+
+def test_account_get_user_cache(appctx, db):
+    """Test the lookup of returning users through the cache."""
+    user = current_datastore.create_user(email="cached@example.com", active=True)
+    db.session.flush()
+    UserIdentity.create(user, "cache-idp", "cached-id")
+    db.session.commit()
+    user_id = user.id
+
+    def lookup():
+        return account_get_user(
+            dict(
+                user=dict(email="other@example.com"),
+                external_id="cached-id",
+                external_method="cache-idp",
+            )
+        )
+
+    cache = MemoryUserCache()
+    register_invalidation()
+    with patch.object(current_sso_saml._get_current_object(), "user_cache", cache):
+        assert lookup().id == user_id
+        assert cache.get("cache-idp", "cached-id") == user_id
+
+        # Returning users are fetched by primary key
+        db.session.expunge_all()
+        with patch("invenio_saml.invenio_accounts.utils.db.session.query") as query:
+            assert lookup().id == user_id
+            assert not query.called
+
+        # Deactivated users are forgotten
+        current_datastore.deactivate_user(User.query.get(user_id))
+        assert cache.get("cache-idp", "cached-id") is None
+        assert lookup().id == user_id
+
+        # Unlinked identities are forgotten
+        UserIdentity.delete_by_external_id("cache-idp", "cached-id")
+        assert cache.get("cache-idp", "cached-id") is None
+        assert lookup() is None
@@ -3,10 +3,15 @@
 
 """Test utils."""
 
+import base64
+
 import pytest
 from flask import request
+from mock import patch
+from onelogin.saml2.errors import OneLogin_Saml2_ValidationError
 from werkzeug.datastructures import MultiDict
 
+from invenio_saml.proxies import current_sso_saml
 from invenio_saml.utils import prepare_flask_request
 
 
@@ -42,3 +47,63 @@ def test_prepare_flask_request(base_app, test_request_ctx, expected):
     with base_app.test_request_context(**test_request_ctx):
         res = prepare_flask_request(request)
         assert res == expected
+
+
+@pytest.mark.freeze_time("2019-04-19T13:35:47Z")
+def test_attribute_projection(appctx, sso_response):
+    """Test that only the mapped attributes are read from responses."""
+    idp_config = appctx.config["SSO_SAML_IDPS"]["test-idp"]
+    mappings = {"email": "User.email", "external_id": "PersonImmutableID"}
+
+    def process(**config):
+        with (
+            patch.dict(idp_config, config),
+            appctx.test_request_context(
+                method="POST", data={"SAMLResponse": sso_response}
+            ),
+            patch("onelogin.saml2.auth.OneLogin_Saml2_Response.is_valid") as is_valid,
+        ):
+            current_sso_saml.invalidate("test-idp")
+            is_valid.return_value = True
+            auth = current_sso_saml.get_auth("test-idp")
+            auth.process_response()
+            return auth
+
+    auth = process(mappings=mappings)
+    assert auth.projection is None
+    all_attributes = auth.get_attributes()
+    assert len(all_attributes) > 2
+
+    auth = process(mappings=mappings, attribute_projection=True)
+    assert auth.projection == {"User.email", "PersonImmutableID"}
+    assert auth.get_attributes() == {
+        name: all_attributes[name] for name in auth.projection
+    }
+    current_sso_saml.invalidate("test-idp")
+
+
+def test_attribute_projection_duplicates(appctx, sso_response):
+    """Test that the names of all the attributes are checked for duplicates."""
+    idp_config = appctx.config["SSO_SAML_IDPS"]["test-idp"]
+    mappings = {"email": "User.email", "external_id": "PersonImmutableID"}
+    # Not mapped, so not projected
+    response = base64.b64encode(
+        base64.b64decode(sso_response).replace(b'Name="role"', b'Name="office"')
+    )
+
+    for projection in (False, True):
+        with (
+            patch.dict(idp_config, mappings=mappings, attribute_projection=projection),
+            appctx.test_request_context(method="POST", data={"SAMLResponse": response}),
+            patch("onelogin.saml2.auth.OneLogin_Saml2_Response.is_valid") as is_valid,
+        ):
+            current_sso_saml.invalidate("test-idp")
+            is_valid.return_value = True
+            auth = current_sso_saml.get_auth("test-idp")
+            with pytest.raises(OneLogin_Saml2_ValidationError) as e:
+                auth.process_response()
+            assert (
+                e.value.code
+                == OneLogin_Saml2_ValidationError.DUPLICATED_ATTRIBUTE_NAME_FOUND
+            )
+    current_sso_saml.invalidate("test-idp")
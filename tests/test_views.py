@@ -2,11 +2,23 @@
 # SPDX-License-Identifier: MIT
 """Views tests."""
 
+import base64
+import hashlib
+import os
+
+import importlib_resources as resources
 import pytest
 from flask import url_for
 from flask_security import url_for_security
 from mock import patch
 
+from invenio_saml.authn_requests import OutstandingRequest
+from invenio_saml.errors import AttributeMappingError
+from invenio_saml.proxies import current_sso_saml
+from invenio_saml.testing import build_response
+
+DATA = resources.files(__name__) / "data"
+
 
 def test_wrong_idp(appctx, base_client):
     """Test wrong Identity Provider name."""
@@ -67,6 +79,126 @@ def test_acs(appctx, base_client, sso_response):
         res = client.post(acs_url, data=dict(SAMLResponse=sso_response))
         assert res.status_code == 302
 
+        # Replayed assertions are rejected
+        res = client.post(acs_url, data=dict(SAMLResponse=sso_response))
+        assert res.status_code == 401
+        assert res.json == ["replayed_assertion"]
+
+
+@pytest.mark.freeze_time("2019-04-19T13:35:47Z")
+def test_acs_outstanding_request(appctx, base_client, sso_response):
+    """Test the matching of responses with the outstanding requests."""
+    client = base_client
+    state = current_sso_saml._get_current_object()
+    store = state.request_store
+    request_id = "ONELOGIN_bde61ee819a881f8ceb8b75a06b80db076c59604"
+    acs_url = url_for("sso_saml.acs", idp="test-idp")
+
+    with patch("invenio_saml.utils.SAMLAuth.get_last_request_id") as mock_id:
+        mock_id.return_value = request_id
+        res = client.get(url_for("sso_saml.sso", idp="test-idp", next="/next_url"))
+        assert res.status_code == 302
+    with client.session_transaction() as sess:
+        assert sess[appctx.config["SSO_SAML_SESSION_KEY_REQUESTS"]] == [request_id]
+
+    with (
+        patch("onelogin.saml2.auth.OneLogin_Saml2_Response.is_valid") as mock_is_valid,
+        patch.object(state, "is_replayed", return_value=False),
+        patch.dict(appctx.config, SSO_SAML_SOLICITED_ONLY=True),
+    ):
+        mock_is_valid.return_value = True
+        # The RelayState of the request is used when none is posted
+        res = client.post(acs_url, data=dict(SAMLResponse=sso_response))
+        assert res.status_code == 302
+        assert res.location.endswith("/next_url")
+        assert store.pop(request_id) is None
+        with client.session_transaction() as sess:
+            assert sess[appctx.config["SSO_SAML_SESSION_KEY_REQUESTS"]] == []
+
+        # The request was answered, the same response is now unsolicited
+        res = client.post(acs_url, data=dict(SAMLResponse=sso_response))
+        assert res.status_code == 401
+        assert res.json == ["unsolicited_response"]
+
+
+def test_acs_other_session_request(appctx, base_client, signed_idp):
+    """Test the responses to the requests of another session are rejected."""
+    client = base_client
+    state = current_sso_saml._get_current_object()
+    key = appctx.config["SSO_SAML_SESSION_KEY_REQUESTS"]
+    acs_url = url_for("sso_saml.acs", idp="idp-signed")
+    idp_key, idp_cert = (DATA / "idp.key").read_text(), (DATA / "idp.crt").read_text()
+
+    res = client.get(url_for("sso_saml.sso", idp="idp-signed"))
+    assert res.status_code == 302
+    with client.session_transaction() as sess:
+        (own_id,) = sess[key]
+    # Sent by another session
+    other_id = "ONELOGIN_other"
+    state.request_store.add(OutstandingRequest(other_id, "idp-signed"), 60)
+
+    def post(request_id):
+        response = build_response(
+            signed_idp,
+            idp_key,
+            idp_cert,
+            "federico@example.com",
+            {"email": ["federico@example.com"]},
+            in_response_to=request_id,
+            encrypt=True,
+        )
+        return client.post(acs_url, data={"SAMLResponse": base64.b64encode(response)})
+
+    with patch.dict(appctx.config, SSO_SAML_SOLICITED_ONLY=True):
+        res = post(other_id)
+        assert res.status_code == 401
+        assert "does not match the ID of the AuthNRequest" in res.json[-1]
+        assert state.request_store.pop(other_id) is not None
+
+        assert post(own_id).status_code == 302
+
+        # Without outstanding requests in the session
+        state.request_store.add(OutstandingRequest(other_id, "idp-signed"), 60)
+        res = post(other_id)
+        assert res.status_code == 401
+        assert res.json == ["unsolicited_response"]
+        assert state.request_store.pop(other_id) is not None
+
+
+@pytest.mark.freeze_time("2019-04-19T13:35:47Z")
+def test_acs_attribute_errors(appctx, base_client, sso_response):
+    """Test that missing attributes are reported instead of failing."""
+    errors = [{"field": "email", "attribute": "mail", "error": "missing"}]
+    with (
+        patch("onelogin.saml2.auth.OneLogin_Saml2_Response.is_valid") as mock_is_valid,
+        patch.object(
+            current_sso_saml._get_current_object(), "is_replayed", return_value=False
+        ),
+        patch("invenio_saml.utils.SAMLAuth.acs_handler") as mock_acs_handler,
+    ):
+        mock_is_valid.return_value = True
+        mock_acs_handler.side_effect = AttributeMappingError(errors)
+        res = base_client.post(
+            url_for("sso_saml.acs", idp="test-idp"),
+            data=dict(SAMLResponse=sso_response),
+        )
+        assert res.status_code == 401
+        assert res.json == errors
+
+
+def test_login_session_bound(appctx, base_client):
+    """Test the bound on the outstanding requests of a session."""
+    client = base_client
+    store = current_sso_saml.request_store
+    key = appctx.config["SSO_SAML_SESSION_KEY_REQUESTS"]
+    with patch.dict(appctx.config, SSO_SAML_REQUEST_STORE_SESSION_SIZE=2):
+        for _ in range(3):
+            client.get(url_for("sso_saml.sso", idp="test-idp"))
+    with client.session_transaction() as sess:
+        request_ids = sess[key]
+    assert len(request_ids) == 2
+    assert all(store.pop(request_id) for request_id in request_ids)
+
 
 def test_logout(appctx, base_client):
     """Test SLO requests."""
@@ -116,7 +248,26 @@ def test_metadata(appctx, base_client, metadata_response):
     res = client.get(metadata_url)
     assert res.status_code == 200
     assert res.data == metadata_response
+    assert res.headers["ETag"]
+    assert res.headers["Last-Modified"]
+    assert res.headers["Cache-Control"] == "public, max-age=3600"
 
+    # Conditional requests are answered from the cache
+    with patch(
+        "onelogin.saml2.settings.OneLogin_Saml2_Settings.get_sp_metadata"
+    ) as mock_get_sp_metadata:
+        cached = client.get(
+            metadata_url, headers={"If-None-Match": res.headers["ETag"]}
+        )
+        assert cached.status_code == 304
+        assert not cached.data
+        cached = client.get(metadata_url)
+        assert cached.status_code == 200
+        assert cached.data == metadata_response
+        assert cached.headers["ETag"] == res.headers["ETag"]
+        assert not mock_get_sp_metadata.called
+
+    current_sso_saml.invalidate("test-idp")
     with (
         patch(
             "onelogin.saml2.settings.OneLogin_Saml2_Settings.validate_metadata"
@@ -130,6 +281,79 @@ def test_metadata(appctx, base_client, metadata_response):
         assert res.json == ["bad error", "worst error", "Test reason"]
 
 
+def test_metadata_not_found(appctx, base_client):
+    """Test metadata request for a wrong Identity Provider."""
+    res = base_client.get(url_for("sso_saml.metadata", idp="wrong-idp"))
+    assert res.status_code == 404
+
+
+def test_metadata_cache_invalidation(appctx, tmp_path):
+    """Test the cached metadata is dropped when the SP certificate changes."""
+    cert_file = tmp_path / "cert.crt"
+    cert_file.write_text("crt\n")
+    appctx.config["SSO_SAML_IDPS"]["idp-tmp"] = dict(
+        appctx.config["SSO_SAML_IDPS"]["idp-file"], sp_cert_file=str(cert_file)
+    )
+    try:
+        with appctx.test_request_context():
+            runtime = current_sso_saml.get_runtime("idp-tmp")
+            current_sso_saml.cache_sp_metadata("idp-tmp", "<xml/>")
+            assert current_sso_saml.get_cached_sp_metadata("idp-tmp").xml == "<xml/>"
+
+            cert_file.write_text("new-crt\n")
+            os.utime(cert_file, ns=(0, 0))
+            assert runtime.is_stale()
+            assert current_sso_saml.get_cached_sp_metadata("idp-tmp") is None
+            assert current_sso_saml.get_runtime("idp-tmp") is not runtime
+    finally:
+        del appctx.config["SSO_SAML_IDPS"]["idp-tmp"]
+        current_sso_saml.invalidate("idp-tmp")
+
+
+def test_metadata_sp_certificate(appctx, base_client, signed_idp):
+    """Test the metadata of an SP with a certificate, rendered as bytes."""
+    metadata_url = url_for("sso_saml.metadata", idp="idp-signed")
+    res = base_client.get(metadata_url)
+    assert res.status_code == 200
+    assert b"<ds:X509Certificate>" in res.data
+    assert res.headers["ETag"] == '"{}"'.format(hashlib.sha256(res.data).hexdigest())
+
+    cached = base_client.get(
+        metadata_url, headers={"If-None-Match": res.headers["ETag"]}
+    )
+    assert cached.status_code == 304
+
+
+def test_stale_runtime_rebuilt(appctx, base_client, tmp_path):
+    """Test the login path rebuilds the runtime once its files changed."""
+    cert_file = tmp_path / "cert.crt"
+    cert_file.write_text("crt\n")
+    appctx.config["SSO_SAML_IDPS"]["idp-tmp"] = dict(
+        appctx.config["SSO_SAML_IDPS"]["idp-file"], sp_cert_file=str(cert_file)
+    )
+    try:
+        with appctx.test_request_context():
+            runtime = current_sso_saml.get_runtime("idp-tmp")
+        cert_file.write_text("new-crt\n")
+        os.utime(cert_file, ns=(0, 0))
+
+        # Only checked once per interval
+        base_client.get(url_for("sso_saml.sso", idp="idp-tmp"))
+        with appctx.test_request_context():
+            assert current_sso_saml.get_runtime("idp-tmp") is runtime
+
+        appctx.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"] = 0
+        base_client.get(url_for("sso_saml.sso", idp="idp-tmp"))
+        with appctx.test_request_context():
+            rebuilt = current_sso_saml.get_runtime("idp-tmp")
+        assert rebuilt is not runtime
+        assert rebuilt.config["settings"]["sp"]["x509cert"] == "new-crt\n"
+    finally:
+        appctx.config["SSO_SAML_RUNTIME_CHECK_INTERVAL"] = 5
+        del appctx.config["SSO_SAML_IDPS"]["idp-tmp"]
+        current_sso_saml.invalidate("idp-tmp")
+
+
 def test_login_template(appctx, base_client):
     """Test the SAML login template at least loads."""
     client = base_client
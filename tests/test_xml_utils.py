@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: 2026 Graz University of Technology.
+# SPDX-License-Identifier: MIT
+"""XML parsing and schema cache tests."""
+
+import base64
+import threading
+
+import importlib_resources as resources
+import pytest
+from flask import url_for
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
+from onelogin.saml2.xmlparser import DTDForbidden
+
+from invenio_saml.errors import XMLTooLarge
+from invenio_saml.testing import build_logout_response, build_response
+from invenio_saml.xml_utils import (
+    fromstring,
+    get_schema,
+    is_xml_cache_installed,
+    max_xml_size,
+    validate_xml,
+)
+
+DATA = resources.files(__name__) / "data"
+
+SCHEMA = "saml-schema-protocol-2.0.xsd"
+
+
+@pytest.fixture(scope="module")
+def app_config(app_config):
+    """Install the XML cache."""
+    app_config["SSO_SAML_XML_CACHE"] = True
+    return app_config
+
+
+def test_schema_cache():
+    """Test the schemas are compiled once per thread."""
+    schema = get_schema(SCHEMA)
+    assert get_schema(SCHEMA) is schema
+
+    schemas = []
+    thread = threading.Thread(target=lambda: schemas.append(get_schema(SCHEMA)))
+    thread.start()
+    thread.join()
+    assert schemas[0] is not schema
+
+
+def test_fromstring():
+    """Test the parser is hardened and limited in size."""
+    with pytest.raises(DTDForbidden):
+        fromstring(b'<!DOCTYPE a [<!ENTITY e "x">]><a>&e;</a>')
+
+    assert fromstring(b"<a><!-- comment --></a>").getchildren() == []
+    with max_xml_size(10):
+        with pytest.raises(XMLTooLarge):
+            fromstring(b"<a>0123456789</a>")
+        assert fromstring(b"<a/>").tag == "a"
+        # Sizes are in bytes, not characters
+        with pytest.raises(XMLTooLarge) as exc:
+            fromstring("<a>\u00e9\u00e9</a>")
+        assert exc.value.size == 11
+        assert fromstring("<a>\u00e9</a>").text == "\u00e9"
+    assert fromstring(b"<a>0123456789</a>").text == "0123456789"
+
+
+def test_validate_xml(appctx, signed_idp):
+    """Test the messages are validated against the cached schemas."""
+    assert is_xml_cache_installed()
+    assert OneLogin_Saml2_XML.validate_xml is validate_xml
+
+    xml = build_logout_response(signed_idp)
+    assert validate_xml(xml, SCHEMA).tag.endswith("LogoutResponse")
+    assert validate_xml(xml.replace('Version="2.0"', ""), SCHEMA) == "invalid_xml"
+    assert validate_xml("<a", SCHEMA) == "unloaded_xml"
+
+
+def test_max_xml_size(appctx, base_client, signed_idp):
+    """Test the ACS rejects the responses exceeding the maximum size."""
+    response = build_response(
+        signed_idp,
+        (DATA / "idp.key").read_text(),
+        (DATA / "idp.crt").read_text(),
+        "federico@example.com",
+        {"email": ["federico@example.com"]},
+    )
+    # Otherwise rejected before being decoded
+    appctx.config["SSO_SAML_PREVALIDATION"] = False
+    appctx.config["SSO_SAML_MAX_XML_SIZE"] = len(response) - 1
+    try:
+        res = base_client.post(
+            url_for("sso_saml.acs", idp="idp-signed"),
+            data={"SAMLResponse": base64.b64encode(response)},
+        )
+    finally:
+        appctx.config["SSO_SAML_PREVALIDATION"] = True
+        appctx.config["SSO_SAML_MAX_XML_SIZE"] = 512 * 1024
+    assert res.status_code == 400
+    assert res.json is None